@@ -13,6 +13,7 @@ if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
 from app.models.inventory import Base
+import app.models.ledger  # noqa: F401 — register ledger tables on Base.metadata
 target_metadata = Base.metadata
 
 
@@ -0,0 +1,37 @@
+"""indexes for admin stock listing filters
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18
+
+Keyset pagination walks the primary key, so it needs no extra index. The two
+filters on GET /admin/stock do:
+  - low-stock threshold filters on ``quantity - reserved`` (expression index)
+  - updated-since filters on ``updated_at``
+Both are range filters, so the index finds the matching rows but returns them in
+``available`` / ``updated_at`` order, not cursor order: Postgres still sorts them by
+book_id (a top-N sort under the page LIMIT). The indexes pay off when the filter is
+selective — few low-stock books, a recent ``updated_since`` — and the planner falls back
+to walking the primary key when it is not. Neither index carries a trailing book_id: it
+would only give cursor order under an equality on the leading column, which these filters
+never use.
+"""
+from alembic import op
+
+revision = "003"
+down_revision = "002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_inventory_available "
+        "ON inventory ((quantity - reserved))"
+    )
+    op.create_index("ix_inventory_updated_at", "inventory", ["updated_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inventory_updated_at", table_name="inventory")
+    op.execute("DROP INDEX IF EXISTS ix_inventory_available")
@@ -0,0 +1,103 @@
+"""stock movement ledger and snapshots
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18
+
+stock_movement is append-only and range-partitioned by month on occurred_at. Every
+inventory mutation writes one row per book in the same transaction. A DEFAULT
+partition catches rows if the snapshot job ever falls behind creating next month's
+partition.
+
+stock_snapshot holds sparse per-book snapshots: each snapshot run only writes books
+that moved since the previous run. The initial run below captures every book, so any
+point-in-time lookup after this migration is "latest snapshot row for the book + the
+ledger rows written since".
+
+Runs are cut by transaction id, not by time. occurred_at is now() — the start of the
+writing transaction — so a transaction still open when a run is cut would land behind
+that run's taken_at and never be compacted. Every movement records its transaction's
+64-bit id in xact_id instead, and each run records upto_xact_id, the
+``pg_snapshot_xmin(pg_current_snapshot())`` it was cut at (as in migration 006): every
+transaction below it has finished, so a run covers exactly the movements with
+xact_id in [previous run's upto_xact_id, upto_xact_id).
+"""
+from datetime import date
+
+from alembic import op
+
+revision = "004"
+down_revision = "003"
+branch_labels = None
+depends_on = None
+
+_MONTHS_AHEAD = 3
+
+
+def _month_start(year: int, month: int) -> date:
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE stock_movement (
+            id              bigint GENERATED ALWAYS AS IDENTITY,
+            occurred_at     timestamptz NOT NULL DEFAULT now(),
+            book_id         uuid NOT NULL,
+            kind            text NOT NULL,
+            quantity_delta  integer NOT NULL,
+            reserved_delta  integer NOT NULL,
+            quantity_after  integer NOT NULL,
+            reserved_after  integer NOT NULL,
+            ref             text,
+            xact_id         bigint NOT NULL DEFAULT pg_current_xact_id()::text::bigint,
+            PRIMARY KEY (occurred_at, id)
+        ) PARTITION BY RANGE (occurred_at)
+    """)
+    op.execute("CREATE INDEX ix_stock_movement_book_xact ON stock_movement (book_id, xact_id)")
+    op.execute("CREATE INDEX ix_stock_movement_xact ON stock_movement (xact_id)")
+    op.execute("CREATE TABLE stock_movement_default PARTITION OF stock_movement DEFAULT")
+    today = date.today()
+    for offset in range(_MONTHS_AHEAD + 1):
+        lo = _month_start(today.year, today.month + offset)
+        hi = _month_start(today.year, today.month + offset + 1)
+        op.execute(
+            f"CREATE TABLE stock_movement_{lo:%Y_%m} PARTITION OF stock_movement "
+            f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+        )
+
+    op.execute("""
+        CREATE TABLE stock_snapshot (
+            book_id   uuid NOT NULL,
+            taken_at  timestamptz NOT NULL,
+            quantity  integer NOT NULL,
+            reserved  integer NOT NULL,
+            PRIMARY KEY (book_id, taken_at)
+        )
+    """)
+    op.execute("""
+        CREATE TABLE stock_snapshot_run (
+            taken_at      timestamptz PRIMARY KEY,
+            upto_xact_id  bigint NOT NULL,
+            books         integer NOT NULL
+        )
+    """)
+    op.execute("""
+        WITH run AS (
+            SELECT now() AS taken_at,
+                   pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS upto_xact_id
+        ),
+        snap AS (
+            INSERT INTO stock_snapshot (book_id, taken_at, quantity, reserved)
+            SELECT book_id, run.taken_at, quantity, reserved FROM inventory, run
+            RETURNING 1
+        )
+        INSERT INTO stock_snapshot_run (taken_at, upto_xact_id, books)
+        SELECT run.taken_at, run.upto_xact_id, (SELECT count(*) FROM snap) FROM run
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE stock_snapshot_run")
+    op.execute("DROP TABLE stock_snapshot")
+    op.execute("DROP TABLE stock_movement")
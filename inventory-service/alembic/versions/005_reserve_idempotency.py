@@ -0,0 +1,36 @@
+"""idempotency keys for POST /stock/reserve
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19
+
+One row per successful keyed reservation, inserted in the reservation's own
+transaction. The key is claimed first (INSERT ... ON CONFLICT DO NOTHING), so a
+concurrent duplicate waits on the unique index rather than on the inventory row, and
+replays the committed response. book_id/quantity detect a key reused for a different
+request. Rows are pruned by age in batches, hence the created_at index.
+"""
+from alembic import op
+
+revision = "005"
+down_revision = "004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE reserve_idempotency (
+            key         text PRIMARY KEY,
+            book_id     uuid NOT NULL,
+            quantity    integer NOT NULL,
+            response    jsonb,
+            created_at  timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    op.create_index("ix_reserve_idempotency_created_at", "reserve_idempotency", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_reserve_idempotency_created_at", table_name="reserve_idempotency")
+    op.execute("DROP TABLE reserve_idempotency")
@@ -0,0 +1,51 @@
+"""per-row change version on inventory for GET /stock/changes
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19
+
+Every INSERT/UPDATE of an inventory row stamps ``version`` with the writing
+transaction's 64-bit id (``pg_current_xact_id()``) from a trigger, so the ORM writers,
+the set-based bulk import/adjust statements and the Kafka consumer are all covered
+without touching them.
+
+A transaction id rather than a sequence value: sequence numbers are drawn before
+commit, so a reader could see version 101 before the transaction holding 100 commits
+and never come back for it. Transaction ids compare against the reader's snapshot —
+every id below ``pg_snapshot_xmin(pg_current_snapshot())`` has finished — which gives
+the feed a high-water mark it can never skip past. Rows written by one transaction
+share a version; the (version, book_id) index gives them a stable order for paging.
+
+Existing rows start at version 0.
+"""
+from alembic import op
+
+revision = "006"
+down_revision = "005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE inventory ADD COLUMN version bigint NOT NULL DEFAULT 0")
+    op.execute("""
+        CREATE FUNCTION inventory_stamp_version() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.version := pg_current_xact_id()::text::bigint;
+            RETURN NEW;
+        END
+        $$
+    """)
+    op.execute("""
+        CREATE TRIGGER inventory_version
+        BEFORE INSERT OR UPDATE ON inventory
+        FOR EACH ROW EXECUTE FUNCTION inventory_stamp_version()
+    """)
+    op.create_index("ix_inventory_version", "inventory", ["version", "book_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_inventory_version", table_name="inventory")
+    op.execute("DROP TRIGGER inventory_version ON inventory")
+    op.execute("DROP FUNCTION inventory_stamp_version()")
+    op.execute("ALTER TABLE inventory DROP COLUMN version")
@@ -6,20 +6,40 @@ Customer-role tokens receive ``403 Forbidden``.
 Routes are NOT reachable via external gateway by default — the inven-route HTTPRoute
 must explicitly expose /inven/admin/** (added in Session 21).
 """
-from typing import Annotated
+import base64
+import binascii
+import json
+from dataclasses import asdict
+from datetime import datetime
+from typing import Annotated, Literal
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import select
+from aiokafka.errors import KafkaError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import Select, func, select
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
-from app.kafka.dlq_consumer import dlq_monitor, retry_dlq_message
+from app import ledger, profiler
+from app.bulk import adjuster as bulk_adjuster
+from app.bulk import exporter as bulk_exporter
+from app.bulk import importer as bulk_importer
+from app.config import settings
+from app.database import Explain, busy_error, get_db, writer_db
+from app.kafka.dlq_consumer import read_dlq_messages, retry_dlq_message
+from app.loop_monitor import loop_stalls
 from app.middleware.auth import require_role
+from app.middleware.query_stats import slow_requests
 from app.models.inventory import Inventory
 from app.schemas.inventory import (
     StockAdminResponse,
     StockAdjustRequest,
+    StockAsOfResponse,
+    StockBatchAdjustRequest,
+    StockBatchAdjustResponse,
+    StockBatchAdjustResult,
+    StockImportResponse,
     StockResponse,
     StockSetRequest,
 )
@@ -37,32 +57,89 @@ def _to_response(inv: Inventory) -> StockAdminResponse:
     )
 
 
+def _encode_cursor(book_id: UUID) -> str:
+    return base64.urlsafe_b64encode(book_id.bytes).rstrip(b"=").decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> UUID:
+    try:
+        return UUID(bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed cursor")
+
+
+async def _estimated_count(db: AsyncSession, stmt: Select) -> int:
+    """Row estimate for ``stmt`` from the planner (table statistics) — no table scan."""
+    plan = (await db.execute(Explain(stmt))).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
 @router.get(
     "",
     response_model=list[StockResponse],
     summary="List all stock entries",
     description="""
-Returns the full stock table — all books with their current `quantity`, `reserved`, and
-`available` values.
+Returns the stock table — books with their current `quantity`, `reserved`, and
+`available` values, ordered by `book_id`.
+
+**Pagination:** keyset (cursor) based. Pass the `X-Next-Cursor` response header back as
+`cursor` to fetch the next page; the header is absent on the last page. Deep pages cost
+the same as the first one. The legacy `page` parameter is still honoured when no
+`cursor` is given, but it scans and discards every earlier row.
+
+**Filters:**
+- `low_stock_below` — only books whose `available` is strictly below the threshold
+- `updated_since` — only books updated at or after the given timestamp
+
+**Counts:** `X-Total-Count` carries the planner's row estimate for the filtered set (from
+table statistics, no scan). Pass `exact_count=true` to get an exact `COUNT(*)` instead;
+`X-Total-Count-Exact` says which one was returned.
 
 **Requires `admin` Keycloak realm role.** Customer-role tokens receive `403 Forbidden`.
 """,
     responses={
-        200: {"description": "Full stock list"},
+        200: {"description": "One page of the stock list"},
+        400: {"description": "Malformed cursor"},
         401: {"description": "Missing or invalid Bearer token"},
         403: {"description": "Role 'admin' required"},
     },
 )
 async def list_stock(
+    response: Response,
     db: AsyncSession = Depends(get_db),
     _user: dict = Depends(require_role("admin")),
-    page: Annotated[int, Query(ge=0, description="Page number (0-based)")] = 0,
+    cursor: Annotated[str | None, Query(description="Opaque cursor from a previous `X-Next-Cursor` header")] = None,
+    page: Annotated[int, Query(ge=0, description="Page number (0-based). Ignored when `cursor` is set")] = 0,
     size: Annotated[int, Query(ge=1, le=200, description="Items per page")] = 50,
+    low_stock_below: Annotated[int | None, Query(ge=0, description="Only books with available < threshold")] = None,
+    updated_since: Annotated[datetime | None, Query(description="Only books updated at or after this timestamp")] = None,
+    exact_count: Annotated[bool, Query(description="Return an exact COUNT(*) instead of the planner estimate")] = False,
 ):
-    """Return all inventory records, paginated."""
-    result = await db.execute(
-        select(Inventory).order_by(Inventory.book_id).offset(page * size).limit(size)
-    )
+    """Return inventory records, one keyset page at a time."""
+    filters = []
+    if low_stock_below is not None:
+        filters.append((Inventory.quantity - Inventory.reserved) < low_stock_below)
+    if updated_since is not None:
+        filters.append(Inventory.updated_at >= updated_since)
+
+    stmt = select(Inventory).where(*filters).order_by(Inventory.book_id).limit(size)
+    if cursor is not None:
+        stmt = stmt.where(Inventory.book_id > _decode_cursor(cursor))
+    elif page:
+        stmt = stmt.offset(page * size)
+    items = (await db.execute(stmt)).scalars().all()
+
+    if len(items) == size:
+        response.headers["X-Next-Cursor"] = _encode_cursor(items[-1].book_id)
+    if exact_count:
+        total = (await db.execute(select(func.count()).select_from(Inventory).where(*filters))).scalar_one()
+    else:
+        total = await _estimated_count(db, select(Inventory.book_id).where(*filters))
+    response.headers["X-Total-Count"] = str(total)
+    response.headers["X-Total-Count-Exact"] = "true" if exact_count else "false"
+
     return [
         StockResponse(
             book_id=inv.book_id,
@@ -71,7 +148,7 @@ async def list_stock(
             available=inv.available,
             updated_at=inv.updated_at,
         )
-        for inv in result.scalars().all()
+        for inv in items
     ]
 
 
@@ -96,7 +173,7 @@ Use this endpoint when doing a full stock count (e.g. after a physical inventory
 async def set_stock(
     book_id: UUID,
     request: StockSetRequest,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(writer_db("set")),
     _user: dict = Depends(require_role("admin")),
 ):
     """Set absolute stock quantity for a book. Resets reserved to 0."""
@@ -106,6 +183,11 @@ async def set_stock(
     inv = result.scalar_one_or_none()
     if inv is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found in inventory")
+    await ledger.record_movement(
+        db, inv.book_id, ledger.SET,
+        quantity_delta=request.quantity - inv.quantity, reserved_delta=-inv.reserved,
+        quantity_after=request.quantity, reserved_after=0,
+    )
     inv.quantity = request.quantity
     inv.reserved = 0
     await db.commit()
@@ -138,7 +220,7 @@ Use this endpoint for incremental adjustments (e.g. received 20 new copies, or w
 async def adjust_stock(
     book_id: UUID,
     request: StockAdjustRequest,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(writer_db("adjust")),
     _user: dict = Depends(require_role("admin")),
 ):
     """Adjust stock quantity by a signed delta."""
@@ -155,19 +237,242 @@ async def adjust_stock(
             detail=f"Adjustment would result in negative quantity: current={inv.quantity} delta={request.delta}",
         )
     inv.quantity = new_qty
+    await ledger.record_movement(
+        db, inv.book_id, ledger.ADJUST,
+        quantity_delta=request.delta, quantity_after=new_qty, reserved_after=inv.reserved,
+    )
     await db.commit()
     await db.refresh(inv)
     return _to_response(inv)
 
 
+@router.get(
+    "/{book_id}/as-of",
+    response_model=StockAsOfResponse,
+    summary="Stock level at a point in time",
+    description="""
+Answers "what was the stock of this book at 14:00?" from the append-only movement ledger.
+
+Every mutation (reserve, order deduction, set, adjust, import, batch adjust) writes a ledger
+row in the same transaction. A background job periodically compacts the ledger into per-book
+snapshots, so the answer is the nearest snapshot at or before `at` plus at most one snapshot
+interval of ledger rows — the cost does not grow with ledger size.
+
+**Requires `admin` Keycloak realm role.**
+""",
+    responses={
+        200: {"description": "Stock level at `at`"},
+        401: {"description": "Missing or invalid Bearer token"},
+        403: {"description": "Role 'admin' required"},
+        404: {"description": "No history for this book at `at` (unknown book or before the first snapshot)"},
+    },
+)
+async def stock_as_of(
+    book_id: UUID,
+    at: Annotated[datetime, Query(description="Point in time (ISO 8601, with timezone)")],
+    db: AsyncSession = Depends(get_db),
+    _user: dict = Depends(require_role("admin")),
+):
+    """Rebuild a book's stock level at ``at`` from snapshot + ledger."""
+    row = await ledger.stock_as_of(db, book_id, at)
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No stock history for this book at that time")
+    return StockAsOfResponse(
+        book_id=book_id,
+        at=at,
+        quantity=row.quantity,
+        reserved=row.reserved,
+        available=row.quantity - row.reserved,
+        snapshot_taken_at=row.taken_at,
+        movements_applied=row.movements,
+    )
+
+
+@router.post(
+    "/adjust/batch",
+    response_model=StockBatchAdjustResponse,
+    summary="Adjust many books by delta in one statement",
+    description="""
+Applies up to 5000 signed deltas (e.g. a supplier shipment) with a single
+`UPDATE ... FROM unnest(...)`. Rows are locked in `book_id` order and the
+"quantity cannot go below 0" rule is enforced in SQL.
+
+**Modes:**
+- `atomic: true` (default) — all-or-nothing. If any book is unknown, would go negative or
+  would exceed 2147483647, nothing is applied and the response is `409` with the per-row outcomes.
+- `atomic: false` — best-effort. Valid rows are applied; the rest are reported as
+  `not_found`, `negative_quantity` or `quantity_out_of_range`.
+
+**Requires `admin` Keycloak realm role.**
+""",
+    responses={
+        200: {"description": "Per-row outcomes"},
+        401: {"description": "Missing or invalid Bearer token"},
+        403: {"description": "Role 'admin' required"},
+        409: {"description": "Atomic batch rejected — nothing applied", "model": StockBatchAdjustResponse},
+    },
+)
+async def adjust_stock_batch(
+    request: StockBatchAdjustRequest,
+    db: AsyncSession = Depends(writer_db("adjust_batch")),
+    _user: dict = Depends(require_role("admin")),
+):
+    """Apply many signed deltas in one statement."""
+    outcomes = await bulk_adjuster.adjust_batch(
+        db, [(item.book_id, item.delta) for item in request.items], request.atomic
+    )
+    applied = sum(1 for o in outcomes if o.status == bulk_adjuster.APPLIED)
+    body = StockBatchAdjustResponse(
+        atomic=request.atomic,
+        applied=applied,
+        results=[StockBatchAdjustResult(**asdict(o)) for o in outcomes],
+    )
+    if request.atomic and applied < len(outcomes):
+        return JSONResponse(status_code=status.HTTP_409_CONFLICT, content=body.model_dump(mode="json"))
+    return body
+
+
+_IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+@router.post(
+    "/import",
+    response_model=StockImportResponse,
+    summary="Bulk stock import (CSV / NDJSON)",
+    description="""
+Applies a whole warehouse recount or delivery in one request instead of one call per book.
+
+The body is streamed into a temporary staging table with `COPY`, then merged into
+`inventory` with set-based `UPDATE ... FROM staging` statements in `book_id`-ordered
+chunks (each chunk commits on its own).
+
+**Formats** (chosen by `Content-Type`):
+- `text/csv` — two columns `book_id,value`; an optional `book_id,...` header row is skipped
+- `application/x-ndjson` — one object per line: `{"book_id": "...", "quantity": 10}` in `set`
+  mode, `{"book_id": "...", "delta": -2}` in `delta` mode
+
+**Modes:**
+- `set` — absolute quantity, resets `reserved` to 0 (like `PUT /admin/stock/{book_id}`).
+  If a book appears more than once, the last line wins.
+- `delta` — signed adjustment (like `POST /admin/stock/{book_id}/adjust`). Repeated books are
+  summed; books whose resulting quantity would be negative or exceed 2147483647 are rejected
+  and left unchanged.
+
+Values must fit a 32-bit integer; lines outside that range are rejected like other bad lines.
+Unknown book IDs are skipped and counted, never inserted.
+
+Each chunk runs with the `import` lock and statement timeouts. If one expires the call
+answers `503` with `Retry-After`; chunks committed before it stay applied, so re-running a
+`set` import is safe but re-running a `delta` import applies those chunks twice.
+
+**Requires `admin` Keycloak realm role.**
+""",
+    responses={
+        200: {"description": "Import summary"},
+        401: {"description": "Missing or invalid Bearer token"},
+        403: {"description": "Role 'admin' required"},
+        415: {"description": "Unsupported Content-Type"},
+        503: {"description": "Row lock or statement timeout in a merge chunk — retry after `Retry-After` seconds"},
+    },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "text/csv": {"schema": {"type": "string"}, "example": "book_id,quantity\n00000000-0000-0000-0000-000000000001,120\n"},
+                "application/x-ndjson": {"schema": {"type": "string"}, "example": '{"book_id": "00000000-0000-0000-0000-000000000001", "quantity": 120}\n'},
+            },
+        }
+    },
+)
+async def import_stock(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    _user: dict = Depends(require_role("admin")),
+    mode: Annotated[Literal["set", "delta"], Query(description="`set` absolute quantities or apply `delta`s")] = "set",
+):
+    """Stream a CSV/NDJSON upload into a staging table and merge it into inventory."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = _IMPORT_CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be one of: {', '.join(_IMPORT_CONTENT_TYPES)}",
+        )
+    try:
+        async with db.bind.connect() as conn:
+            summary = await bulk_importer.import_stock(
+                conn, request.stream(), fmt, mode, settings.stock_import_chunk_size
+            )
+    except DBAPIError as exc:
+        error = busy_error("import", exc)
+        if error is None:
+            raise
+        raise error from exc
+    return StockImportResponse(**asdict(summary))
+
+
+@router.get(
+    "/export",
+    summary="Stream the full stock table (CSV / NDJSON / Arrow)",
+    description="""
+Streams every inventory row, ordered by `book_id`, without paging.
+
+Rows are read from a server-side cursor (`stock_export_fetch_size` rows per fetch) inside a
+single `REPEATABLE READ READ ONLY` transaction, so the export is one consistent snapshot and
+the service's memory use does not grow with table size.
+
+**Formats:** `csv` (with header row), `ndjson`, or `arrow` (Arrow IPC stream — only when
+`pyarrow` is installed, see the `arrow` extra).
+
+**Requires `admin` Keycloak realm role.**
+""",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Stock table stream",
+            "content": {media_type: {} for media_type in bulk_exporter.MEDIA_TYPES.values()},
+        },
+        400: {"description": "Arrow requested but pyarrow is not installed"},
+        401: {"description": "Missing or invalid Bearer token"},
+        403: {"description": "Role 'admin' required"},
+    },
+)
+async def export_stock(
+    db: AsyncSession = Depends(get_db),
+    _user: dict = Depends(require_role("admin")),
+    fmt: Annotated[Literal["csv", "ndjson", "arrow"], Query(alias="format", description="Output format")] = "csv",
+):
+    """Stream the whole stock table from one snapshot."""
+    if fmt == "arrow" and not bulk_exporter.arrow_available():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Arrow export requires pyarrow (install the 'arrow' extra)",
+        )
+    extension = "arrows" if fmt == "arrow" else fmt
+    return StreamingResponse(
+        bulk_exporter.export_stock(db.bind, fmt, settings.stock_export_fetch_size),
+        media_type=bulk_exporter.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="inventory.{extension}"'},
+    )
+
+
 @router.get("/dlq", tags=["Admin — DLQ"], summary="List DLQ messages")
 async def list_dlq_messages(
     _user=Depends(require_role("admin")),
 ):
-    """Returns dead-letter queue messages (last 100) and total count."""
+    """Returns the last 100 dead-letter queue messages (read from the topic) and the
+    number of messages the topic still retains."""
+    try:
+        total, messages = await read_dlq_messages()
+    except KafkaError as exc:
+        raise HTTPException(status_code=503, detail=f"DLQ topic unavailable: {exc}") from exc
     return {
-        "totalCount": dlq_monitor.total_count,
-        "messages": dlq_monitor.messages,
+        "totalCount": total,
+        "messages": messages,
     }
 
 
@@ -177,7 +482,83 @@ async def retry_message(
     _user=Depends(require_role("admin")),
 ):
     """Re-publish a DLQ message back to the source topic for reprocessing."""
-    result = await retry_dlq_message(msg_id)
+    try:
+        result = await retry_dlq_message(msg_id)
+    except KafkaError as exc:
+        raise HTTPException(status_code=503, detail=f"DLQ topic unavailable: {exc}") from exc
     if result is None:
         raise HTTPException(status_code=404, detail=f"DLQ message #{msg_id} not found")
     return result
+
+
+@router.get(
+    "/diagnostics/slow-requests",
+    tags=["Admin — Diagnostics"],
+    summary="List recent slow requests",
+)
+async def list_slow_requests(
+    _user=Depends(require_role("admin")),
+):
+    """Returns the last requests slower than ``SLOW_REQUEST_THRESHOLD_MS`` with per-statement
+    SQL, parameter types (never values) and timings, plus the total count since startup."""
+    return {
+        "thresholdMs": settings.slow_request_threshold_ms,
+        "totalCount": slow_requests.total_count,
+        "requests": slow_requests.entries,
+    }
+
+
+@router.get(
+    "/diagnostics/loop-stalls",
+    tags=["Admin — Diagnostics"],
+    summary="List recent event-loop stalls",
+)
+async def list_loop_stalls(
+    _user=Depends(require_role("admin")),
+):
+    """Returns stacks of the event-loop thread captured while it was blocked for longer than
+    ``LOOP_STALL_THRESHOLD_MS`` (innermost frame last), plus the total count since startup."""
+    return {
+        "thresholdMs": settings.loop_stall_threshold_ms,
+        "totalCount": loop_stalls.total_count,
+        "stalls": loop_stalls.entries,
+    }
+
+
+@router.get(
+    "/diagnostics/profile",
+    tags=["Admin — Diagnostics"],
+    summary="Sample the live process and return a CPU profile",
+    responses={
+        200: {
+            "description": "Collapsed stacks (text/plain) or a speedscope profile (application/json)",
+            "content": {"text/plain": {}, "application/json": {}},
+        },
+        401: {"description": "Missing or invalid Bearer token"},
+        403: {"description": "Role 'admin' required"},
+        409: {"description": "Another profile is already running"},
+        501: {"description": "SIGPROF sampling not available on this platform / loop thread"},
+    },
+)
+async def profile_process(
+    _user=Depends(require_role("admin")),
+    seconds: float = Query(10, ge=0.1, le=60, description="How long to sample"),
+    interval_ms: float = Query(10, ge=1, le=100, description="Sampling interval"),
+    fmt: Annotated[Literal["collapsed", "speedscope"], Query(alias="format", description="Output format")] = "collapsed",
+):
+    """Samples the event-loop thread (request handlers, Kafka consumers, background jobs) on
+    process CPU time for ``seconds``. Each stack is rooted at the name of the asyncio task
+    that was running."""
+    try:
+        samples = await profiler.profile(seconds, interval_ms / 1000)
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running")
+    except profiler.ProfilerUnavailable as exc:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(exc))
+    headers = {"X-Profile-Samples": str(sum(samples.values()))}
+    if fmt == "speedscope":
+        headers["Content-Disposition"] = 'attachment; filename="inventory.speedscope.json"'
+        return JSONResponse(
+            profiler.to_speedscope(samples, interval_ms / 1000, profiler.profile_name()), headers=headers
+        )
+    return PlainTextResponse(profiler.to_collapsed(samples), headers=headers)
@@ -1,14 +1,25 @@
+import time
 from typing import Annotated
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app import availability, change_feed, idempotency, ledger, reservations, reserve_combiner, reserve_protocol, telemetry
+from app.config import settings
+from app.database import get_db, writer_db
 from app.models.inventory import Inventory
-from app.schemas.inventory import ReserveRequest, ReserveResponse, StockResponse
-from prometheus_client import Counter
+from app.reservations import Outcome
+from app.schemas.inventory import (
+    ReserveRequest,
+    ReserveResponse,
+    StockChange,
+    StockChangesResponse,
+    StockResponse,
+)
+from prometheus_client import Counter, Histogram
 
 router = APIRouter(prefix="/stock", tags=["stock"])
 
@@ -17,6 +28,13 @@ inventory_reserved_total = Counter(
     "Total number of inventory units reserved",
 )
 
+reserve_seconds = Histogram(
+    "inventory_reserve_seconds",
+    "Latency of POST /stock/reserve by outcome (reserved, replayed, insufficient, not_found, error)",
+    ["outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
 
 @router.get(
     "/bulk",
@@ -79,6 +97,145 @@ async def get_bulk_stock(
     ]
 
 
+@router.get(
+    "/changes",
+    response_model=StockChangesResponse,
+    summary="Stock changes since a version",
+    description="""
+Returns the stock rows that changed since a client-held position, so caches and indexes
+can stay in sync at a cost proportional to the number of changes.
+
+Every row carries a `version` — the id of the transaction that last wrote it. A response
+only contains versions below a **high-water mark** that no running transaction can still
+commit under, so a change is never skipped however commits interleave.
+
+**Sync loop:**
+1. Start with `since=0` (everything) or a `since` you stored earlier.
+2. Pass `since` and `after` from each response back verbatim until `complete` is true —
+   pages are bounded by `size`, and rows written by one transaction share a version.
+3. Store `since` from the last response and poll with it later (`after` is then null).
+
+A row that changed several times appears once, with its latest state. A long-running write
+transaction holds the high-water mark back until it ends.
+
+**Public** — no authentication required.
+""",
+    responses={
+        200: {"description": "One page of changes and the position to continue from"},
+        422: {"description": "Validation error — negative `since`, malformed `after` or `size` out of range"},
+    },
+)
+async def get_stock_changes(
+    db: AsyncSession = Depends(get_db),
+    since: Annotated[int, Query(ge=0, description="`since` from the previous response (0 = from the beginning)")] = 0,
+    after: Annotated[UUID | None, Query(description="`after` from the previous response, if any")] = None,
+    size: Annotated[int, Query(ge=1, le=1000, description="Maximum rows per page")] = 500,
+):
+    """Return one page of rows changed since (``since``, ``after``), in version order."""
+    high_water = await change_feed.high_water(db)
+    rows = await change_feed.changes(db, since, after, size, high_water)
+    changes = [
+        StockChange(
+            book_id=inv.book_id,
+            quantity=inv.quantity,
+            reserved=inv.reserved,
+            available=inv.available,
+            updated_at=inv.updated_at,
+            version=inv.version,
+        )
+        for inv in rows
+    ]
+    if len(rows) == size:
+        return StockChangesResponse(changes=changes, since=rows[-1].version, after=rows[-1].book_id, complete=False)
+    return StockChangesResponse(changes=changes, since=high_water, after=None, complete=True)
+
+
+_AVAILABILITY_MEDIA_TYPE = "application/octet-stream"
+
+
+def _availability_index() -> availability.AvailabilityIndex:
+    if not availability.index.loaded:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Availability index is loading",
+            headers={"Retry-After": "1"},
+        )
+    return availability.index
+
+
+def _conditional(body: bytes, etag: str, if_none_match: str | None, headers: dict[str, str]) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache", **headers}
+    if if_none_match is not None and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(body, media_type=_AVAILABILITY_MEDIA_TYPE, headers=headers)
+
+
+@router.get(
+    "/availability",
+    response_class=Response,
+    summary="Whole-catalog availability (2 bits per book)",
+    description="""
+In Stock / Low Stock / Out of Stock for **every** book in one small binary response,
+served from memory — what the catalog badges need, without fetching `StockResponse`
+objects 50 at a time.
+
+**Body:** 2 bits per book, four books per byte, first book in the lowest bits, in the
+order of `GET /stock/availability/ids`: `0` out of stock, `1` low stock (1–3 available),
+`2` in stock. `X-Availability-Count` is the number of books (the last byte is padded).
+10,000 books fit in 2.5 KB.
+
+**Versioning:** the `ETag` changes only when some status changes. Revalidate with
+`If-None-Match` to get `304 Not Modified` (no body) until then. `X-Availability-Ids-ETag`
+is the ETag of the id list this array is aligned to — refetch the ids when it differs from
+the one you cached. The index follows every stock change within about a second.
+
+**Public** — no authentication required.
+""",
+    responses={
+        200: {"description": "Packed statuses", "content": {_AVAILABILITY_MEDIA_TYPE: {}}},
+        304: {"description": "Unchanged since the `If-None-Match` ETag"},
+        503: {"description": "Index still loading after startup — retry after `Retry-After` seconds"},
+    },
+)
+async def get_availability(
+    if_none_match: Annotated[str | None, Header(alias="If-None-Match")] = None,
+):
+    """Serve the packed status array from the in-memory availability index."""
+    index = _availability_index()
+    body, etag = index.statuses()
+    return _conditional(body, etag, if_none_match, {
+        "X-Availability-Ids-ETag": index.ids()[1],
+        "X-Availability-Count": str(len(index)),
+    })
+
+
+@router.get(
+    "/availability/ids",
+    response_class=Response,
+    summary="Book ids of the availability array",
+    description="""
+Every `book_id` in inventory as 16 raw bytes, ascending — position *i* here is status *i*
+in `GET /stock/availability`. Changes only when a book is added, so clients cache it and
+refetch only when `X-Availability-Ids-ETag` on the status array no longer matches this
+response's `ETag` (`If-None-Match` works here too).
+
+**Public** — no authentication required.
+""",
+    responses={
+        200: {"description": "Sorted 16-byte book ids", "content": {_AVAILABILITY_MEDIA_TYPE: {}}},
+        304: {"description": "Unchanged since the `If-None-Match` ETag"},
+        503: {"description": "Index still loading after startup — retry after `Retry-After` seconds"},
+    },
+)
+async def get_availability_ids(
+    if_none_match: Annotated[str | None, Header(alias="If-None-Match")] = None,
+):
+    """Serve the sorted id list the availability array is aligned to."""
+    index = _availability_index()
+    body, etag = index.ids()
+    return _conditional(body, etag, if_none_match, {"X-Availability-Count": str(len(index))})
+
+
 @router.get(
     "/{book_id}",
     response_model=StockResponse,
@@ -136,6 +293,11 @@ Atomically reserves stock for a book. Called by `ecom-service` at checkout.
 
 **Atomicity:** Uses `SELECT ... FOR UPDATE` row lock to prevent double-booking.
 Returns `409 CONFLICT` if `available < requested quantity`.
+
+**Retries:** send an `Idempotency-Key` (unique per order line) to make retries safe. A
+repeated key returns the first successful response with `Idempotent-Replayed: true` and
+does not reserve again; reusing a key for a different book or quantity returns `422`.
+Keys are kept for at least 24 hours.
 """,
     tags=["reserve"],
     responses={
@@ -149,29 +311,140 @@ Returns `409 CONFLICT` if `available < requested quantity`.
                 }
             },
         },
+        422: {"description": "Validation error, or `Idempotency-Key` already used for a different reservation"},
+        503: {"description": "Row lock or statement timeout — nothing reserved, retry after `Retry-After` seconds"},
     },
 )
 async def reserve_stock(
     request: ReserveRequest,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(writer_db("reserve")),
+    idempotency_key: Annotated[
+        str | None,
+        Header(alias="Idempotency-Key", max_length=255, description="Makes retries of this reservation safe"),
+    ] = None,
 ):
     """Reserve stock for an order. Returns 409 if insufficient available units."""
+    result = await _reserve(db, request.book_id, request.quantity, idempotency_key)
+    if result.status == "replayed":
+        return JSONResponse(result.body, headers={"Idempotent-Replayed": "true"})
+    if result.status != "reserved":
+        raise HTTPException(status_code=result.status_code, detail=result.detail)
+    return result.body
+
+
+@router.post(
+    "/reserve/binary",
+    response_class=Response,
+    summary="Reserve stock, msgpack batch — internal mTLS only",
+    description="""
+Reserves one or more order lines in a single call over a compact msgpack encoding, for
+`ecom-service`'s checkout path. Each line goes through exactly the same reservation as
+`POST /stock/reserve` (its own transaction, `Idempotency-Key` semantics, combining) and
+gets the status that route would have answered; lines are applied in order.
+
+Reachable only inside the mesh, like `POST /stock/reserve` (no Gateway route for `POST`).
+
+**Request** (`Content-Type: application/msgpack`): an array of 1-50 items
+`[book_id, quantity]` or `[book_id, quantity, idempotency_key]`; `book_id` as 16 raw
+bytes or a UUID string.
+
+**Response** (`application/msgpack`): one `[status, remaining_available, replayed, detail]`
+array per item, in request order.
+
+A `503` for the whole call (lock or statement timeout) can follow lines that were already
+reserved — send an idempotency key per line and retry the call.
+""",
+    tags=["reserve"],
+    responses={
+        200: {"description": "Per-item results", "content": {reserve_protocol.MEDIA_TYPE: {}}},
+        400: {"description": "Malformed msgpack body"},
+        415: {"description": "Unsupported Content-Type"},
+        501: {"description": "msgpack is not installed on the server"},
+        503: {"description": "Row lock or statement timeout — retry after `Retry-After` seconds"},
+    },
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {reserve_protocol.MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}}},
+        }
+    },
+)
+async def reserve_stock_binary(
+    request: Request,
+    db: AsyncSession = Depends(writer_db("reserve")),
+):
+    """Reserve a batch of order lines encoded with msgpack."""
+    if not reserve_protocol.msgpack_available():
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Binary reserve requires msgpack (install the 'msgpack' extra)",
+        )
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in reserve_protocol.CONTENT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be one of: {', '.join(reserve_protocol.CONTENT_TYPES)}",
+        )
+    try:
+        items = reserve_protocol.decode_items(await request.body())
+    except reserve_protocol.ProtocolError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    outcomes = [await _reserve(db, item.book_id, item.quantity, item.key) for item in items]
+    return Response(reserve_protocol.encode_outcomes(outcomes), media_type=reserve_protocol.MEDIA_TYPE)
+
+
+async def _reserve(db: AsyncSession, book_id: UUID, quantity: int, key: str | None) -> Outcome:
+    """One reservation in its own transaction — shared by the JSON and binary routes."""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await _apply_reservation(db, book_id, quantity, key)
+        if result.status != "key_mismatch":
+            outcome = result.status
+        if result.status == "reserved":
+            inventory_reserved_total.inc(quantity)
+        return result
+    finally:
+        elapsed = time.perf_counter() - started
+        reserve_seconds.labels(outcome=outcome).observe(
+            elapsed, telemetry.trace_exemplar(elapsed, failed=outcome not in ("reserved", "replayed"))
+        )
+
+
+async def _apply_reservation(db: AsyncSession, book_id: UUID, quantity: int, key: str | None) -> Outcome:
+    if key is not None:
+        stored = idempotency.cached(key)
+        if stored is None and not settings.reserve_combining:
+            stored = await idempotency.claim(db, key, book_id, quantity)
+        if stored is not None:
+            await db.rollback()
+            return reservations.replay(stored, book_id, quantity)
+    if settings.reserve_combining:
+        return await reserve_combiner.reserve(db, book_id, quantity, key)
     result = await db.execute(
-        select(Inventory).where(Inventory.book_id == request.book_id).with_for_update()
+        select(Inventory).where(Inventory.book_id == book_id).with_for_update()
     )
     inv = result.scalar_one_or_none()
     if inv is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Book not found in inventory")
-    if inv.available < request.quantity:
-        raise HTTPException(
-            status_code=status.HTTP_409_CONFLICT,
-            detail=f"Insufficient stock: available={inv.available} requested={request.quantity}",
-        )
-    inv.reserved += request.quantity
-    await db.commit()
-    inventory_reserved_total.inc(request.quantity)
-    return ReserveResponse(
+        await db.rollback()
+        return reservations.not_found()
+    if inv.available < quantity:
+        await db.rollback()
+        return reservations.insufficient(inv.available, quantity)
+    inv.reserved += quantity
+    await ledger.record_movement(
+        db, inv.book_id, ledger.RESERVE,
+        reserved_delta=quantity, quantity_after=inv.quantity, reserved_after=inv.reserved,
+        ref=key,
+    )
+    body = ReserveResponse(
         book_id=inv.book_id,
-        quantity_reserved=request.quantity,
+        quantity_reserved=quantity,
         remaining_available=inv.available,
-    )
+    ).model_dump(mode="json")
+    if key is not None:
+        await idempotency.record(db, key, body)
+    await db.commit()
+    if key is not None:
+        idempotency.remember(key, book_id, quantity, body)
+    return Outcome("reserved", body)
@@ -0,0 +1,178 @@
+"""Whole-catalog availability status, held in memory and served as a few KB.
+
+The catalog UI only shows In Stock / Low Stock / Out of Stock per book, so each API
+process keeps one 2-bit status per book in ``book_id`` order and serves two binary
+resources (``GET /stock/availability/ids`` and ``GET /stock/availability``):
+
+  - ids: every ``book_id`` as 16 raw bytes, ascending — changes only when a book is added
+  - statuses: 2 bits per book in the same order, four books per byte, first book in the
+    lowest bits: ``0`` out of stock, ``1`` low stock (available <= ``AVAILABILITY_LOW_STOCK``),
+    ``2`` in stock
+
+Each carries a content-hash ``ETag`` (statuses are also tagged with the ids ETag they
+align to), so a client revalidates with ``If-None-Match`` and downloads again only when a
+status actually changed — replicas serving the same content agree on the tag.
+
+The index is loaded once from the table, then follows the change feed (``app.change_feed``)
+every ``AVAILABILITY_REFRESH_INTERVAL_SECONDS``: only rows written since the last
+high-water mark are read, whichever process or writer changed them.
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+from uuid import UUID
+
+from prometheus_client import Gauge
+from sqlalchemy import select
+
+from app import change_feed
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.inventory import Inventory
+
+logger = logging.getLogger(__name__)
+
+OUT_OF_STOCK, LOW_STOCK, IN_STOCK = 0, 1, 2
+
+_FEED_PAGE = 1000
+
+availability_books = Gauge(
+    "inventory_availability_books",
+    "Books in the in-memory availability index, by status",
+    ["status"],
+)
+availability_version = Gauge(
+    "inventory_availability_version",
+    "Change-feed high-water mark the availability index has caught up to",
+)
+
+
+def _etag(*parts: bytes) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update(part)
+    return f'"{digest.hexdigest()}"'
+
+
+class AvailabilityIndex:
+    """Sorted book ids plus one status byte each; encodings are cached until a change."""
+
+    def __init__(self, low_stock: int):
+        self.low_stock = low_stock
+        self.version: int | None = None
+        self._ids: list[UUID] = []
+        self._position: dict[UUID, int] = {}
+        self._statuses = bytearray()
+        self._ids_encoded: tuple[bytes, str] | None = None
+        self._statuses_encoded: tuple[bytes, str] | None = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def status(self, available: int) -> int:
+        if available <= 0:
+            return OUT_OF_STOCK
+        return LOW_STOCK if available <= self.low_stock else IN_STOCK
+
+    def load(self, rows: list[tuple[UUID, int]], version: int) -> None:
+        """Replace the index with ``(book_id, available)`` rows sorted by ``book_id``."""
+        self._ids = [book_id for book_id, _ in rows]
+        self._position = {book_id: i for i, book_id in enumerate(self._ids)}
+        self._statuses = bytearray(self.status(available) for _, available in rows)
+        self._ids_encoded = self._statuses_encoded = None
+        self._count()
+        self.caught_up(version)
+
+    def apply(self, rows: list[tuple[UUID, int]]) -> int:
+        """Apply changed rows; returns how many statuses (or new books) changed."""
+        changed = 0
+        added = False
+        for book_id, available in rows:
+            status = self.status(available)
+            i = self._position.get(book_id)
+            if i is None:
+                i = bisect.bisect(self._ids, book_id)
+                self._ids.insert(i, book_id)
+                self._statuses.insert(i, status)
+                added = True
+            elif self._statuses[i] == status:
+                continue
+            else:
+                self._statuses[i] = status
+            changed += 1
+        if added:
+            self._position = {book_id: i for i, book_id in enumerate(self._ids)}
+            self._ids_encoded = None
+        if changed:
+            self._statuses_encoded = None
+            self._count()
+        return changed
+
+    def caught_up(self, version: int) -> None:
+        """Every change below ``version`` has been applied."""
+        self.version = version
+        availability_version.set(version)
+
+    def _count(self) -> None:
+        for name, code in (("out_of_stock", OUT_OF_STOCK), ("low_stock", LOW_STOCK), ("in_stock", IN_STOCK)):
+            availability_books.labels(status=name).set(self._statuses.count(code))
+
+    def ids(self) -> tuple[bytes, str]:
+        """``(body, etag)`` of the sorted id list."""
+        if self._ids_encoded is None:
+            body = b"".join(book_id.bytes for book_id in self._ids)
+            self._ids_encoded = (body, _etag(body))
+        return self._ids_encoded
+
+    def statuses(self) -> tuple[bytes, str]:
+        """``(body, etag)`` of the packed statuses; the ETag covers the id order too."""
+        if self._statuses_encoded is None:
+            s = self._statuses + bytes(-len(self._statuses) % 4)
+            body = bytes(
+                s[i] | s[i + 1] << 2 | s[i + 2] << 4 | s[i + 3] << 6 for i in range(0, len(s), 4)
+            )
+            self._statuses_encoded = (body, _etag(self.ids()[1].encode(), body))
+        return self._statuses_encoded
+
+
+index = AvailabilityIndex(settings.availability_low_stock)
+
+
+async def refresh_once() -> int:
+    """Load the index, or apply every change since its version. Returns rows changed."""
+    async with AsyncSessionLocal() as db:
+        high_water = await change_feed.high_water(db)
+        if not index.loaded:
+            result = await db.execute(
+                select(Inventory.book_id, Inventory.quantity - Inventory.reserved).order_by(Inventory.book_id)
+            )
+            rows = [(book_id, available) for book_id, available in result.all()]
+            index.load(rows, high_water)
+            logger.info("Availability index loaded: %d books", len(rows))
+            return len(rows)
+        changed, since, after = 0, index.version, None
+        while True:
+            page = await change_feed.changes(db, since, after, _FEED_PAGE, high_water)
+            changed += index.apply([(inv.book_id, inv.available) for inv in page])
+            if len(page) < _FEED_PAGE:
+                break
+            since, after = page[-1].version, page[-1].book_id
+        index.caught_up(high_water)
+        return changed
+
+
+async def run_refresher() -> None:
+    """Keep the index current every ``availability_refresh_interval_seconds``."""
+    while True:
+        try:
+            await refresh_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error("Availability refresh failed: %s — retrying next interval", exc)
+        await asyncio.sleep(settings.availability_refresh_interval_seconds)
@@ -0,0 +1,93 @@
+"""Batch delta adjustment — many signed deltas in one statement.
+
+The whole batch is one ``UPDATE ... FROM unnest(...)``: rows are locked in book_id
+order (so concurrent batches cannot deadlock), the non-negativity rule is enforced in
+the ``WHERE`` clause, and every input row gets an outcome in the same round trip.
+Deltas for a book listed more than once are summed as ``bigint``; a book whose new
+quantity would not fit ``inventory.quantity`` (int4) is refused rather than failing
+the statement.
+"""
+from dataclasses import dataclass
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import ledger
+
+APPLIED = "applied"
+NOT_FOUND = "not_found"
+NEGATIVE = "negative_quantity"
+OUT_OF_RANGE = "quantity_out_of_range"
+SKIPPED = "skipped"
+
+INT4_MAX = 2**31 - 1
+
+_BATCH_SQL = """
+    WITH input AS (
+        SELECT book_id, sum(delta) AS delta
+        FROM unnest(CAST(:book_ids AS uuid[]), CAST(:deltas AS int[])) AS t(book_id, delta)
+        GROUP BY book_id
+    ), locked AS (
+        SELECT i.book_id, i.quantity FROM inventory i JOIN input USING (book_id)
+        ORDER BY i.book_id FOR UPDATE OF i
+    ), applied AS (
+        UPDATE inventory i SET quantity = i.quantity + input.delta, updated_at = now()
+        FROM input JOIN locked USING (book_id)
+        WHERE i.book_id = input.book_id AND i.quantity + input.delta BETWEEN 0 AND {int4_max} {atomic_guard}
+        RETURNING i.book_id, i.quantity, i.reserved, input.delta
+    ), ledger AS (
+        INSERT INTO stock_movement
+            (book_id, kind, quantity_delta, reserved_delta, quantity_after, reserved_after, ref)
+        SELECT book_id, '{kind}', delta, 0, quantity, reserved, 'batch' FROM applied
+    )
+    SELECT input.book_id, input.delta, locked.quantity AS previous_quantity,
+           applied.quantity AS new_quantity, applied.book_id IS NOT NULL AS applied
+    FROM input
+    LEFT JOIN locked USING (book_id)
+    LEFT JOIN applied USING (book_id)
+    ORDER BY input.book_id
+"""
+
+# All-or-nothing: no row is updated if any row is unknown or out of range.
+_ATOMIC_GUARD = """
+        AND NOT EXISTS (
+            SELECT 1 FROM input x LEFT JOIN locked l USING (book_id)
+            WHERE l.book_id IS NULL OR l.quantity + x.delta NOT BETWEEN 0 AND {int4_max}
+        )
+"""
+
+
+@dataclass
+class AdjustOutcome:
+    book_id: UUID
+    delta: int
+    status: str
+    previous_quantity: int | None
+    quantity: int | None
+
+
+async def adjust_batch(db: AsyncSession, deltas: list[tuple[UUID, int]], atomic: bool) -> list[AdjustOutcome]:
+    """Apply ``deltas`` in one statement and commit. Outcomes are ordered by book_id."""
+    guard = _ATOMIC_GUARD.format(int4_max=INT4_MAX) if atomic else ""
+    stmt = text(_BATCH_SQL.format(atomic_guard=guard, kind=ledger.ADJUST, int4_max=INT4_MAX))
+    rows = (await db.execute(stmt, {
+        "book_ids": [book_id for book_id, _ in deltas],
+        "deltas": [delta for _, delta in deltas],
+    })).all()
+    await db.commit()
+
+    outcomes = []
+    for row in rows:
+        if row.applied:
+            status, quantity = APPLIED, row.new_quantity
+        elif row.previous_quantity is None:
+            status, quantity = NOT_FOUND, None
+        elif row.previous_quantity + row.delta < 0:
+            status, quantity = NEGATIVE, row.previous_quantity
+        elif row.previous_quantity + row.delta > INT4_MAX:
+            status, quantity = OUT_OF_RANGE, row.previous_quantity
+        else:
+            status, quantity = SKIPPED, row.previous_quantity
+        outcomes.append(AdjustOutcome(row.book_id, row.delta, status, row.previous_quantity, quantity))
+    return outcomes
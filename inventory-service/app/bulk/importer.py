@@ -0,0 +1,219 @@
+"""Bulk stock import — COPY into a temp staging table, then set-based merge.
+
+The request body (CSV or NDJSON) is parsed line by line as it streams in and fed
+straight into ``COPY`` via asyncpg, so memory stays flat regardless of file size.
+Duplicate book_ids are collapsed in SQL (``set``: last line wins, ``delta``: summed),
+then applied to ``inventory`` in book_id-ordered chunks. Each chunk locks its rows in
+primary-key order and commits on its own, so a 100k-row recount never holds more than
+one chunk of row locks and cannot deadlock against other ordered writers. Each chunk
+runs with the ``"import"`` lock / statement timeouts; chunks merged before one expires
+stay applied.
+"""
+import csv
+import json
+import logging
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app import ledger
+from app.database import set_timeouts
+
+logger = logging.getLogger(__name__)
+
+_STAGING = "stock_import_staging"
+_MERGED = "stock_import_merged"
+_MAX_ERRORS_REPORTED = 100
+# inventory.quantity and the staging value column are int4.
+_INT4_MIN, _INT4_MAX = -(2**31), 2**31 - 1
+
+MODES = ("set", "delta")
+FORMATS = ("csv", "ndjson")
+
+
+@dataclass
+class ImportSummary:
+    mode: str
+    received: int = 0
+    applied: int = 0
+    unknown: int = 0
+    rejected: int = 0
+    errors: list[dict] = field(default_factory=list)
+
+    def reject(self, line_no: int, reason: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < _MAX_ERRORS_REPORTED:
+            self.errors.append({"line": line_no, "reason": reason})
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a byte stream into decoded lines without buffering the whole body."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8").rstrip("\r")
+
+
+def parse_line(line: str, fmt: str, mode: str) -> tuple[UUID, int]:
+    """Parse one CSV (``book_id,value``) or NDJSON line. Raises ValueError on bad input."""
+    if fmt == "csv":
+        fields = next(csv.reader([line]))
+        if len(fields) != 2:
+            raise ValueError(f"expected 2 columns, got {len(fields)}")
+        raw_id, raw_value = fields
+    else:
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"invalid JSON: {exc.msg}") from None
+        value_key = "quantity" if mode == "set" else "delta"
+        if not isinstance(obj, dict) or "book_id" not in obj or value_key not in obj:
+            raise ValueError(f"expected object with 'book_id' and '{value_key}'")
+        raw_id, raw_value = obj["book_id"], obj[value_key]
+    book_id = UUID(str(raw_id).strip())
+    if isinstance(raw_value, bool) or isinstance(raw_value, float):
+        raise ValueError(f"value must be an integer: {raw_value!r}")
+    value = int(str(raw_value).strip())
+    if mode == "set" and value < 0:
+        raise ValueError("quantity must be >= 0")
+    if not _INT4_MIN <= value <= _INT4_MAX:
+        raise ValueError(f"value out of range: {value}")
+    return book_id, value
+
+
+async def _staged_records(
+    lines: AsyncIterator[str], fmt: str, summary: ImportSummary
+) -> AsyncIterator[tuple[int, UUID, int]]:
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        if fmt == "csv" and line_no == 1 and line.lstrip().lower().startswith("book_id"):
+            continue  # header row
+        summary.received += 1
+        try:
+            book_id, value = parse_line(line, fmt, summary.mode)
+        except ValueError as exc:
+            summary.reject(line_no, str(exc))
+            continue
+        yield line_no, book_id, value
+
+
+_LEDGER_CTE = """ledger AS (
+            INSERT INTO stock_movement
+                (book_id, kind, quantity_delta, reserved_delta, quantity_after, reserved_after, ref)
+            SELECT book_id, '{kind}', quantity - old_quantity, reserved - old_reserved, quantity, reserved, 'import'
+            FROM applied
+        )"""
+
+_MERGE_SQL = {
+    # Absolute recount — same semantics as PUT /admin/stock/{book_id} (resets reserved).
+    "set": f"""
+        WITH batch AS (
+            SELECT book_id, value FROM {_MERGED}
+            WHERE book_id > :after ORDER BY book_id LIMIT :chunk
+        ), locked AS (
+            SELECT i.book_id, i.quantity, i.reserved FROM inventory i JOIN batch b USING (book_id)
+            ORDER BY i.book_id FOR UPDATE OF i
+        ), applied AS (
+            UPDATE inventory i SET quantity = b.value, reserved = 0, updated_at = now()
+            FROM batch b JOIN locked l USING (book_id)
+            WHERE i.book_id = b.book_id
+            RETURNING i.book_id, i.quantity, i.reserved, l.quantity AS old_quantity, l.reserved AS old_reserved
+        ), {_LEDGER_CTE.format(kind=ledger.SET)}
+        SELECT (SELECT book_id FROM batch ORDER BY book_id DESC LIMIT 1) AS last_id,
+               (SELECT count(*) FROM batch) AS staged,
+               (SELECT count(*) FROM locked) AS known,
+               (SELECT count(*) FROM applied) AS applied
+    """,
+    # Signed delta — same semantics as POST /admin/stock/{book_id}/adjust.
+    "delta": f"""
+        WITH batch AS (
+            SELECT book_id, value FROM {_MERGED}
+            WHERE book_id > :after ORDER BY book_id LIMIT :chunk
+        ), locked AS (
+            SELECT i.book_id, i.quantity, i.reserved FROM inventory i JOIN batch b USING (book_id)
+            ORDER BY i.book_id FOR UPDATE OF i
+        ), applied AS (
+            UPDATE inventory i SET quantity = i.quantity + b.value, updated_at = now()
+            FROM batch b JOIN locked l USING (book_id)
+            WHERE i.book_id = b.book_id AND i.quantity + b.value BETWEEN 0 AND {_INT4_MAX}
+            RETURNING i.book_id, i.quantity, i.reserved, l.quantity AS old_quantity, l.reserved AS old_reserved
+        ), {_LEDGER_CTE.format(kind=ledger.ADJUST)}
+        SELECT (SELECT book_id FROM batch ORDER BY book_id DESC LIMIT 1) AS last_id,
+               (SELECT count(*) FROM batch) AS staged,
+               (SELECT count(*) FROM locked) AS known,
+               (SELECT count(*) FROM applied) AS applied
+    """,
+}
+
+_COLLAPSE_SQL = {
+    "set": f"""
+        CREATE TEMP TABLE {_MERGED} AS
+        SELECT DISTINCT ON (book_id) book_id, value FROM {_STAGING}
+        ORDER BY book_id, line_no DESC
+    """,
+    "delta": f"""
+        CREATE TEMP TABLE {_MERGED} AS
+        SELECT book_id, sum(value) AS value FROM {_STAGING} GROUP BY book_id
+    """,
+}
+
+
+async def import_stock(
+    conn: AsyncConnection,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    mode: str,
+    chunk_size: int,
+) -> ImportSummary:
+    """Stream ``chunks`` into a staging table and merge it into ``inventory``.
+
+    ``conn`` must be a dedicated connection (not a pooled ORM session) because the
+    staging tables are session-local and survive the per-chunk commits.
+    """
+    summary = ImportSummary(mode=mode)
+    raw = (await conn.get_raw_connection()).driver_connection
+    try:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {_STAGING}, {_MERGED}"))
+        await conn.execute(text(f"CREATE TEMP TABLE {_STAGING} (line_no int, book_id uuid, value int)"))
+        await raw.copy_records_to_table(
+            _STAGING,
+            records=_staged_records(iter_lines(chunks), fmt, summary),
+            columns=["line_no", "book_id", "value"],
+        )
+        await conn.execute(text(_COLLAPSE_SQL[mode]))
+        await conn.execute(text(f"ALTER TABLE {_MERGED} ADD PRIMARY KEY (book_id)"))
+        await conn.commit()
+
+        after = UUID(int=0)
+        merge = text(_MERGE_SQL[mode])
+        while True:
+            await set_timeouts(conn, "import")
+            row = (await conn.execute(merge, {"after": after, "chunk": chunk_size})).one()
+            await conn.commit()
+            if not row.staged:
+                break
+            summary.applied += row.applied
+            summary.unknown += row.staged - row.known
+            # delta mode: known rows that would go negative or past int4 are rejected in SQL
+            summary.rejected += row.known - row.applied
+            after = row.last_id
+    finally:
+        await conn.rollback()
+        await conn.execute(text(f"DROP TABLE IF EXISTS {_STAGING}, {_MERGED}"))
+        await conn.commit()
+
+    logger.info(
+        "Stock import (%s) finished: received=%d applied=%d unknown=%d rejected=%d",
+        mode, summary.received, summary.applied, summary.unknown, summary.rejected,
+    )
+    return summary
@@ -0,0 +1,37 @@
+"""Inventory change feed — rows changed since a version, never skipping a commit.
+
+``inventory.version`` is the id of the transaction that last wrote the row (trigger from
+migration 006). Every transaction id below the reader's snapshot ``xmin`` has finished,
+so reading only versions under that high-water mark can't miss a change that commits
+late. Rows from one transaction share a version; (version, book_id) orders them.
+Used by ``GET /stock/changes`` and the in-memory availability index.
+"""
+from uuid import UUID
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.inventory import Inventory
+
+_HIGH_WATER_SQL = text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+
+
+async def high_water(db: AsyncSession) -> int:
+    return await db.scalar(_HIGH_WATER_SQL)
+
+
+async def changes(
+    db: AsyncSession, since: int, after: UUID | None, size: int, high_water: int
+) -> list[Inventory]:
+    """Up to ``size`` rows after (``since``, ``after``) and below ``high_water``, in order."""
+    if after is None:
+        position = Inventory.version >= since
+    else:
+        position = tuple_(Inventory.version, Inventory.book_id) > tuple_(since, after)
+    result = await db.execute(
+        select(Inventory)
+        .where(position, Inventory.version < high_water)
+        .order_by(Inventory.version, Inventory.book_id)
+        .limit(size)
+    )
+    return list(result.scalars().all())
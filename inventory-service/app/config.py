@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -6,8 +8,95 @@ class Settings(BaseSettings):
     keycloak_jwks_uri: str
     keycloak_issuer_uri: str
     jwt_audience: str = "account"
+    jwt_claims_cache_size: int = 10000
+    jwt_claims_cache_max_ttl_seconds: int = 300
+    jwks_refresh_interval_seconds: int = 240
+    jwks_refetch_min_interval_seconds: float = 10.0
+    jwks_http_timeout_seconds: float = 5.0
     kafka_bootstrap_servers: str
     kafka_group_id: str = "inventory-service"
+    # Shutdown: time the message in hand gets to finish before the consumer is cancelled.
+    # Runs after uvicorn's --timeout-graceful-shutdown; keep the sum under the pod's
+    # terminationGracePeriodSeconds.
+    consumer_drain_timeout_seconds: float = 5.0
+    # "all": the API process also runs the Kafka consumers and the periodic jobs (one
+    # uvicorn worker only). "api": HTTP only; run `python -m app.worker` for the rest.
+    service_role: Literal["all", "api"] = "all"
+    worker_metrics_port: int = 9100
+    # /health/ready fails until startup warm-up (pool, hot statements, JWKS) has finished
+    # or this much time has passed. WARMUP_PRELOAD_STOCK_ROWS > 0 also reads that many of
+    # the most recently updated stock rows into the Postgres buffer cache.
+    warmup_timeout_seconds: float = 15.0
+    warmup_preload_stock_rows: int = 0
+    # Background evaluator behind /health/ready (the probe itself does no I/O)
+    health_check_interval_seconds: float = 5.0
+    health_check_timeout_seconds: float = 2.0
+    health_max_consumer_lag: int = 1000
+    # Admission control (app/middleware/admission.py): slots shared by reserve/admin
+    # writes and public stock reads; reads past their limit and short queue get 503.
+    admission_enabled: bool = True
+    admission_capacity: int = 15
+    admission_read_limit: int = 10
+    admission_read_queue_size: int = 20
+    admission_read_queue_timeout_ms: int = 200
+    admission_write_queue_size: int = 200
+    admission_write_queue_timeout_ms: int = 5000
+    admission_retry_after_seconds: int = 1
+    admission_adaptive_read_limit: bool = False
+    admission_read_latency_target_ms: int = 100
+    # lock_timeout / statement_timeout (ms, 0 = none) for each writer transaction, by
+    # endpoint; expiring answers 503 with Retry-After (app.database.writer_db).
+    # "import" applies to each merge chunk of POST /admin/stock/import.
+    db_lock_timeout_ms: dict[str, int] = {
+        "reserve": 1000, "set": 3000, "adjust": 3000, "adjust_batch": 5000, "import": 5000,
+    }
+    db_statement_timeout_ms: dict[str, int] = {
+        "reserve": 3000, "set": 5000, "adjust": 5000, "adjust_batch": 30000, "import": 30000,
+    }
+    db_timeout_retry_after_seconds: int = 1
+    # Idempotency-Key on POST /stock/reserve: keys kept at least this long, then pruned
+    # by the worker in batches; replays are cached in-process for a short while.
+    idempotency_key_ttl_hours: int = 24
+    idempotency_prune_interval_seconds: int = 600
+    idempotency_prune_batch_size: int = 1000
+    idempotency_cache_size: int = 10000
+    idempotency_cache_ttl_seconds: int = 300
+    # Flat combining (app/reserve_combiner.py): concurrent reservations of one book are
+    # applied by a single transaction of up to this many requests, gathered for this long.
+    reserve_combining: bool = False
+    reserve_combine_window_ms: float = 1.0
+    reserve_combine_max_batch: int = 64
+    # In-memory availability index behind GET /stock/availability (app/availability.py):
+    # "low stock" threshold (matches the UI badge) and how often it follows the change feed.
+    availability_low_stock: int = 3
+    availability_refresh_interval_seconds: float = 1.0
+    stock_import_chunk_size: int = 5000
+    stock_export_fetch_size: int = 1000
+    ledger_snapshot_interval_seconds: int = 3600
+    slow_request_threshold_ms: int = 500
+    slow_request_buffer_size: int = 50
+    loop_lag_sample_interval_seconds: float = 0.1
+    loop_stall_threshold_ms: int = 200
+    loop_stall_buffer_size: int = 50
+    log_queue_size: int = 10000
+    log_batch_size: int = 256
+    # JSON object, e.g. LOG_SAMPLE_RATES='{"app.kafka.consumer": 0.1}' keeps 10% of its INFO lines
+    log_sample_rates: dict[str, float] = {}
+    # Head-sampling ratio per server span name ("METHOD /route"), trace_sample_rate otherwise.
+    # Unsampled traces are still exported when they fail or run slower than the threshold.
+    trace_sample_rate: float = 1.0
+    trace_sample_rates: dict[str, float] = {
+        "GET /stock/bulk": 0.05,
+        "GET /stock/{book_id}": 0.1,
+        "GET /health": 0.0,
+        "GET /health/ready": 0.0,
+        "GET /metrics": 0.0,
+    }
+    trace_keep_slower_than_ms: int = 500
+    trace_keep_status_codes: list[int] = [409]
+    trace_export_queue_size: int = 2048
+    trace_export_batch_size: int = 512
+    trace_export_delay_ms: int = 5000
 
     class Config:
         env_file = ".env"
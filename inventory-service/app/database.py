@@ -1,13 +1,112 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from fastapi import Depends, HTTPException, status
+from prometheus_client import Counter
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
 from app.config import settings
+from app.middleware.query_stats import TimedQueuePool, instrument_engine
 
 # Convert sync URL to async URL for asyncpg
 _async_url = settings.database_url.replace("postgresql://", "postgresql+asyncpg://")
 
-engine = create_async_engine(_async_url, pool_size=5, max_overflow=10, pool_pre_ping=True, pool_recycle=1800)
+engine = create_async_engine(
+    _async_url, poolclass=TimedQueuePool, pool_size=5, max_overflow=10, pool_pre_ping=True, pool_recycle=1800
+)
+instrument_engine(engine.sync_engine)
 AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# SQLSTATEs raised when lock_timeout / statement_timeout expire
+_TIMEOUT_KINDS = {"55P03": "lock", "57014": "statement"}
+
+db_timeouts_total = Counter(
+    "inventory_db_timeouts_total",
+    "Writer requests answered 503 because lock_timeout or statement_timeout expired",
+    ["endpoint", "kind"],
+)
+
+
+class Explain(Executable, ClauseElement):
+    """``EXPLAIN (FORMAT JSON) <stmt>`` — lets callers read planner row estimates."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kw) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
 
 async def get_db() -> AsyncSession:
     async with AsyncSessionLocal() as session:
         yield session
+
+
+def timeout_kind(exc: DBAPIError) -> str | None:
+    """``"lock"`` / ``"statement"`` if ``exc`` is an expired lock or statement timeout."""
+    return _TIMEOUT_KINDS.get(getattr(exc.orig, "sqlstate", None))
+
+
+_SET_TIMEOUTS_SQL = text(
+    "SELECT set_config('lock_timeout', :lock, true), set_config('statement_timeout', :statement, true)"
+)
+
+
+def _timeout_params(endpoint: str) -> dict[str, str]:
+    return {
+        "lock": f"{settings.db_lock_timeout_ms.get(endpoint, 0)}ms",
+        "statement": f"{settings.db_statement_timeout_ms.get(endpoint, 0)}ms",
+    }
+
+
+@event.listens_for(Session, "after_begin")
+def _set_timeouts(session: Session, transaction, connection) -> None:
+    """Transaction-local timeouts for sessions handed out by ``writer_db``."""
+    endpoint = session.info.get("writer_endpoint")
+    if endpoint is None:
+        return
+    connection.execute(_SET_TIMEOUTS_SQL, _timeout_params(endpoint))
+
+
+async def set_timeouts(conn: AsyncConnection, endpoint: str) -> None:
+    """``writer_db``'s timeouts for the current transaction of a dedicated connection."""
+    await conn.execute(_SET_TIMEOUTS_SQL, _timeout_params(endpoint))
+
+
+def busy_error(endpoint: str, exc: DBAPIError) -> HTTPException | None:
+    """The 503 with ``Retry-After`` for an expired lock or statement timeout (counted in
+    ``inventory_db_timeouts_total``), or None for any other database error."""
+    kind = timeout_kind(exc)
+    if kind is None:
+        return None
+    db_timeouts_total.labels(endpoint=endpoint, kind=kind).inc()
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"Stock row busy ({kind} timeout), retry later",
+        headers={"Retry-After": str(settings.db_timeout_retry_after_seconds)},
+    )
+
+
+def writer_db(endpoint: str):
+    """``get_db`` for writers. Every transaction runs with the endpoint's ``lock_timeout``
+    and ``statement_timeout`` (``DB_LOCK_TIMEOUT_MS`` / ``DB_STATEMENT_TIMEOUT_MS``, 0 = no
+    limit), so a hot row held by a consumer batch or a bulk job cannot stall the request
+    indefinitely. Either timeout answers 503 with ``Retry-After`` — nothing was written."""
+
+    async def get_writer_db(session: AsyncSession = Depends(get_db)) -> AsyncSession:
+        session.info["writer_endpoint"] = endpoint
+        try:
+            yield session
+        except DBAPIError as exc:
+            error = busy_error(endpoint, exc)
+            if error is None:
+                raise
+            raise error from exc
+
+    return get_writer_db
@@ -0,0 +1,132 @@
+"""Background health evaluator behind ``/health/ready``.
+
+Every kubelet probe used to check out a pooled connection and run ``SELECT 1``. Instead,
+one coroutine per process checks the dependencies every ``HEALTH_CHECK_INTERVAL_SECONDS``
+and caches the results; the probe only reads them. Checks:
+
+  - ``database``: ``SELECT 1`` within ``HEALTH_CHECK_TIMEOUT_SECONDS``.
+  - ``consumers`` (``SERVICE_ROLE=all``): the consumer and snapshot tasks are still
+    running. The supervisors restart on broker errors, so a finished task means a bug.
+    Whether the order consumer is connected is reported but does not fail readiness —
+    a Kafka outage must not take the stock read API down with it.
+  - ``consumer_lag``: messages the order consumer is behind; ``warn`` above
+    ``HEALTH_MAX_CONSUMER_LAG``. Informational too: unready pods drain HTTP traffic,
+    which does nothing for lag.
+
+Results older than three intervals count as failing, so a stuck evaluator cannot keep
+a pod in rotation.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from prometheus_client import Gauge
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import engine
+from app.kafka import consumer
+
+logger = logging.getLogger(__name__)
+
+_STALE_AFTER_INTERVALS = 3
+_FAILING_DETAIL = {"database": "database unreachable", "consumers": "background task stopped"}
+
+health_check_up = Gauge(
+    "inventory_health_check_up",
+    "1 if the last background health check passed (warn counts as passed)",
+    ["check"],
+)
+health_check_last_run = Gauge(
+    "inventory_health_check_last_run_timestamp_seconds",
+    "Unix time of the last background health check",
+    ["check"],
+)
+
+# check name → {"status": ok | warn | failing, "checked_at": ISO time, ...}
+_results: dict[str, dict] = {}
+_checked_at: dict[str, float] = {}  # check name → time.monotonic() of the last run
+
+
+def _record(check: str, status: str, **detail) -> None:
+    _results[check] = {"status": status, "checked_at": datetime.now(timezone.utc).isoformat(), **detail}
+    _checked_at[check] = time.monotonic()
+    health_check_up.labels(check=check).set(0 if status == "failing" else 1)
+    health_check_last_run.labels(check=check).set_to_current_time()
+
+
+async def _check_database() -> None:
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(settings.health_check_timeout_seconds):
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+    except Exception as exc:
+        error = str(exc) or type(exc).__name__
+        logger.error("Readiness check failed: %s", error)
+        _record("database", "failing", error=error)
+        return
+    _record("database", "ok", latency_ms=round((time.perf_counter() - started) * 1000, 1))
+
+
+def _check_consumers(tasks: list[asyncio.Task]) -> None:
+    stopped = [task.get_name() for task in tasks if task.done()]
+    _record(
+        "consumers",
+        "failing" if stopped else "ok",
+        stopped=stopped,
+        order_consumer_connected=consumer.is_connected(),
+    )
+
+
+async def _check_consumer_lag() -> None:
+    try:
+        async with asyncio.timeout(settings.health_check_timeout_seconds):
+            lag = await consumer.lag()
+    except Exception as exc:
+        _record("consumer_lag", "warn", error=str(exc) or type(exc).__name__)
+        return
+    if lag is None:
+        _record("consumer_lag", "warn", lag=None)
+        return
+    consumer.consumer_lag_messages.set(lag)
+    _record("consumer_lag", "warn" if lag > settings.health_max_consumer_lag else "ok", lag=lag)
+
+
+async def check_once(tasks: list[asyncio.Task]) -> None:
+    await _check_database()
+    if tasks:
+        _check_consumers(tasks)
+        await _check_consumer_lag()
+
+
+async def run_checker(tasks: list[asyncio.Task]) -> None:
+    """Re-evaluate the checks forever. ``tasks`` are the background tasks this process
+    runs itself (empty with ``SERVICE_ROLE=api``)."""
+    _results.clear()
+    _checked_at.clear()
+    while True:
+        try:
+            await check_once(tasks)
+        except Exception as exc:  # never let the evaluator die; stale results fail readiness
+            logger.error("Health evaluation failed: %s", exc, exc_info=True)
+        await asyncio.sleep(settings.health_check_interval_seconds)
+
+
+def readiness() -> tuple[bool, dict]:
+    """The cached verdict and response body. O(1), no I/O."""
+    if "database" not in _results:
+        return False, {"status": "not ready", "detail": "health checks pending", "checks": {}}
+    stale_after = settings.health_check_interval_seconds * _STALE_AFTER_INTERVALS
+    now = time.monotonic()
+    problems = []
+    for check, result in _results.items():
+        if now - _checked_at[check] > stale_after:
+            problems.append(f"{check} check stale")
+        elif result["status"] == "failing":
+            problems.append(_FAILING_DETAIL.get(check, f"{check} failing"))
+    body = {"status": "not ready" if problems else "ready", "checks": dict(_results)}
+    if problems:
+        body["detail"] = "; ".join(problems)
+    return not problems, body
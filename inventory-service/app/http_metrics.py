@@ -0,0 +1,82 @@
+"""HTTP request metrics with trace exemplars, served in OpenMetrics format.
+
+Same series as ``prometheus_fastapi_instrumentator.metrics.default()`` (dashboards keep
+working), but both latency histograms carry a ``trace_id`` exemplar for requests whose
+trace reaches the collector, so a p99 spike links straight to a slow trace. Exemplars
+are only rendered in the OpenMetrics exposition format, which Prometheus asks for in
+its ``Accept`` header.
+
+Label cardinality is bounded: ``handler`` is the route template (unmatched paths are
+grouped as ``none`` by the instrumentator), ``status`` is grouped to ``2xx``/``4xx``/...,
+and methods outside the standard set are reported as ``other``.
+
+With several uvicorn workers (``SERVICE_ROLE=api``) set ``PROMETHEUS_MULTIPROC_DIR`` so
+``/metrics`` aggregates every worker; the multiprocess collector drops exemplars.
+"""
+import os
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, Summary, multiprocess
+from prometheus_client.exposition import choose_encoder
+from prometheus_fastapi_instrumentator.metrics import Info
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app import telemetry
+from app.config import settings
+
+_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+http_requests_total = Counter(
+    "http_requests_total",
+    "Total number of requests by method, status and handler.",
+    ["method", "status", "handler"],
+)
+http_request_size_bytes = Summary(
+    "http_request_size_bytes",
+    "Content length of incoming requests by handler. Only value of header is respected.",
+    ["handler"],
+)
+http_response_size_bytes = Summary(
+    "http_response_size_bytes",
+    "Content length of outgoing responses by handler. Only value of header is respected.",
+    ["handler"],
+)
+http_request_duration_highr_seconds = Histogram(
+    "http_request_duration_highr_seconds",
+    "Latency with many buckets but no API specific labels, for accurate percentiles.",
+    buckets=(0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5, 7.5, 10, 30, 60),
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Latency with only few buckets by handler, for per-route SLIs.",
+    ["method", "handler"],
+    buckets=(0.1, 0.5, 1),
+)
+
+
+def instrumentation(info: Info) -> None:
+    """``Instrumentator().add(...)`` callback — runs inside the request's server span."""
+    method = info.method if info.method in _METHODS else "other"
+    handler = info.modified_handler
+    duration = info.modified_duration
+    status = info.response.status_code
+
+    http_requests_total.labels(method, info.modified_status, handler).inc()
+    http_request_size_bytes.labels(handler).observe(int(info.request.headers.get("Content-Length", 0)))
+    http_response_size_bytes.labels(handler).observe(int(info.response.headers.get("Content-Length", 0)))
+
+    exemplar = telemetry.trace_exemplar(
+        duration, failed=status >= 500 or status in settings.trace_keep_status_codes
+    )
+    http_request_duration_highr_seconds.observe(duration, exemplar)
+    http_request_duration_seconds.labels(method, handler).observe(duration, exemplar)
+
+
+def metrics(request: Request) -> Response:
+    """Prometheus metrics — OpenMetrics (with exemplars) when the scraper accepts it."""
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    encoder, content_type = choose_encoder(request.headers.get("Accept", ""))
+    return Response(encoder(registry), headers={"Content-Type": content_type})
@@ -0,0 +1,174 @@
+"""Idempotency keys for ``POST /stock/reserve``.
+
+A caller that retries a reservation (timeout, mTLS reset) with the same
+``Idempotency-Key`` gets the first attempt's response instead of a second reservation.
+The key is claimed at the start of the reservation's transaction with
+``INSERT ... ON CONFLICT DO NOTHING`` and the response is written to the same row
+before commit, so the key exists exactly when the reservation does. A duplicate that
+arrives while the first attempt is still running waits on the unique index — not on
+the inventory row — and replays the committed response once it lands.
+
+Only successful reservations are stored: 404 and 409 change nothing, so running them
+again is already safe and may legitimately succeed after a restock.
+
+Replays are served from a bounded in-process TTL cache when possible, otherwise from
+the ``reserve_idempotency`` table. Keys are kept at least ``IDEMPOTENCY_KEY_TTL_HOURS``;
+the worker prunes older ones in small batches.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from uuid import UUID
+
+from cachetools import TTLCache
+from prometheus_client import Counter
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.idempotency import ReserveIdempotency
+
+logger = logging.getLogger(__name__)
+
+idempotent_replays_total = Counter(
+    "inventory_reserve_idempotent_replays_total",
+    "Reserve requests answered with a stored response (source: cache, db)",
+    ["source"],
+)
+idempotency_pruned_total = Counter(
+    "inventory_reserve_idempotency_pruned_total",
+    "Expired reserve idempotency keys deleted",
+)
+
+_PRUNE_SQL = text("""
+    DELETE FROM reserve_idempotency WHERE key IN (
+        SELECT key FROM reserve_idempotency
+        WHERE created_at < now() - make_interval(hours => :ttl_hours)
+        ORDER BY created_at
+        LIMIT :batch
+        FOR UPDATE SKIP LOCKED
+    )
+""")
+
+
+@dataclass(frozen=True)
+class StoredReservation:
+    book_id: UUID
+    quantity: int
+    response: dict
+
+    def matches(self, book_id: UUID, quantity: int) -> bool:
+        return self.book_id == book_id and self.quantity == quantity
+
+
+_cache: TTLCache = TTLCache(maxsize=settings.idempotency_cache_size, ttl=settings.idempotency_cache_ttl_seconds)
+
+
+def cached(key: str) -> StoredReservation | None:
+    stored = _cache.get(key)
+    if stored is not None:
+        idempotent_replays_total.labels(source="cache").inc()
+    return stored
+
+
+def remember(key: str, book_id: UUID, quantity: int, response: dict) -> None:
+    """Cache a reservation once its transaction has committed."""
+    _cache[key] = StoredReservation(book_id, quantity, response)
+
+
+async def claim(db: AsyncSession, key: str, book_id: UUID, quantity: int) -> StoredReservation | None:
+    """Claim ``key`` in the caller's transaction. ``None`` means the caller owns the key
+    and goes on to reserve; otherwise the earlier reservation made with it."""
+    for _ in range(2):  # the stored row may be pruned between the conflict and the read
+        claimed = await db.scalar(
+            insert(ReserveIdempotency)
+            .values(key=key, book_id=book_id, quantity=quantity)
+            .on_conflict_do_nothing(index_elements=["key"])
+            .returning(ReserveIdempotency.key)
+        )
+        if claimed is not None:
+            return None
+        row = (await db.execute(
+            select(ReserveIdempotency).where(ReserveIdempotency.key == key)
+        )).scalar_one_or_none()
+        if row is not None:
+            idempotent_replays_total.labels(source="db").inc()
+            stored = StoredReservation(row.book_id, row.quantity, row.response)
+            _cache[key] = stored
+            return stored
+    raise RuntimeError(f"Idempotency key {key!r} neither claimable nor stored")
+
+
+async def claim_many(db: AsyncSession, requests: list[tuple[str, UUID, int]]) -> dict[str, StoredReservation]:
+    """``claim`` for a batch of distinct keys in one statement (used by the reserve
+    combiner). Returns the stored reservations for keys that were already taken; the
+    rest are now claimed. A key pruned between the conflict and the read is an error
+    here rather than a retry — the whole batch rolls back and each caller retries."""
+    claimed = set((await db.scalars(
+        insert(ReserveIdempotency)
+        .values([{"key": key, "book_id": book_id, "quantity": quantity} for key, book_id, quantity in requests])
+        .on_conflict_do_nothing(index_elements=["key"])
+        .returning(ReserveIdempotency.key)
+    )).all())
+    taken = [key for key, _, _ in requests if key not in claimed]
+    if not taken:
+        return {}
+    stored = {}
+    for row in (await db.scalars(select(ReserveIdempotency).where(ReserveIdempotency.key.in_(taken)))).all():
+        stored[row.key] = _cache[row.key] = StoredReservation(row.book_id, row.quantity, row.response)
+    if len(stored) < len(taken):  # pruned between the conflict and the read
+        raise RuntimeError(f"Idempotency keys neither claimable nor stored: {set(taken) - set(stored)}")
+    idempotent_replays_total.labels(source="db").inc(len(stored))
+    return stored
+
+
+async def record(db: AsyncSession, key: str, response: dict) -> None:
+    """Store the response on the claimed row, in the reservation's transaction."""
+    await db.execute(
+        update(ReserveIdempotency).where(ReserveIdempotency.key == key).values(response=response)
+    )
+
+
+async def record_many(db: AsyncSession, responses: dict[str, dict]) -> None:
+    """Store several responses by key in one executemany round trip."""
+    await db.execute(
+        update(ReserveIdempotency), [{"key": key, "response": body} for key, body in responses.items()]
+    )
+
+
+async def release_many(db: AsyncSession, keys: list[str]) -> None:
+    """Drop claims whose reservation was refused (only successes are stored)."""
+    await db.execute(delete(ReserveIdempotency).where(ReserveIdempotency.key.in_(keys)))
+
+
+async def prune_once() -> int:
+    """Delete expired keys, ``idempotency_prune_batch_size`` per transaction."""
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            deleted = (await db.execute(_PRUNE_SQL, {
+                "ttl_hours": settings.idempotency_key_ttl_hours,
+                "batch": settings.idempotency_prune_batch_size,
+            })).rowcount
+            await db.commit()
+        total += deleted
+        idempotency_pruned_total.inc(deleted)
+        if deleted < settings.idempotency_prune_batch_size:
+            break
+    if total:
+        logger.info("Pruned %d expired reserve idempotency keys", total)
+    return total
+
+
+async def run_pruner() -> None:
+    """Prune expired keys every ``idempotency_prune_interval_seconds``."""
+    while True:
+        await asyncio.sleep(settings.idempotency_prune_interval_seconds)
+        try:
+            await prune_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error("Idempotency key pruning failed: %s — retrying next interval", exc)
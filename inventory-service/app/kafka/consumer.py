@@ -2,12 +2,15 @@
 import asyncio
 import json
 import logging
+import time
 from datetime import datetime, timezone
 from uuid import UUID
 
 from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from prometheus_client import Counter, Gauge, Histogram
 from sqlalchemy import select
 
+from app import ledger, telemetry
 from app.config import settings
 from app.database import AsyncSessionLocal
 from app.models.inventory import Inventory
@@ -20,6 +23,34 @@ _BACKOFF_FACTOR = 2.0
 _DLQ_TOPIC = "order.created.dlq"
 _MAX_RETRIES = 3
 
+consumer_processing_seconds = Histogram(
+    "inventory_consumer_processing_seconds",
+    "Time to process one order.created message, retries and DLQ hand-off included",
+    ["outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+consumer_drain_seconds = Histogram(
+    "inventory_consumer_drain_seconds",
+    "Time from the start of a shutdown drain until the consumer left its group",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+consumer_drain_abandoned_total = Counter(
+    "inventory_consumer_drain_abandoned_total",
+    "Messages still being processed when the drain deadline passed (redelivered later)",
+)
+consumer_lag_messages = Gauge(
+    "inventory_consumer_lag_messages",
+    "order.created messages behind the log end on this consumer's partitions (health checker)",
+)
+
+# Set by drain(): stop fetching once the message in hand is done. Created per run so
+# it belongs to the running loop.
+_stopping: asyncio.Event | None = None
+_in_flight = False
+_backing_off = False
+# The started consumer while _run_consumer_loop is connected; read by lag().
+_consumer: AIOKafkaConsumer | None = None
+
 
 async def _deduct_stock(order_event: dict) -> None:
     order_id = order_event.get("orderId")
@@ -49,6 +80,11 @@ async def _deduct_stock(order_event: dict) -> None:
             prev_qty = inv.quantity
             inv.quantity -= quantity
             await session.flush()
+            await ledger.record_movement(
+                session, book_id, ledger.DEDUCT,
+                quantity_delta=-quantity, quantity_after=inv.quantity, reserved_after=inv.reserved,
+                ref=order_id,
+            )
 
             yield {
                 "bookId": str(book_id),
@@ -123,42 +159,129 @@ async def _run_consumer_loop() -> None:
         value_serializer=lambda v: json.dumps(v).encode("utf-8"),
     )
 
+    global _consumer
     await consumer.start()
     await producer.start()
     logger.info("Inventory Kafka consumer started.")
 
+    _consumer = consumer
     try:
-        async for msg in consumer:
-            order_event = msg.value
-            logger.info("Received order.created event: orderId=%s", order_event.get("orderId"))
-
-            await _process_message_with_retry(order_event, producer, msg)
-
-            # Always commit offset — failed messages go to DLQ, don't block the consumer.
-            # Wrapped in try/except: if commit fails, reprocessing is safe because
-            # _deduct_stock uses SELECT ... FOR UPDATE and checks inv.available < quantity.
-            try:
-                await consumer.commit()
-            except Exception as exc:
-                logger.error(
-                    "Failed to commit offset for orderId=%s: %s — may be reprocessed on restart",
-                    order_event.get("orderId"), exc,
-                )
+        while (msg := await _next_message(consumer)) is not None:
+            await _handle(msg, consumer, producer)
     finally:
+        _consumer = None
+        # Leaves the group (partitions are reassigned at once) and flushes the producer.
         await consumer.stop()
         await producer.stop()
 
 
+async def _next_message(consumer: AIOKafkaConsumer):
+    """Next record, or ``None`` once a drain has started. A record fetched in the same
+    instant is left uncommitted and redelivered to the next owner of its partition."""
+    if _stopping.is_set():
+        return None
+    fetch = asyncio.ensure_future(consumer.getone())
+    stop = asyncio.ensure_future(_stopping.wait())
+    try:
+        await asyncio.wait({fetch, stop}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        fetch.cancel()
+        stop.cancel()
+    if _stopping.is_set() or fetch.cancelled():
+        return None
+    return fetch.result()
+
+
+async def _handle(msg, consumer: AIOKafkaConsumer, producer: AIOKafkaProducer) -> None:
+    """Process one record and commit its offset."""
+    global _in_flight
+    order_event = msg.value
+    logger.info("Received order.created event: orderId=%s", order_event.get("orderId"))
+    _in_flight = True
+    try:
+        started = time.perf_counter()
+        with telemetry.consumer_span("order.created process", msg.headers) as span:
+            processed = await _process_message_with_retry(order_event, producer, msg)
+            if not processed:
+                telemetry.mark_failed(span, "sent to DLQ")
+            elapsed = time.perf_counter() - started
+            consumer_processing_seconds.labels(outcome="processed" if processed else "dead_lettered").observe(
+                elapsed, telemetry.trace_exemplar(elapsed, failed=not processed)
+            )
+
+        # Always commit offset — failed messages go to DLQ, don't block the consumer.
+        # Wrapped in try/except: if commit fails, reprocessing is safe because
+        # _deduct_stock uses SELECT ... FOR UPDATE and checks inv.available < quantity.
+        try:
+            await consumer.commit()
+        except Exception as exc:
+            logger.error(
+                "Failed to commit offset for orderId=%s: %s — may be reprocessed on restart",
+                order_event.get("orderId"), exc,
+            )
+    finally:
+        _in_flight = False
+
+
+def is_connected() -> bool:
+    return _consumer is not None
+
+
+async def lag() -> int | None:
+    """Messages between the consumed position and the last fetched high-water mark on
+    the assigned partitions; ``None`` while not connected. No broker round trip."""
+    consumer = _consumer
+    if consumer is None:
+        return None
+    total = 0
+    for tp in consumer.assignment():
+        end = consumer.highwater(tp)
+        if end is not None:
+            total += max(end - await consumer.position(tp), 0)
+    return total
+
+
+async def drain(task: asyncio.Task, timeout: float) -> None:
+    """Shut the consumer down without cutting a message off halfway.
+
+    Fetching stops at once; the message being processed (DB transaction, event
+    publish, offset commit) gets up to ``timeout`` seconds to finish, then the
+    consumer leaves its group. Past the deadline the task is cancelled and the
+    message counted as abandoned — it is redelivered, and reprocessing is safe.
+    """
+    started = time.monotonic()
+    if _stopping is not None:
+        _stopping.set()
+    # Nothing to finish while waiting out a restart backoff.
+    done, _ = await asyncio.wait({task}, timeout=0 if _backing_off else timeout)
+    if not done and not _backing_off:
+        if _in_flight:
+            consumer_drain_abandoned_total.inc()
+        logger.warning("Kafka consumer did not drain within %.1fs — cancelling", timeout)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    consumer_drain_seconds.observe(time.monotonic() - started)
+    logger.info("Kafka consumer drained in %.2fs", time.monotonic() - started)
+
+
 async def run_consumer_supervised() -> None:
     """Supervised consumer with exponential backoff restart on errors.
 
-    On CancelledError (graceful shutdown), exits without restart.
+    Returns once ``drain()`` has stopped it; on CancelledError, exits without restart.
     On any other exception, logs the error, waits with exponential backoff, and restarts.
     """
+    global _stopping, _backing_off
+    _stopping = asyncio.Event()
     backoff = _BACKOFF_INITIAL
-    while True:
+    while not _stopping.is_set():
         try:
             await _run_consumer_loop()
+            if _stopping.is_set():
+                logger.info("Kafka consumer drained — left the consumer group.")
+                return
             # Consumer exited normally (shouldn't happen in practice) — restart
             logger.warning("Kafka consumer exited normally, restarting...")
             backoff = _BACKOFF_INITIAL
@@ -170,5 +293,9 @@ async def run_consumer_supervised() -> None:
                 "Kafka consumer crashed: %s — restarting in %.1fs",
                 exc, backoff, exc_info=True,
             )
-            await asyncio.sleep(backoff)
+            _backing_off = True
+            try:
+                await asyncio.sleep(backoff)
+            finally:
+                _backing_off = False
             backoff = min(backoff * _BACKOFF_FACTOR, _BACKOFF_MAX)
@@ -1,11 +1,21 @@
-"""DLQ consumer — monitors order.created.dlq for failed messages and exposes them via admin API."""
+"""DLQ consumer and reader for order.created.dlq.
+
+The consumer (run by the worker) logs and counts each dead-lettered message as it
+arrives. The admin API does not depend on it: ``read_dlq_messages`` and
+``retry_dlq_message`` read the topic directly, so every API process sees the same
+messages however many there are.
+
+A message's ``id`` is its position in the topic — ``partition * 2**48 + offset``,
+i.e. just the offset on partition 0 — so it stays valid across processes and restarts
+for as long as the topic retains the message.
+"""
 import asyncio
 import json
 import logging
-from collections import deque
 from datetime import datetime, timezone
 
-from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
+from aiokafka import AIOKafkaConsumer, AIOKafkaProducer, TopicPartition
+from prometheus_client import Counter
 
 from app.config import settings
 
@@ -17,36 +27,93 @@ _BACKOFF_FACTOR = 2.0
 _DLQ_TOPIC = "order.created.dlq"
 _SOURCE_TOPIC = "order.created"
 _MAX_STORED = 100
+_READ_TIMEOUT_MS = 5000
+_PARTITION_SHIFT = 48
 
+dlq_messages_total = Counter(
+    "inventory_dlq_messages_total",
+    "Messages seen arriving on order.created.dlq",
+)
 
-class DlqMonitor:
-    """Stores last N DLQ messages in-memory for admin inspection and supports retry."""
 
-    def __init__(self):
-        self._messages: deque[dict] = deque(maxlen=_MAX_STORED)
-        self._total_count: int = 0
+def message_id(partition: int, offset: int) -> int:
+    return (partition << _PARTITION_SHIFT) | offset
 
-    @property
-    def total_count(self) -> int:
-        return self._total_count
 
-    @property
-    def messages(self) -> list[dict]:
-        return list(self._messages)
+def _entry(msg) -> dict:
+    return {
+        "id": message_id(msg.partition, msg.offset),
+        "offset": msg.offset,
+        "partition": msg.partition,
+        "timestamp": datetime.fromtimestamp(msg.timestamp / 1000, tz=timezone.utc).isoformat(),
+        "event": msg.value,
+    }
 
-    def add(self, msg: dict) -> None:
-        self._total_count += 1
-        self._messages.append(msg)
 
-    def get_by_id(self, msg_id: int) -> dict | None:
-        for m in self._messages:
-            if m.get("id") == msg_id:
-                return m
-        return None
+def _reader() -> AIOKafkaConsumer:
+    """Group-less consumer: partitions are assigned explicitly and nothing is committed."""
+    return AIOKafkaConsumer(
+        bootstrap_servers=settings.kafka_bootstrap_servers,
+        group_id=None,
+        value_deserializer=lambda m: json.loads(m.decode("utf-8")),
+        enable_auto_commit=False,
+    )
 
 
-# Singleton instance — shared with admin API
-dlq_monitor = DlqMonitor()
+async def read_dlq_messages(limit: int = _MAX_STORED) -> tuple[int, list[dict]]:
+    """Return the number of messages retained in the DLQ topic and the last ``limit``
+    of them, oldest first."""
+    reader = _reader()
+    await reader.start()
+    try:
+        await reader.topics()  # loads metadata for partitions_for_topic
+        partitions = [TopicPartition(_DLQ_TOPIC, p) for p in reader.partitions_for_topic(_DLQ_TOPIC) or ()]
+        if not partitions:
+            return 0, []
+        reader.assign(partitions)
+        beginning = await reader.beginning_offsets(partitions)
+        end = await reader.end_offsets(partitions)
+        for tp in partitions:
+            reader.seek(tp, max(beginning[tp], end[tp] - limit))
+
+        messages = []
+        remaining = {tp for tp in partitions if end[tp] > beginning[tp]}
+        while remaining:
+            batches = await reader.getmany(*remaining, timeout_ms=_READ_TIMEOUT_MS)
+            if not batches:
+                logger.warning("Timed out reading %s; returning a partial list", _DLQ_TOPIC)
+                break
+            for tp, records in batches.items():
+                messages.extend(_entry(r) for r in records if r.offset < end[tp])
+            for tp in list(remaining):
+                if await reader.position(tp) >= end[tp]:
+                    remaining.discard(tp)
+        messages.sort(key=lambda m: (m["timestamp"], m["partition"], m["offset"]))
+        return sum(end[tp] - beginning[tp] for tp in partitions), messages[-limit:]
+    finally:
+        await reader.stop()
+
+
+async def _fetch_dlq_message(msg_id: int) -> dict | None:
+    tp = TopicPartition(_DLQ_TOPIC, msg_id >> _PARTITION_SHIFT)
+    offset = msg_id & ((1 << _PARTITION_SHIFT) - 1)
+    reader = _reader()
+    await reader.start()
+    try:
+        await reader.topics()
+        if tp.partition not in (reader.partitions_for_topic(_DLQ_TOPIC) or ()):
+            return None
+        reader.assign([tp])
+        beginning = await reader.beginning_offsets([tp])
+        end = await reader.end_offsets([tp])
+        if not beginning[tp] <= offset < end[tp]:
+            return None
+        reader.seek(tp, offset)
+        records = (await reader.getmany(tp, timeout_ms=_READ_TIMEOUT_MS, max_records=1)).get(tp, [])
+        # Compacted or transactional topics can skip offsets; only an exact hit counts.
+        return _entry(records[0]) if records and records[0].offset == offset else None
+    finally:
+        await reader.stop()
 
 
 async def _run_dlq_consumer_loop() -> None:
@@ -64,24 +131,14 @@ async def _run_dlq_consumer_loop() -> None:
 
     try:
         async for msg in consumer:
-            dlq_entry = {
-                "id": dlq_monitor.total_count + 1,
-                "offset": msg.offset,
-                "partition": msg.partition,
-                "timestamp": datetime.fromtimestamp(
-                    msg.timestamp / 1000, tz=timezone.utc
-                ).isoformat(),
-                "receivedAt": datetime.now(timezone.utc).isoformat(),
-                "event": msg.value,
-            }
-            dlq_monitor.add(dlq_entry)
+            dlq_messages_total.inc()
             try:
                 await consumer.commit()
             except Exception as exc:
                 logger.error("Failed to commit DLQ offset: %s — may be reprocessed on restart", exc)
             logger.warning(
                 "DLQ message #%d received: orderId=%s",
-                dlq_entry["id"],
+                message_id(msg.partition, msg.offset),
                 msg.value.get("event", {}).get("orderId", "unknown"),
             )
     finally:
@@ -106,7 +163,7 @@ async def run_dlq_consumer_supervised() -> None:
 
 async def retry_dlq_message(msg_id: int) -> dict | None:
     """Re-publish a DLQ message back to the source topic for reprocessing."""
-    entry = dlq_monitor.get_by_id(msg_id)
+    entry = await _fetch_dlq_message(msg_id)
     if entry is None:
         return None
 
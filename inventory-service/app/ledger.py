@@ -0,0 +1,184 @@
+"""Stock movement ledger — append-only history of every inventory mutation.
+
+Writers call ``record_movement`` inside the transaction that changes ``inventory``
+(set-based writers insert from their ``RETURNING`` rows instead), so the ledger can
+never disagree with the table. A periodic snapshot job compacts the ledger into sparse
+per-book snapshots; point-in-time lookups read one snapshot row plus the ledger rows
+written since, however large the ledger grows.
+
+Snapshot runs are cut at a transaction-id watermark rather than a timestamp (see
+migration 004): ``occurred_at`` is when the writing transaction *started*, so a
+movement can commit long after a run whose ``taken_at`` is later than its
+``occurred_at``. ``xact_id`` can't fall behind a run that way — every transaction below
+the run's ``upto_xact_id`` had finished when the run was cut.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from uuid import UUID
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models.ledger import StockMovement
+
+logger = logging.getLogger(__name__)
+
+RESERVE = "reserve"
+DEDUCT = "deduct"
+SET = "set"
+ADJUST = "adjust"
+
+# Arbitrary constant — only one replica compacts at a time.
+_SNAPSHOT_LOCK_KEY = 0x5704C0
+_PARTITIONS_AHEAD = 2
+
+
+async def record_movement(
+    db: AsyncSession,
+    book_id: UUID,
+    kind: str,
+    *,
+    quantity_delta: int = 0,
+    reserved_delta: int = 0,
+    quantity_after: int,
+    reserved_after: int,
+    ref: str | None = None,
+) -> None:
+    """Append one ledger row in the caller's transaction."""
+    await db.execute(insert(StockMovement).values(
+        book_id=book_id,
+        kind=kind,
+        quantity_delta=quantity_delta,
+        reserved_delta=reserved_delta,
+        quantity_after=quantity_after,
+        reserved_after=reserved_after,
+        ref=ref,
+    ))
+
+
+async def record_movements(db: AsyncSession, movements: list[dict]) -> None:
+    """Append several ledger rows (``record_movement`` fields) in one round trip."""
+    await db.execute(insert(StockMovement), movements)
+
+
+_AS_OF_SQL = text("""
+    WITH snap AS (
+        SELECT s.taken_at, r.upto_xact_id, s.quantity, s.reserved
+        FROM stock_snapshot s JOIN stock_snapshot_run r USING (taken_at)
+        WHERE s.book_id = :book_id AND s.taken_at <= :at
+        ORDER BY s.taken_at DESC LIMIT 1
+    )
+    SELECT snap.taken_at,
+           snap.quantity + coalesce(sum(m.quantity_delta), 0) AS quantity,
+           snap.reserved + coalesce(sum(m.reserved_delta), 0) AS reserved,
+           count(m.id) AS movements
+    FROM snap
+    LEFT JOIN stock_movement m
+           ON m.book_id = :book_id AND m.xact_id >= snap.upto_xact_id AND m.occurred_at <= :at
+    GROUP BY snap.taken_at, snap.quantity, snap.reserved
+""")
+
+
+async def stock_as_of(db: AsyncSession, book_id: UUID, at: datetime):
+    """Return ``(snapshot_taken_at, quantity, reserved, movements)`` at ``at``, or None
+    if ``at`` predates the book's first snapshot."""
+    return (await db.execute(_AS_OF_SQL, {"book_id": book_id, "at": at})).one_or_none()
+
+
+_COMPACT_SQL = text("""
+    WITH moved AS (
+        SELECT book_id, sum(quantity_delta) AS dq, sum(reserved_delta) AS dr
+        FROM stock_movement
+        WHERE xact_id >= :prev_xact_id AND xact_id < :upto_xact_id
+        GROUP BY book_id
+    ), snap AS (
+        INSERT INTO stock_snapshot (book_id, taken_at, quantity, reserved)
+        SELECT moved.book_id, :taken_at,
+               coalesce(prev.quantity, 0) + moved.dq,
+               coalesce(prev.reserved, 0) + moved.dr
+        FROM moved
+        LEFT JOIN LATERAL (
+            SELECT quantity, reserved FROM stock_snapshot s
+            WHERE s.book_id = moved.book_id ORDER BY s.taken_at DESC LIMIT 1
+        ) prev ON true
+        RETURNING 1
+    )
+    INSERT INTO stock_snapshot_run (taken_at, upto_xact_id, books)
+    SELECT :taken_at, :upto_xact_id, count(*) FROM snap
+    RETURNING books
+""")
+
+
+def _month_start(d: date, months_ahead: int = 0) -> date:
+    m = d.month - 1 + months_ahead
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+async def ensure_partitions(today: date) -> None:
+    """Create this month's and the next months' ledger partitions if missing.
+
+    Each CREATE runs in its own short transaction: attaching a partition locks the
+    parent table, which must not be held while the snapshot query runs.
+    """
+    for ahead in range(_PARTITIONS_AHEAD + 1):
+        lo, hi = _month_start(today, ahead), _month_start(today, ahead + 1)
+        name = f"stock_movement_{lo:%Y_%m}"
+        async with AsyncSessionLocal() as db:
+            if (await db.execute(text("SELECT to_regclass(:name)"), {"name": name})).scalar_one():
+                continue
+            await db.execute(text(
+                f"CREATE TABLE {name} PARTITION OF stock_movement "
+                f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+            ))
+            await db.commit()
+        logger.info("Created ledger partition %s", name)
+
+
+async def compact_once() -> int | None:
+    """Take one snapshot of every movement whose transaction has finished. Returns the
+    number of books written, or None if another replica holds the snapshot lock or
+    nothing is due."""
+    async with AsyncSessionLocal() as db:
+        locked = (await db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _SNAPSHOT_LOCK_KEY}
+        )).scalar_one()
+        if not locked:
+            return None
+        # clock_timestamp(), not now(): every transaction below the watermark started
+        # before this statement, so its occurred_at is <= taken_at.
+        upto_xact_id, taken_at = (await db.execute(text(
+            "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint, clock_timestamp()"
+        ))).one()
+        prev = (await db.execute(text(
+            "SELECT taken_at, upto_xact_id FROM stock_snapshot_run ORDER BY taken_at DESC LIMIT 1"
+        ))).one_or_none()
+        if prev is not None and upto_xact_id <= prev.upto_xact_id:
+            await db.rollback()
+            return None
+        books = (await db.execute(_COMPACT_SQL, {
+            "prev_xact_id": prev.upto_xact_id if prev is not None else 0,
+            "upto_xact_id": upto_xact_id,
+            "taken_at": taken_at,
+        })).scalar_one()
+        await db.commit()
+    logger.info(
+        "Stock snapshot taken at %s (%d books moved since %s)",
+        taken_at.isoformat(), books, prev.taken_at if prev is not None else None,
+    )
+    return books
+
+
+async def run_snapshot_job() -> None:
+    """Compact the ledger every ``ledger_snapshot_interval_seconds``."""
+    while True:
+        await asyncio.sleep(settings.ledger_snapshot_interval_seconds)
+        try:
+            await ensure_partitions(datetime.now(timezone.utc).date())
+            await compact_once()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.error("Stock snapshot job failed: %s — retrying next interval", exc)
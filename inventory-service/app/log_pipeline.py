@@ -0,0 +1,224 @@
+"""Non-blocking log pipeline.
+
+Loggers on the event loop only run the sampling filter, render a traceback if the
+record has one, and enqueue the record; a background listener thread formats queued
+records to JSON and writes them to stdout in batches (one ``write`` + ``flush`` per
+batch), and feeds the OTel log handler from the same thread — inside the caller's
+context, captured at enqueue time, so exported records keep their trace and span ids.
+When the queue is full, records are dropped and counted instead of blocking the loop.
+"""
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import traceback
+from types import TracebackType
+from typing import TextIO
+
+from prometheus_client import Counter
+from pythonjsonlogger.json import JsonFormatter
+
+from app.config import settings
+
+log_records_dropped_total = Counter(
+    "inventory_log_records_dropped_total",
+    "Log records discarded before reaching stdout/OTel (overflow = queue full, sampled = per-logger sampling)",
+    ["reason"],
+)
+
+_STOP = object()
+
+
+def render_exception(
+    exc_info: tuple[type[BaseException], BaseException, TracebackType | None],
+) -> str:
+    """``Formatter.formatException`` without the ``^^^^`` column markers.
+
+    On 3.11 every marked frame costs an ``ast.parse`` of its source line, which is
+    slow and not thread-safe (it can corrupt a concurrent ``compile`` on another
+    thread); the markers add nothing to a JSON log line.
+    """
+    exc = traceback.TracebackException(*exc_info)
+    pending, seen = [exc], set()
+    while pending:
+        te = pending.pop()
+        if id(te) in seen:
+            continue
+        seen.add(id(te))
+        for frame in te.stack:
+            frame.colno = frame.end_colno = None
+        pending.extend(e for e in (te.__cause__, te.__context__) if e is not None)
+        pending.extend(getattr(te, "exceptions", None) or ())
+    return "".join(exc.format()).rstrip("\n")
+
+
+def json_formatter() -> JsonFormatter:
+    return JsonFormatter(
+        fmt="%(asctime)s %(levelname)s %(name)s %(message)s %(otelTraceID)s %(otelSpanID)s %(otelTraceSampled)s",
+        rename_fields={
+            "asctime": "timestamp",
+            "levelname": "level",
+            "name": "logger",
+            "otelTraceID": "trace.id",
+            "otelSpanID": "span.id",
+            "otelTraceSampled": "trace.sampled",
+        },
+    )
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO-and-below records for the configured loggers.
+
+    ``rates`` maps a logger name (or dotted prefix) to the fraction kept, e.g.
+    ``{"app.kafka.consumer": 0.1}``. The longest matching prefix wins; WARNING and
+    above are never sampled.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self._rates = rates
+        self._resolved: dict[str, float] = {}
+
+    def _rate_for(self, name: str) -> float:
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            best = -1
+            for prefix, value in self._rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) and len(prefix) > best:
+                    rate, best = value, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not self._rates:
+            return True
+        rate = self._rate_for(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        log_records_dropped_total.labels(reason="sampled").inc()
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped_total.labels(reason="overflow").inc()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args now (they may be mutated after this call returns); JSON formatting
+        # happens on the listener thread. The traceback is rendered here, on the caller's
+        # thread, and cached on the record so that any other handler on this thread reuses
+        # it instead of formatting it with carets (``ast.parse`` is not thread-safe on 3.11).
+        # The caller's context (current span included) travels with the record for the
+        # listener's handlers; underscore attributes stay out of the JSON line.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = render_exception(record.exc_info)
+        record._context = contextvars.copy_context()
+        return record
+
+
+class BatchingQueueListener:
+    """Drains the log queue on a daemon thread, formatting and writing in batches."""
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        stream: TextIO,
+        formatter: logging.Formatter,
+        handlers: list[logging.Handler] | None = None,
+        batch_size: int = 256,
+    ):
+        self.queue = log_queue
+        self._stream = stream
+        self._formatter = formatter
+        self._handlers = handlers or []
+        self._batch_size = batch_size
+        self._thread: threading.Thread | None = None
+
+    def add_handler(self, handler: logging.Handler) -> None:
+        """Attach another handler (e.g. the OTel one once telemetry is up)."""
+        self._handlers = [*self._handlers, handler]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Flush everything queued so far and stop the thread."""
+        if self._thread is None:
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = any(record is _STOP for record in batch)
+            self._emit([record for record in batch if record is not _STOP])
+            if stopping:
+                return
+
+    def _emit(self, records: list[logging.LogRecord]) -> None:
+        lines = []
+        for record in records:
+            # Hide exc_info so the formatter uses the pre-rendered exc_text; other
+            # handlers (OTel) still get the exception object.
+            exc_info, record.exc_info = record.exc_info, None
+            try:
+                lines.append(self._formatter.format(record))
+            except Exception:
+                log_records_dropped_total.labels(reason="error").inc()
+            finally:
+                record.exc_info = exc_info
+            context = record.__dict__.pop("_context", None)
+            for handler in self._handlers:
+                if record.levelno >= handler.level:
+                    if context is None:
+                        handler.handle(record)
+                    else:
+                        context.run(handler.handle, record)
+        if lines:
+            try:
+                self._stream.write("\n".join(lines) + "\n")
+                self._stream.flush()
+            except Exception:
+                log_records_dropped_total.labels(reason="error").inc(len(lines))
+
+
+def configure_logging(extra_handlers: list[logging.Handler] | None = None) -> BatchingQueueListener:
+    """Route the root logger through the queue; ``extra_handlers`` (e.g. the OTel
+    ``LoggingHandler``) run on the listener thread alongside the stdout writer."""
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.log_sample_rates))
+
+    listener = BatchingQueueListener(
+        log_queue, sys.stdout, json_formatter(), extra_handlers, settings.log_batch_size
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
+    logging.root.handlers.clear()
+    logging.root.addHandler(queue_handler)
+    logging.root.setLevel(logging.INFO)
+    return listener
@@ -0,0 +1,95 @@
+"""Event-loop lag monitor with a blocking-call watchdog.
+
+HTTP handlers, both Kafka consumers and the OTel exporters share one asyncio loop, so
+any synchronous work stalls all of them. A sampler coroutine sleeps for a fixed
+interval and records how late it wakes up (the loop lag). A daemon watchdog thread
+watches the sampler's heartbeat; when the loop has been stuck for longer than
+``loop_stall_threshold_ms`` it snapshots the loop thread's stack *while it is still
+blocked*, which points at the offending call rather than whatever ran afterwards.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+from prometheus_client import Counter, Histogram
+
+from app.config import settings
+from app.recent_log import RecentLog
+
+logger = logging.getLogger(__name__)
+
+_MAX_FRAMES = 40
+
+event_loop_lag_seconds = Histogram(
+    "inventory_event_loop_lag_seconds",
+    "How late the event loop ran a timer scheduled by the lag sampler",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+event_loop_stalls_total = Counter(
+    "inventory_event_loop_stalls_total",
+    "Event-loop stalls longer than the configured threshold (stack captured by the watchdog)",
+)
+
+
+# Last loop-stall stack snapshots, served by the admin API
+loop_stalls = RecentLog(settings.loop_stall_buffer_size)
+
+# Written by the sampler (loop thread), read by the watchdog. Float stores are atomic.
+_heartbeat: float = 0.0
+
+
+def _capture_stack(thread_id: int) -> list[str]:
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return []
+    summary = traceback.extract_stack(frame, limit=_MAX_FRAMES)
+    return [f"{f.filename}:{f.lineno} in {f.name}" for f in summary]
+
+
+def _watchdog(loop_thread_id: int, stop: threading.Event) -> None:
+    threshold = settings.loop_stall_threshold_ms / 1000
+    allowed = settings.loop_lag_sample_interval_seconds + threshold
+    captured_for = None
+    while not stop.wait(max(threshold / 4, 0.01)):
+        beat = _heartbeat
+        blocked = time.monotonic() - beat
+        if blocked < allowed or beat == captured_for:
+            continue
+        captured_for = beat  # one snapshot per stall
+        stack = _capture_stack(loop_thread_id)
+        event_loop_stalls_total.inc()
+        loop_stalls.add({
+            "at": datetime.now(timezone.utc).isoformat(),
+            "blockedMs": round((blocked - settings.loop_lag_sample_interval_seconds) * 1000, 1),
+            "stack": stack,
+        })
+        logger.warning(
+            "Event loop blocked for %.0fms; innermost frame: %s",
+            (blocked - settings.loop_lag_sample_interval_seconds) * 1000,
+            stack[-1] if stack else "unknown",
+        )
+
+
+async def run_loop_monitor() -> None:
+    """Sample loop lag every ``loop_lag_sample_interval_seconds`` and run the watchdog
+    thread until cancelled."""
+    global _heartbeat
+    interval = settings.loop_lag_sample_interval_seconds
+    _heartbeat = time.monotonic()
+    stop = threading.Event()
+    watchdog = threading.Thread(
+        target=_watchdog, args=(threading.get_ident(), stop), name="loop-watchdog", daemon=True
+    )
+    watchdog.start()
+    try:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(interval)
+            _heartbeat = time.monotonic()
+            event_loop_lag_seconds.observe(max(0.0, _heartbeat - started - interval))
+    finally:
+        stop.set()
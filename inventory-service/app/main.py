@@ -1,109 +1,82 @@
 import asyncio
 import logging
-import os
-import sys
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
-
-# ── OpenTelemetry (enabled when OTEL_EXPORTER_OTLP_ENDPOINT is set) ──────────
-_OTEL_ENABLED = False
-if os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
-    from opentelemetry import trace
-    from opentelemetry.sdk.trace import TracerProvider
-    from opentelemetry.sdk.trace.export import BatchSpanProcessor
-    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
-    from opentelemetry.sdk.resources import Resource
-    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-
-    # Build shared resource with service name + extra attributes from env
-    _resource_attrs = {"service.name": os.environ.get("OTEL_SERVICE_NAME", "inventory-service")}
-    for pair in os.environ.get("OTEL_RESOURCE_ATTRIBUTES", "").split(","):
-        if "=" in pair:
-            k, v = pair.split("=", 1)
-            _resource_attrs[k.strip()] = v.strip()
-    _resource = Resource.create(_resource_attrs)
-
-    # Tracing
-    _provider = TracerProvider(resource=_resource)
-    _provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
-    trace.set_tracer_provider(_provider)
-
-    from opentelemetry.instrumentation.logging import LoggingInstrumentor
-    LoggingInstrumentor().instrument(set_logging_format=True)
-
-    # Logging — export Python logs to OTel Collector → Loki
-    if os.environ.get("OTEL_LOGS_EXPORTER", "").lower() == "otlp":
-        from opentelemetry._logs import set_logger_provider
-        from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
-        from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
-        from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
-
-        _log_provider = LoggerProvider(resource=_resource)
-        _log_provider.add_log_record_processor(BatchLogRecordProcessor(OTLPLogExporter()))
-        set_logger_provider(_log_provider)
-        _otel_handler = LoggingHandler(level=logging.INFO, logger_provider=_log_provider)
-
-    _OTEL_ENABLED = True
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from prometheus_fastapi_instrumentator import Instrumentator
-from pythonjsonlogger.json import JsonFormatter
-from sqlalchemy import text
 
+from app import availability, health_checks, http_metrics, telemetry, warmup, worker
 from app.api.admin import router as admin_router
 from app.api.stock import router as stock_router
-from app.database import AsyncSessionLocal
-from app.kafka.consumer import run_consumer_supervised
-from app.kafka.dlq_consumer import run_dlq_consumer_supervised
-
-# ── Structured JSON logging ──────────────────────────────────────────────────
-_json_formatter = JsonFormatter(
-    fmt="%(asctime)s %(levelname)s %(name)s %(message)s %(otelTraceID)s %(otelSpanID)s %(otelTraceSampled)s",
-    rename_fields={
-        "asctime": "timestamp",
-        "levelname": "level",
-        "name": "logger",
-        "otelTraceID": "trace.id",
-        "otelSpanID": "span.id",
-        "otelTraceSampled": "trace.sampled",
-    },
-)
-
-_handler = logging.StreamHandler(sys.stdout)
-_handler.setFormatter(_json_formatter)
-
-logging.root.handlers.clear()
-logging.root.addHandler(_handler)
-# Attach OTel log handler (sends logs to OTel Collector → Loki)
-if _OTEL_ENABLED and os.environ.get("OTEL_LOGS_EXPORTER", "").lower() == "otlp":
-    logging.root.addHandler(_otel_handler)
-logging.root.setLevel(logging.INFO)
+from app.config import settings
+from app.log_pipeline import configure_logging
+from app.loop_monitor import run_loop_monitor
+from app.middleware.admission import AdmissionMiddleware
+from app.middleware.auth import close_http_client, run_jwks_refresher
+from app.middleware.query_stats import QueryStatsMiddleware
+
+# ── Structured JSON logging (queued; formatted and written off the event loop) ─
+# The OTel log handler (→ OTel Collector → Loki) joins the same listener thread once
+# telemetry has started.
+_log_listener = configure_logging()
 
 logger = logging.getLogger(__name__)
 
-_consumer_task: asyncio.Task | None = None
-_dlq_task: asyncio.Task | None = None
+_worker_tasks: list[asyncio.Task] = []
+_jwks_task: asyncio.Task | None = None
+_loop_monitor_task: asyncio.Task | None = None
+_telemetry_task: asyncio.Task | None = None
+_warmup_task: asyncio.Task | None = None
+_health_task: asyncio.Task | None = None
+_availability_task: asyncio.Task | None = None
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global _consumer_task, _dlq_task
-    logger.info("Starting Kafka consumer (supervised)...")
-    _consumer_task = asyncio.create_task(run_consumer_supervised())
-    _dlq_task = asyncio.create_task(run_dlq_consumer_supervised())
+    global _worker_tasks, _jwks_task, _loop_monitor_task, _telemetry_task, _warmup_task, _health_task
+    global _availability_task
+    _telemetry_task = asyncio.create_task(telemetry.start(_log_listener), name="telemetry-setup")
+    _loop_monitor_task = asyncio.create_task(run_loop_monitor(), name="loop-monitor")
+    _jwks_task = asyncio.create_task(run_jwks_refresher(), name="jwks-refresher")
+    _warmup_task = asyncio.create_task(warmup.run(), name="warmup")
+    # SERVICE_ROLE=api: consumers and the periodic jobs run in `python -m app.worker`
+    if settings.service_role == "all":
+        _worker_tasks = worker.start_tasks()
+    _health_task = asyncio.create_task(health_checks.run_checker(_worker_tasks), name="health-checker")
+    _availability_task = asyncio.create_task(availability.run_refresher(), name="availability-refresher")
     yield
-    if _consumer_task:
-        _consumer_task.cancel()
+    for task in (_warmup_task, _health_task, _availability_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    if _jwks_task:
+        _jwks_task.cancel()
         try:
-            await _consumer_task
+            await _jwks_task
         except asyncio.CancelledError:
             pass
-    if _dlq_task:
-        _dlq_task.cancel()
+        await close_http_client()
+    await worker.stop_tasks(_worker_tasks)
+    _worker_tasks = []
+    if _loop_monitor_task:
+        _loop_monitor_task.cancel()
         try:
-            await _dlq_task
+            await _loop_monitor_task
         except asyncio.CancelledError:
             pass
+    if _telemetry_task:
+        _telemetry_task.cancel()
+        try:
+            await _telemetry_task
+        except asyncio.CancelledError:
+            pass
+        except Exception as exc:
+            logger.error("OpenTelemetry setup failed: %s", exc)
+        await telemetry.shutdown()
     logger.info("Inventory service stopped.")
 
 
@@ -117,15 +90,25 @@ Real-time stock management for the BookStore platform.
 |--------|------|-------------|
 | GET | `/stock/{book_id}` | Single book stock lookup |
 | GET | `/stock/bulk` | Bulk stock lookup (up to 50 books) |
+| GET | `/stock/changes?since=...` | Rows changed since a version, in bounded pages (delta sync) |
+| GET | `/stock/availability` | Whole-catalog In / Low / Out of Stock, 2 bits per book (ETag-versioned) |
+| GET | `/stock/availability/ids` | Sorted book ids the availability array is aligned to |
 | GET | `/health` | Kubernetes liveness probe |
-| GET | `/health/ready` | Kubernetes readiness probe (checks DB) |
+| GET | `/health/ready` | Kubernetes readiness probe (cached dependency checks with timestamps) |
 
 ### Admin Endpoints — `admin` Keycloak realm role required
 | Method | Path | Description |
 |--------|------|-------------|
-| GET | `/admin/stock` | List all stock entries |
+| GET | `/admin/stock` | List stock entries (keyset cursor, low-stock / updated-since filters) |
 | PUT | `/admin/stock/{book_id}` | Set absolute quantity (resets reserved) |
 | POST | `/admin/stock/{book_id}/adjust` | Adjust quantity by delta (+/-) |
+| GET | `/admin/stock/{book_id}/as-of?at=...` | Stock level at a point in time (snapshot + movement ledger) |
+| POST | `/admin/stock/adjust/batch` | Apply many signed deltas in one statement (atomic or best-effort) |
+| POST | `/admin/stock/import` | Bulk import (CSV / NDJSON), `set` or `delta` mode |
+| GET | `/admin/stock/export` | Stream the full stock table (CSV / NDJSON / Arrow) from one snapshot |
+| GET | `/admin/stock/diagnostics/slow-requests` | Recent slow requests with their SQL, parameter shapes and timings |
+| GET | `/admin/stock/diagnostics/loop-stalls` | Stacks captured while the event loop was blocked |
+| GET | `/admin/stock/diagnostics/profile?seconds=10` | Sample the live process; collapsed stacks or speedscope JSON |
 
 To test admin endpoints in Swagger UI, click **Authorize** and enter the admin1 Bearer token.
 
@@ -133,8 +116,9 @@ To test admin endpoints in Swagger UI, click **Authorize** and enter the admin1
 | Method | Path | Description |
 |--------|------|-------------|
 | POST | `/stock/reserve` | Reserve stock for an order |
+| POST | `/stock/reserve/binary` | Reserve up to 50 order lines, msgpack in and out |
 
-The `/stock/reserve` endpoint is **not exposed** through the external Gateway
+The `/stock/reserve` endpoints are **not exposed** through the external Gateway
 (blocked at the HTTPRoute level). Only `ecom-service` (identified by its Kubernetes
 ServiceAccount SPIFFE identity) may call it over mutual TLS inside the cluster.
 
@@ -196,21 +180,31 @@ app = FastAPI(
     ],
 )
 
-# ── Instrument FastAPI with OpenTelemetry (if enabled) ────────────────────────
-if _OTEL_ENABLED:
-    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
-    FastAPIInstrumentor.instrument_app(app)
-
 # ── Prometheus metrics (before auth middleware so /metrics is unauthenticated) ─
-Instrumentator().instrument(app).expose(app, endpoint="/metrics")
+Instrumentator().add(http_metrics.instrumentation).instrument(app)
+app.get("/metrics", summary="Prometheus metrics (OpenMetrics with trace exemplars)")(http_metrics.metrics)
+
+# ── Per-request DB accounting (Server-Timing header + per-route histograms) ───
+app.add_middleware(QueryStatsMiddleware)
+
+# ── Admission control (inside CORS so shed 503s stay readable by the browser) ─
+if settings.admission_enabled:
+    app.add_middleware(AdmissionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://myecom.net:30000", "https://localhost:30000"],
     allow_methods=["GET", "PUT", "POST"],
     allow_headers=["Authorization", "Content-Type", "X-CSRF-Token"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Total-Count-Exact", "Server-Timing"],
 )
 
+# ── OpenTelemetry request tracing (pass-through until telemetry.start() finishes) ─
+# Added last so it is outermost: the metrics middlewares above observe inside the
+# server span and can attach its trace id as an exemplar.
+if telemetry.enabled():
+    app.add_middleware(telemetry.LazyTracingMiddleware)
+
 app.include_router(stock_router)
 app.include_router(admin_router)
 
@@ -223,16 +217,11 @@ async def health():
 
 @app.get("/health/ready", tags=["health"], summary="Readiness check")
 async def readiness():
-    """Checks database connectivity via `SELECT 1`. Returns 503 if the database is unreachable."""
-    from fastapi.responses import JSONResponse
-
-    try:
-        async with AsyncSessionLocal() as session:
-            await session.execute(text("SELECT 1"))
-        return {"status": "ready"}
-    except Exception as exc:
-        logger.error("Readiness check failed: %s", exc)
-        return JSONResponse(
-            status_code=503,
-            content={"status": "not ready", "detail": "database unreachable"},
-        )
+    """Returns 503 until startup warm-up has finished (or timed out). Then reports the
+    background health evaluator's last results (see `app.health_checks`) without touching the
+    database: 503 if the database is unreachable, a background task has stopped or the
+    results are stale. Each check carries its `checked_at` timestamp."""
+    if not warmup.is_complete():
+        return JSONResponse(status_code=503, content={"status": "not ready", "detail": "warming up"})
+    ready, body = health_checks.readiness()
+    return body if ready else JSONResponse(status_code=503, content=body)
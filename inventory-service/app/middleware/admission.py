@@ -0,0 +1,230 @@
+"""Admission control — checkout reservations keep working while public reads are shed.
+
+Public ``GET /stock/...`` reads and the internal ``POST /stock/reserve`` share one event
+loop and one connection pool, so a catalog traffic spike used to fail checkouts. Every
+request is classified by method and path:
+
+  - ``write``: ``POST /stock/reserve[/binary]`` and admin writes (non-GET ``/admin/...``)
+  - ``read``: public ``GET /stock/...`` lookups
+  - anything else (health, metrics, admin reads, docs) is not admission-controlled.
+
+Both classes draw from ``ADMISSION_CAPACITY`` slots (the pool size). ``read`` may hold at
+most ``ADMISSION_READ_LIMIT`` of them, so some are always left for writes, and when a
+slot frees up queued writes are admitted before queued reads. Each class waits in a
+short bounded FIFO queue; a read that finds its queue full or waits longer than
+``ADMISSION_READ_QUEUE_TIMEOUT_MS`` gets 503 with ``Retry-After``. Writes get a longer
+queue and timeout and are only shed when the service is far past saturation.
+
+With ``ADMISSION_ADAPTIVE_READ_LIMIT`` the read limit follows observed latency (AIMD):
+each window of completed reads raises it by one while their mean latency stays under
+``ADMISSION_READ_LATENCY_TARGET_MS`` and cuts it by a quarter otherwise.
+"""
+import asyncio
+import time
+from collections import deque
+
+from prometheus_client import Counter, Gauge, Histogram
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+
+_DECREASE_FACTOR = 0.75
+
+admission_in_flight = Gauge(
+    "inventory_admission_in_flight",
+    "Admitted requests currently running, by route class",
+    ["route_class"],
+)
+admission_queue_depth = Gauge(
+    "inventory_admission_queue_depth",
+    "Requests waiting for admission, by route class",
+    ["route_class"],
+)
+admission_limit = Gauge(
+    "inventory_admission_limit",
+    "Current concurrency limit, by route class (changes when the read limit is adaptive)",
+    ["route_class"],
+)
+admission_shed_total = Counter(
+    "inventory_admission_shed_total",
+    "Requests rejected with 503 by admission control (reason: queue_full, queue_timeout)",
+    ["route_class", "reason"],
+)
+admission_wait_seconds = Histogram(
+    "inventory_admission_wait_seconds",
+    "Time admitted requests spent queued before running",
+    ["route_class"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+class RouteClass:
+    """Concurrency limit and bounded wait queue for one class of routes."""
+
+    def __init__(self, name: str, limit: int, queue_size: int, queue_timeout: float, adaptive: bool = False):
+        self.name = name
+        self.limit = limit
+        self.max_limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        self._window_count = 0
+        self._window_seconds = 0.0
+        admission_limit.labels(route_class=name).set(limit)
+
+    def observe(self, seconds: float, target: float) -> None:
+        """AIMD step once per window of ``limit`` completions."""
+        if not self.adaptive:
+            return
+        self._window_count += 1
+        self._window_seconds += seconds
+        if self._window_count < self.limit:
+            return
+        if self._window_seconds / self._window_count > target:
+            self.limit = max(1, int(self.limit * _DECREASE_FACTOR))
+        else:
+            self.limit = min(self.max_limit, self.limit + 1)
+        self._window_count = 0
+        self._window_seconds = 0.0
+        admission_limit.labels(route_class=self.name).set(self.limit)
+
+
+class AdmissionController:
+    """Shared slots for route classes listed in priority order (highest first)."""
+
+    def __init__(self, capacity: int, classes: list[RouteClass]):
+        self.capacity = capacity
+        self.classes = {route_class.name: route_class for route_class in classes}
+        self.in_flight = 0
+
+    def _has_room(self, route_class: RouteClass) -> bool:
+        return self.in_flight < self.capacity and route_class.in_flight < route_class.limit
+
+    def _grant(self, route_class: RouteClass) -> None:
+        self.in_flight += 1
+        route_class.in_flight += 1
+        admission_in_flight.labels(route_class=route_class.name).set(route_class.in_flight)
+
+    def _wake(self) -> None:
+        for route_class in self.classes.values():
+            while route_class.waiters and self._has_room(route_class):
+                waiter = route_class.waiters.popleft()
+                if not waiter.done():
+                    self._grant(route_class)
+                    waiter.set_result(None)
+            admission_queue_depth.labels(route_class=route_class.name).set(len(route_class.waiters))
+
+    def _queued_ahead(self, route_class: RouteClass) -> bool:
+        for other in self.classes.values():
+            if other.waiters:
+                return True
+            if other is route_class:
+                return False
+        return False
+
+    async def acquire(self, route_class: RouteClass) -> str | None:
+        """Wait for a slot. Returns ``None`` once admitted, else the reason to shed."""
+        if not self._queued_ahead(route_class) and self._has_room(route_class):
+            self._grant(route_class)
+            return None
+        if len(route_class.waiters) >= route_class.queue_size:
+            return "queue_full"
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        admission_queue_depth.labels(route_class=route_class.name).set(len(route_class.waiters))
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, route_class.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done() or waiter.cancelled():
+                return "queue_timeout"
+            # Granted in the same loop iteration the timeout fired: the slot is already
+            # counted, so run the request rather than leak it.
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(route_class)  # admitted just as the client went away
+            raise
+        finally:
+            if waiter in route_class.waiters:
+                route_class.waiters.remove(waiter)
+            admission_queue_depth.labels(route_class=route_class.name).set(len(route_class.waiters))
+        admission_wait_seconds.labels(route_class=route_class.name).observe(time.perf_counter() - started)
+        return None
+
+    def release(self, route_class: RouteClass) -> None:
+        self.in_flight -= 1
+        route_class.in_flight -= 1
+        admission_in_flight.labels(route_class=route_class.name).set(route_class.in_flight)
+        self._wake()
+
+
+def _route_class(scope: Scope) -> str | None:
+    path = scope["path"]
+    root_path = scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    method = scope["method"]
+    if path in ("/stock/reserve", "/stock/reserve/binary"):
+        return "write" if method == "POST" else None
+    if path.startswith("/admin/"):
+        return None if method in ("GET", "HEAD") else "write"
+    if path.startswith("/stock/") and method in ("GET", "HEAD"):
+        return "read"
+    return None
+
+
+def default_controller() -> AdmissionController:
+    return AdmissionController(
+        settings.admission_capacity,
+        [
+            RouteClass(
+                "write",
+                settings.admission_capacity,
+                settings.admission_write_queue_size,
+                settings.admission_write_queue_timeout_ms / 1000,
+            ),
+            RouteClass(
+                "read",
+                settings.admission_read_limit,
+                settings.admission_read_queue_size,
+                settings.admission_read_queue_timeout_ms / 1000,
+                adaptive=settings.admission_adaptive_read_limit,
+            ),
+        ],
+    )
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware; a streamed response holds its slot until it is sent."""
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController | None = None):
+        self.app = app
+        self.controller = controller or default_controller()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        name = _route_class(scope) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.controller.classes[name]
+        shed = await self.controller.acquire(route_class)
+        if shed is not None:
+            admission_shed_total.labels(route_class=name, reason=shed).inc()
+            response = JSONResponse(
+                {"detail": "Service overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(settings.admission_retry_after_seconds)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.observe(time.perf_counter() - started, settings.admission_read_latency_target_ms / 1000)
+            self.controller.release(route_class)
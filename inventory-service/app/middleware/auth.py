@@ -1,75 +1,236 @@
-"""JWT validation middleware using Keycloak JWKS endpoint."""
+"""JWT validation middleware using Keycloak JWKS endpoint.
+
+Signing keys are held in a kid-indexed map and refreshed in the background before
+they go stale; requests never wait on Keycloak unless a token names a kid we have not
+seen (key rotation). That refetch is single-flight and rate-limited, so expired,
+malformed or badly signed tokens are rejected without any network I/O.
+"""
+import asyncio
+import hashlib
 import logging
+import time
 
 import httpx
-from cachetools import TTLCache
+from cachetools import TLRUCache
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+
+from prometheus_client import Counter, Histogram
 
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
 _bearer = HTTPBearer()
-_jwks_cache: TTLCache = TTLCache(maxsize=1, ttl=300)
-_JWKS_KEY = "jwks"
+_ALGORITHM = "RS256"
 
+# kid → constructed public key. Replaced wholesale on each successful fetch.
+_keys: dict[str, Key] = {}
+_keys_fetched_at: float = float("-inf")
+_jwks_kids: frozenset[str] = frozenset()
+_last_fetch_attempt: float = float("-inf")
+_fetch_attempts: int = 0
+# Replaced by run_jwks_refresher for each event loop it runs on: a lock binds to the
+# first loop that waits on it.
+_fetch_lock = asyncio.Lock()
+_http_client: httpx.AsyncClient | None = None
+_revalidate_task: asyncio.Task | None = None
 
-async def _get_jwks() -> dict:
-    cached = _jwks_cache.get(_JWKS_KEY)
-    if cached is not None:
-        return cached
-    async with httpx.AsyncClient() as client:
-        resp = await client.get(settings.keycloak_jwks_uri)
-        resp.raise_for_status()
-        jwks = resp.json()
-    _jwks_cache[_JWKS_KEY] = jwks
-    logger.info("JWKS fetched and cached (TTL=300s)")
-    return jwks
 
+def _claims_ttu(_key: bytes, claims: dict, now: float) -> float:
+    """Cached claims expire at the token's ``exp``, capped at the configured max TTL."""
+    return min(float(claims["exp"]), now + settings.jwt_claims_cache_max_ttl_seconds)
 
-def _invalidate_jwks_cache() -> None:
-    _jwks_cache.pop(_JWKS_KEY, None)
 
+# sha256(token) → verified claims. Wall-clock timer so expiry compares against ``exp``.
+_claims_cache: TLRUCache = TLRUCache(
+    maxsize=settings.jwt_claims_cache_size, ttu=_claims_ttu, timer=time.time
+)
 
-async def get_current_user(
-    creds: HTTPAuthorizationCredentials = Depends(_bearer),
-) -> dict:
-    token = creds.credentials
+auth_claims_cache_total = Counter(
+    "inventory_auth_claims_cache_total",
+    "Verified-token claims cache lookups",
+    ["result"],
+)
+auth_jwt_verify_seconds = Histogram(
+    "inventory_auth_jwt_verify_seconds",
+    "Time spent in RS256 signature verification and claim checks (cache misses only)",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05),
+)
+auth_jwks_fetch_total = Counter(
+    "inventory_auth_jwks_fetch_total",
+    "JWKS fetch attempts by trigger (background, stale, unknown_kid) and result",
+    ["trigger", "result"],
+)
+
+
+def _unauthorized() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _client() -> httpx.AsyncClient:
+    """One pooled client for every JWKS fetch (keeps the TLS session to Keycloak)."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=settings.jwks_http_timeout_seconds)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _on_jwks_fetched(jwks: dict) -> None:
+    """Install a fetched key set; drop cached claims when the signing key set rotates."""
+    global _keys, _keys_fetched_at, _jwks_kids
+    keys: dict[str, Key] = {}
+    for entry in jwks.get("keys", []):
+        kid = entry.get("kid")
+        if not kid or entry.get("use", "sig") != "sig" or entry.get("alg", _ALGORITHM) != _ALGORITHM:
+            continue  # Keycloak also publishes RSA-OAEP encryption keys
+        try:
+            keys[kid] = jwk.construct(entry, _ALGORITHM)
+        except Exception as exc:
+            logger.warning("Skipping unusable JWKS key %s: %s", kid, exc)
+    kids = frozenset(keys)
+    if kids != _jwks_kids:
+        if _jwks_kids:
+            logger.info("JWKS key set rotated — clearing verified-claims cache")
+        _claims_cache.clear()
+        _jwks_kids = kids
+    _keys = keys
+    _keys_fetched_at = time.monotonic()
+
+
+async def _fetch_jwks() -> dict:
+    resp = await _client().get(settings.keycloak_jwks_uri)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def refresh_jwks(trigger: str) -> bool:
+    """Fetch and install the JWKS. Single-flight: callers that queue behind an
+    in-flight fetch reuse its outcome instead of issuing their own request.
+    Returns True when usable keys are installed."""
+    global _last_fetch_attempt, _fetch_attempts
+    seen = _fetch_attempts
+    async with _fetch_lock:
+        if _fetch_attempts != seen:
+            auth_jwks_fetch_total.labels(trigger=trigger, result="coalesced").inc()
+            return bool(_keys)
+        _last_fetch_attempt = time.monotonic()
+        try:
+            _on_jwks_fetched(await _fetch_jwks())
+        except (httpx.HTTPError, ValueError) as exc:
+            auth_jwks_fetch_total.labels(trigger=trigger, result="error").inc()
+            logger.warning("JWKS fetch (%s) failed: %s — keeping %d cached keys", trigger, exc, len(_keys))
+            return bool(_keys)
+        finally:
+            _fetch_attempts += 1  # counts completed attempts, so queued callers see it change
+    auth_jwks_fetch_total.labels(trigger=trigger, result="ok").inc()
+    logger.info("JWKS fetched (%s): %d signing keys", trigger, len(_keys))
+    return True
+
+
+def _revalidate_if_stale() -> None:
+    """Stale-while-revalidate: serve the current keys, refresh in the background."""
+    global _revalidate_task
+    if time.monotonic() - _keys_fetched_at < settings.jwks_refresh_interval_seconds:
+        return
+    if _fetch_lock.locked() or (_revalidate_task is not None and not _revalidate_task.done()):
+        return
+    if time.monotonic() - _last_fetch_attempt < settings.jwks_refetch_min_interval_seconds:
+        return
+    _revalidate_task = asyncio.create_task(refresh_jwks("stale"))
+
+
+async def run_jwks_refresher() -> None:
+    """Prefetch the JWKS, then refresh it every ``jwks_refresh_interval_seconds``.
+    A failed fetch is retried after ``jwks_refetch_min_interval_seconds``."""
+    global _fetch_lock
+    _fetch_lock = asyncio.Lock()
+    while True:
+        ok = await refresh_jwks("background")
+        await asyncio.sleep(
+            settings.jwks_refresh_interval_seconds if ok else settings.jwks_refetch_min_interval_seconds
+        )
+
+
+async def _signing_key(token: str) -> Key:
     try:
-        jwks = await _get_jwks()
-        payload = jwt.decode(
+        kid = jwt.get_unverified_header(token).get("kid")
+    except JWTError:
+        raise _unauthorized()
+    key = _keys.get(kid)
+    if key is not None:
+        _revalidate_if_stale()
+        return key
+
+    # Unknown kid: a rotation we have not seen yet (or a forged header). Refetch at
+    # most once per min interval; everything else fails fast.
+    if time.monotonic() - _last_fetch_attempt >= settings.jwks_refetch_min_interval_seconds:
+        await refresh_jwks("unknown_kid")
+    elif _fetch_lock.locked():
+        await refresh_jwks("unknown_kid")  # joins the in-flight fetch
+    else:
+        auth_jwks_fetch_total.labels(trigger="unknown_kid", result="throttled").inc()
+    key = _keys.get(kid)
+    if key is not None:
+        return key
+    if not _keys:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Token signing keys unavailable",
+        )
+    logger.warning("JWT rejected: unknown signing key id %r", kid)
+    raise _unauthorized()
+
+
+def _decode(token: str, key: Key) -> dict:
+    with auth_jwt_verify_seconds.time():
+        return jwt.decode(
             token,
-            jwks,
-            algorithms=["RS256"],
+            key,
+            algorithms=[_ALGORITHM],
             options={"verify_aud": True},
             audience=settings.jwt_audience,
             issuer=settings.keycloak_issuer_uri,
         )
-        return payload
-    except JWTError:
-        # Invalidate cache and retry once with fresh JWKS (handles key rotation)
-        _invalidate_jwks_cache()
-        try:
-            jwks = await _get_jwks()
-            payload = jwt.decode(
-                token,
-                jwks,
-                algorithms=["RS256"],
-                options={"verify_aud": True},
-                audience=settings.jwt_audience,
-                issuer=settings.keycloak_issuer_uri,
-            )
-            logger.info("JWT validated after JWKS cache refresh")
-            return payload
-        except JWTError as exc:
-            logger.warning("JWT validation failed after JWKS refresh: %s", exc)
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid or expired token",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+
+
+async def get_current_user(
+    creds: HTTPAuthorizationCredentials = Depends(_bearer),
+) -> dict:
+    token = creds.credentials
+    cache_key = hashlib.sha256(token.encode()).digest()
+    claims = _claims_cache.get(cache_key)
+    if claims is not None:
+        auth_claims_cache_total.labels(result="hit").inc()
+        return claims
+    auth_claims_cache_total.labels(result="miss").inc()
+
+    payload = await _verify(token)
+    if "exp" in payload:
+        _claims_cache[cache_key] = payload
+    return payload
+
+
+async def _verify(token: str) -> dict:
+    key = await _signing_key(token)
+    try:
+        return _decode(token, key)
+    except JWTError as exc:
+        logger.info("JWT validation failed: %s", exc)
+        raise _unauthorized()
 
 
 def require_role(role: str):
@@ -0,0 +1,228 @@
+"""Per-request database accounting — statement count, DB time, pool checkout wait and
+time spent in row-locking statements.
+
+Engine event hooks add every cursor execution to the stats object of the request that
+issued it (found through a context variable, so Kafka consumers and background jobs
+are not counted). ``QueryStatsMiddleware`` reports the totals as a ``Server-Timing``
+header and as per-route histograms, and keeps the SQL of requests slower than
+``slow_request_threshold_ms`` in a bounded ring buffer for the admin API.
+"""
+import logging
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from prometheus_client import Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+from app.recent_log import RecentLog
+
+logger = logging.getLogger(__name__)
+
+_MAX_QUERIES_KEPT = 50
+# Statements that can wait on row locks; their duration includes any such wait.
+_LOCKING = re.compile(r"^\s*(UPDATE|DELETE)\b|\bFOR (NO KEY )?UPDATE\b", re.IGNORECASE)
+_MAX_SQL_CHARS = 2000
+
+request_db_seconds = Histogram(
+    "inventory_request_db_seconds",
+    "Time spent executing SQL statements per HTTP request",
+    ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+request_db_statements = Histogram(
+    "inventory_request_db_statements",
+    "SQL statements executed per HTTP request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+request_pool_wait_seconds = Histogram(
+    "inventory_request_pool_wait_seconds",
+    "Time spent waiting for a pooled DB connection per HTTP request",
+    ["route"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+request_locking_statement_seconds = Histogram(
+    "inventory_request_locking_statement_seconds",
+    "Total time of row-locking statements (SELECT ... FOR UPDATE, UPDATE, DELETE) per HTTP "
+    "request, failed ones included — row-lock wait plus execution",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    db_seconds: float = 0.0
+    pool_wait_seconds: float = 0.0
+    locking_statements: int = 0
+    locking_seconds: float = 0.0
+    queries: list[tuple] = field(default_factory=list)
+
+    def server_timing(self, total_seconds: float) -> str:
+        return (
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.statements} queries", '
+            f"pool;dur={self.pool_wait_seconds * 1000:.1f}, "
+            f"total;dur={total_seconds * 1000:.1f}"
+        )
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("inventory_request_stats", default=None)
+
+
+# Last slow requests, served by the admin API
+slow_requests = RecentLog(settings.slow_request_buffer_size)
+
+
+# ── Engine hooks ─────────────────────────────────────────────────────────────
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _current.get() is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    stats = _current.get()
+    started = getattr(context, "_query_started", None)
+    if stats is None or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats.statements += 1
+    stats.db_seconds += elapsed
+    if _LOCKING.search(statement):
+        stats.locking_statements += 1
+        stats.locking_seconds += elapsed
+    if len(stats.queries) < _MAX_QUERIES_KEPT:
+        stats.queries.append((statement, parameters, executemany, elapsed))
+
+
+def _handle_error(exception_context) -> None:
+    """Charge a failed locking statement (e.g. an expired lock_timeout) to the request."""
+    stats = _current.get()
+    context = exception_context.execution_context
+    started = getattr(context, "_query_started", None)
+    if stats is None or started is None or not _LOCKING.search(exception_context.statement or ""):
+        return
+    stats.locking_statements += 1
+    stats.locking_seconds += time.perf_counter() - started
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Attach the per-request statement timers to a (sync) engine."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Async queue pool that charges checkout wait (queueing + new connects) to the request."""
+
+    def _do_get(self):
+        stats = _current.get()
+        if stats is None:
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats.pool_wait_seconds += time.perf_counter() - started
+
+
+# ── Slow-request capture ─────────────────────────────────────────────────────
+
+def _type_name(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def _param_shape(parameters, executemany: bool):
+    """Parameter types only — values may carry customer data and never leave the process."""
+    if executemany:
+        return {"rows": len(parameters), "row": _param_shape(parameters[0], False) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: _type_name(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_type_name(value) for value in parameters]
+    return _type_name(parameters)
+
+
+def _route_template(scope: Scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def _record(scope: Scope, stats: RequestStats, status_code: int, total_seconds: float) -> None:
+    route = _route_template(scope)
+    request_db_seconds.labels(route=route).observe(stats.db_seconds)
+    request_db_statements.labels(route=route).observe(stats.statements)
+    request_pool_wait_seconds.labels(route=route).observe(stats.pool_wait_seconds)
+    if stats.locking_statements:
+        request_locking_statement_seconds.labels(route=route).observe(stats.locking_seconds)
+
+    if total_seconds * 1000 < settings.slow_request_threshold_ms:
+        return
+    slow_requests.add({
+        "at": datetime.now(timezone.utc).isoformat(),
+        "method": scope["method"],
+        "route": route,
+        "path": scope["path"],
+        "status": status_code,
+        "totalMs": round(total_seconds * 1000, 2),
+        "dbMs": round(stats.db_seconds * 1000, 2),
+        "poolWaitMs": round(stats.pool_wait_seconds * 1000, 2),
+        "statements": stats.statements,
+        "queries": [
+            {
+                "sql": statement[:_MAX_SQL_CHARS],
+                "params": _param_shape(parameters, executemany),
+                "ms": round(elapsed * 1000, 2),
+            }
+            for statement, parameters, executemany, elapsed in stats.queries
+        ],
+    })
+    logger.info(
+        "Slow request %s %s: %.1fms (db %.1fms in %d statements, pool wait %.1fms)",
+        scope["method"], route, total_seconds * 1000, stats.db_seconds * 1000,
+        stats.statements, stats.pool_wait_seconds * 1000,
+    )
+
+
+class QueryStatsMiddleware:
+    """Pure ASGI middleware (streaming responses pass straight through)."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", stats.server_timing(time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _record(scope, stats, status_code, time.perf_counter() - started)
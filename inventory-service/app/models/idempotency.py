@@ -0,0 +1,22 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import DateTime, Integer, Text, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.inventory import Base
+
+
+class ReserveIdempotency(Base):
+    """A successful keyed reservation and the response to replay for its retries."""
+
+    __tablename__ = "reserve_idempotency"
+
+    key: Mapped[str] = mapped_column(Text, primary_key=True)
+    book_id: Mapped[UUID] = mapped_column(nullable=False)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    response: Mapped[dict | None] = mapped_column(JSONB)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
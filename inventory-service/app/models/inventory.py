@@ -1,7 +1,7 @@
 from datetime import datetime, timezone
 from uuid import UUID
 
-from sqlalchemy import Integer, DateTime, func
+from sqlalchemy import BigInteger, DateTime, FetchedValue, Integer, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -20,6 +20,8 @@ class Inventory(Base):
         server_default=func.now(),
         onupdate=func.now(),
     )
+    # Id of the last writing transaction, stamped by a trigger (migration 006).
+    version: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default=FetchedValue())
 
     @property
     def available(self) -> int:
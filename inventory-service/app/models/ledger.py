@@ -0,0 +1,48 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import BigInteger, DateTime, Identity, Integer, Text, func, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.inventory import Base
+
+
+class StockMovement(Base):
+    """One append-only ledger row per book per inventory mutation (partitioned by month)."""
+
+    __tablename__ = "stock_movement"
+    __table_args__ = {"postgresql_partition_by": "RANGE (occurred_at)"}
+
+    occurred_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), primary_key=True, server_default=func.now()
+    )
+    id: Mapped[int] = mapped_column(BigInteger, Identity(always=True), primary_key=True)
+    book_id: Mapped[UUID] = mapped_column(nullable=False)
+    kind: Mapped[str] = mapped_column(Text, nullable=False)
+    quantity_delta: Mapped[int] = mapped_column(Integer, nullable=False)
+    reserved_delta: Mapped[int] = mapped_column(Integer, nullable=False)
+    quantity_after: Mapped[int] = mapped_column(Integer, nullable=False)
+    reserved_after: Mapped[int] = mapped_column(Integer, nullable=False)
+    ref: Mapped[str | None] = mapped_column(Text)
+    xact_id: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, server_default=text("pg_current_xact_id()::text::bigint")
+    )
+
+
+class StockSnapshot(Base):
+    """Sparse per-book stock snapshot — written only for books that moved since the last run."""
+
+    __tablename__ = "stock_snapshot"
+
+    book_id: Mapped[UUID] = mapped_column(primary_key=True)
+    taken_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    quantity: Mapped[int] = mapped_column(Integer, nullable=False)
+    reserved: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class StockSnapshotRun(Base):
+    __tablename__ = "stock_snapshot_run"
+
+    taken_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    upto_xact_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    books: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -0,0 +1,135 @@
+"""On-demand sampling profiler for the live process.
+
+Samples are taken by a ``SIGPROF`` interval timer (``ITIMER_PROF``, i.e. process CPU
+time), whose handler runs on the main thread — the event-loop thread under uvicorn —
+and records the interrupted stack. HTTP handlers, both Kafka consumers and the
+background jobs all run there, so every sample is attributed to the asyncio task that
+was running (its name is the root frame), or to the loop itself between tasks. A
+watcher thread reading ``sys._current_frames()`` would be cheaper to write but only
+ever gets the GIL when the loop releases it, so it mostly sees ``select()``.
+
+At the default 10ms interval a sample costs tens of microseconds (well under 1% of a
+core), and an idle process takes no samples at all. Results are rendered as collapsed
+stacks (flamegraph.pl / speedscope import) or as a speedscope "sampled" profile.
+"""
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+
+FORMATS = ("collapsed", "speedscope")
+
+_running = False
+_code_labels: dict[CodeType, tuple[str, str, int]] = {}
+_SEARCH_ROOTS = sorted((p for p in sys.path if p), key=len, reverse=True)
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is already running — there is one SIGPROF handler and one
+    ``ITIMER_PROF`` timer per process, so runs cannot overlap."""
+
+
+class ProfilerUnavailable(Exception):
+    """Raised when SIGPROF sampling cannot be used (no SIGPROF, or the loop is not on
+    the main thread)."""
+
+
+def _label(code: CodeType) -> tuple[str, str, int]:
+    label = _code_labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        for root in _SEARCH_ROOTS:
+            if filename.startswith(root + os.sep):
+                filename = filename[len(root) + 1:]
+                break
+        label = (code.co_name, filename, code.co_firstlineno)
+        _code_labels[code] = label
+    return label
+
+
+def _record(samples: Counter, frame: FrameType | None, task: asyncio.Task | None) -> None:
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    stack.append((f"task {task.get_name()}" if task is not None else "event loop", "", 0))
+    stack.reverse()
+    samples[tuple(stack)] += 1
+
+
+async def profile(seconds: float, interval: float) -> Counter:
+    """Sample the event-loop thread for ``seconds``. Returns stack → sample count."""
+    global _running
+    if not hasattr(signal, "SIGPROF") or threading.current_thread() is not threading.main_thread():
+        raise ProfilerUnavailable("profiling needs SIGPROF and the event loop on the main thread")
+    if _running:
+        raise ProfilerBusy()
+    _running = True
+    samples: Counter = Counter()
+    loop = asyncio.get_running_loop()
+
+    def on_sigprof(_signum: int, frame: FrameType | None) -> None:
+        _record(samples, frame, asyncio.current_task(loop))
+
+    previous = signal.signal(signal.SIGPROF, on_sigprof)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+        _running = False
+    return samples
+
+
+def _frame_name(frame: tuple[str, str, int]) -> str:
+    name, filename, line = frame
+    return f"{name} ({filename}:{line})" if filename else name
+
+
+def to_collapsed(samples: Counter) -> str:
+    """One ``frame;frame;...;leaf count`` line per distinct stack."""
+    lines = [
+        ";".join(_frame_name(f).replace(";", ":") for f in stack) + f" {count}"
+        for stack, count in samples.most_common()
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def to_speedscope(samples: Counter, interval: float, name: str) -> dict:
+    frames: list[dict] = []
+    index: dict[tuple[str, str, int], int] = {}
+    stacks, weights = [], []
+    for stack, count in samples.most_common():
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                fn, filename, line = frame
+                frames.append({"name": fn, "file": filename, "line": line} if filename else {"name": fn})
+            ids.append(index[frame])
+        stacks.append(ids)
+        weights.append(count * interval * 1000)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "inventory-service",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        }],
+    }
+
+
+def profile_name() -> str:
+    return f"inventory-service {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}"
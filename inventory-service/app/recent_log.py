@@ -0,0 +1,26 @@
+"""Bounded in-memory logs of recent events (slow requests, loop stalls) for the admin API."""
+from collections import deque
+
+
+class RecentLog:
+    """Keeps the last ``maxlen`` entries, plus a count of every entry ever added."""
+
+    def __init__(self, maxlen: int):
+        self._entries: deque[dict] = deque(maxlen=maxlen)
+        self._total_count: int = 0
+
+    @property
+    def total_count(self) -> int:
+        return self._total_count
+
+    @property
+    def entries(self) -> list[dict]:
+        return list(self._entries)
+
+    def add(self, entry: dict) -> None:
+        self._total_count += 1
+        self._entries.append(entry)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._total_count = 0
@@ -0,0 +1,45 @@
+"""Reservation outcomes shared by the reserve routes and the reserve combiner.
+
+A reservation ends in one ``Outcome`` whatever path applied it (locked single-row
+transaction or combined batch); each route maps it onto its own wire format —
+HTTP status + JSON for ``POST /stock/reserve``, a per-item result for the binary route.
+"""
+from dataclasses import dataclass
+from uuid import UUID
+
+from app.idempotency import StoredReservation
+
+# HTTP status of each outcome; replays answer 200 like the original reservation.
+STATUS_CODES = {"reserved": 200, "replayed": 200, "not_found": 404, "insufficient": 409, "key_mismatch": 422}
+
+
+@dataclass(frozen=True)
+class Outcome:
+    """``status`` is ``reserved``, ``replayed``, ``insufficient``, ``not_found`` or
+    ``key_mismatch``; ``body`` is the ``ReserveResponse`` JSON for the first two."""
+
+    status: str
+    body: dict | None = None
+    detail: str | None = None
+
+    @property
+    def status_code(self) -> int:
+        return STATUS_CODES[self.status]
+
+
+def not_found() -> Outcome:
+    return Outcome("not_found", detail="Book not found in inventory")
+
+
+def insufficient(available: int, quantity: int) -> Outcome:
+    return Outcome("insufficient", detail=f"Insufficient stock: available={available} requested={quantity}")
+
+
+def key_mismatch() -> Outcome:
+    return Outcome("key_mismatch", detail="Idempotency-Key was already used for a different reservation")
+
+
+def replay(stored: StoredReservation, book_id: UUID, quantity: int) -> Outcome:
+    if not stored.matches(book_id, quantity):
+        return key_mismatch()
+    return Outcome("replayed", stored.response)
@@ -0,0 +1,177 @@
+"""Flat combining for ``POST /stock/reserve`` on hot books.
+
+During a launch, checkouts pile up on one inventory row and every reservation pays a
+full lock → update → ledger → commit round trip while the others queue on the row
+lock. With ``RESERVE_COMBINING`` enabled, concurrent reservations of the same book
+join a per-book queue instead. One of them — the combiner — waits
+``RESERVE_COMBINE_WINDOW_MS`` for more to arrive, then applies up to
+``RESERVE_COMBINE_MAX_BATCH`` of them in its own transaction: one row lock, one
+``UPDATE``, one multi-row ledger insert and one commit. Requests are granted in arrival
+order until stock runs out; one that doesn't fit is refused and later, smaller ones
+may still be granted, exactly as if they had run one after another. Every caller gets
+its own outcome (200, 409, 404, replay or 422).
+
+Callers that arrive while a batch is being applied queue up for the next one; when
+the combiner finishes it hands the role to the oldest waiting caller, whose session
+applies the next batch. The combiner's failure fails its whole batch — nothing in it
+was committed, and retrying with the same ``Idempotency-Key`` is safe.
+
+State is per process; replicas combine independently and still serialise on the row.
+"""
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from prometheus_client import Histogram
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import idempotency, ledger, reservations
+from app.config import settings
+from app.models.inventory import Inventory
+from app.reservations import Outcome
+from app.schemas.inventory import ReserveResponse
+
+reserve_batch_size = Histogram(
+    "inventory_reserve_combined_batch_size",
+    "Reservations applied per combined transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+# Result handed to a waiting caller that is to combine the next batch itself.
+_YOUR_TURN = object()
+
+
+@dataclass
+class _Request:
+    quantity: int
+    key: str | None
+    future: asyncio.Future
+
+
+@dataclass
+class _Book:
+    pending: deque[_Request] = field(default_factory=deque)
+    combining: bool = False
+
+
+_books: dict[UUID, _Book] = {}
+
+
+async def reserve(db: AsyncSession, book_id: UUID, quantity: int, key: str | None = None) -> Outcome:
+    """Reserve ``quantity`` of ``book_id``, combined with concurrent reservations of it."""
+    book = _books.setdefault(book_id, _Book())
+    request = _Request(quantity, key, asyncio.get_running_loop().create_future())
+    if book.combining:
+        book.pending.append(request)
+        try:
+            result = await request.future
+        except asyncio.CancelledError:
+            if request in book.pending:
+                book.pending.remove(request)
+            elif request.future.done() and not request.future.cancelled() and request.future.result() is _YOUR_TURN:
+                _hand_over(book_id, book)
+            raise
+        if result is not _YOUR_TURN:
+            return result
+    book.combining = True
+
+    try:
+        await asyncio.sleep(settings.reserve_combine_window_ms / 1000)
+        batch = [request]
+        while book.pending and len(batch) < settings.reserve_combine_max_batch:
+            waiting = book.pending.popleft()
+            if not waiting.future.done():
+                batch.append(waiting)
+        try:
+            outcomes = await _apply(db, book_id, batch)
+        except BaseException as exc:
+            error = exc if isinstance(exc, Exception) else RuntimeError("Combined reservation interrupted")
+            for waiting in batch[1:]:
+                if not waiting.future.done():
+                    waiting.future.set_exception(error)
+            raise
+        for waiting, outcome in zip(batch[1:], outcomes[1:]):
+            if not waiting.future.done():
+                waiting.future.set_result(outcome)
+        return outcomes[0]
+    finally:
+        _hand_over(book_id, book)
+
+
+def _hand_over(book_id: UUID, book: _Book) -> None:
+    """Make the oldest waiting caller the next combiner, or retire the book's queue."""
+    while book.pending:
+        waiting = book.pending.popleft()
+        if not waiting.future.done():
+            waiting.future.set_result(_YOUR_TURN)
+            return
+    book.combining = False
+    if _books.get(book_id) is book:
+        del _books[book_id]
+
+
+async def _apply(db: AsyncSession, book_id: UUID, batch: list[_Request]) -> list[Outcome]:
+    """Apply ``batch`` in arrival order in one transaction on ``db`` and commit it."""
+    reserve_batch_size.observe(len(batch))
+    first: dict[str, _Request] = {}
+    for request in batch:
+        if request.key is not None:
+            first.setdefault(request.key, request)
+    stored = await idempotency.claim_many(
+        db, [(key, book_id, request.quantity) for key, request in first.items()]
+    ) if first else {}
+    inv = (await db.execute(
+        select(Inventory).where(Inventory.book_id == book_id).with_for_update()
+    )).scalar_one_or_none()
+
+    outcomes: list[Outcome] = []
+    movements: list[dict] = []
+    bodies: dict[str, dict] = {}
+    for request in batch:
+        if request.key in stored:
+            outcomes.append(reservations.replay(stored[request.key], book_id, request.quantity))
+            continue
+        if request.key is not None and first[request.key] is not request:
+            # Same key twice in one batch: a retry racing its original attempt.
+            if first[request.key].quantity != request.quantity:
+                outcomes.append(reservations.key_mismatch())
+                continue
+            if request.key in bodies:
+                outcomes.append(Outcome("replayed", bodies[request.key]))
+                continue
+        if inv is None:
+            outcomes.append(reservations.not_found())
+            continue
+        if inv.available < request.quantity:
+            outcomes.append(reservations.insufficient(inv.available, request.quantity))
+            continue
+        inv.reserved += request.quantity
+        movements.append({
+            "book_id": book_id,
+            "kind": ledger.RESERVE,
+            "quantity_delta": 0,
+            "reserved_delta": request.quantity,
+            "quantity_after": inv.quantity,
+            "reserved_after": inv.reserved,
+            "ref": request.key,
+        })
+        body = ReserveResponse(
+            book_id=book_id, quantity_reserved=request.quantity, remaining_available=inv.available
+        ).model_dump(mode="json")
+        if request.key is not None:
+            bodies[request.key] = body
+        outcomes.append(Outcome("reserved", body))
+
+    if movements:
+        await ledger.record_movements(db, movements)
+    if bodies:
+        await idempotency.record_many(db, bodies)
+    refused = [key for key in first if key not in stored and key not in bodies]
+    if refused:
+        await idempotency.release_many(db, refused)
+    await db.commit()
+    for key, body in bodies.items():
+        idempotency.remember(key, book_id, first[key].quantity, body)
+    return outcomes
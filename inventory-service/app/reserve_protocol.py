@@ -0,0 +1,92 @@
+"""Compact msgpack encoding for ``POST /stock/reserve/binary``.
+
+The checkout path reserves one or more order lines per call without JSON or pydantic
+on either side. Both directions are msgpack arrays of positional arrays:
+
+  request:  ``[[book_id, quantity, idempotency_key], ...]`` — ``book_id`` as 16 raw
+            bytes (or its string form), ``quantity`` 1-99, the key a string, nil or
+            omitted
+  response: ``[[status, remaining_available, replayed, detail], ...]`` in request
+            order — ``status`` is the HTTP status ``POST /stock/reserve`` would have
+            answered, ``remaining_available`` nil unless 200, ``detail`` nil on success
+
+msgpack is an optional dependency (the ``msgpack`` extra); without it the route
+answers 501.
+"""
+from dataclasses import dataclass
+from uuid import UUID
+
+from app.reservations import Outcome
+
+MEDIA_TYPE = "application/msgpack"
+CONTENT_TYPES = (MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+MAX_ITEMS = 50
+MAX_KEY_LENGTH = 255
+
+
+class ProtocolError(ValueError):
+    """The request body is not a valid reserve batch."""
+
+
+@dataclass(frozen=True)
+class ReserveItem:
+    book_id: UUID
+    quantity: int
+    key: str | None = None
+
+
+def msgpack_available() -> bool:
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _book_id(raw) -> UUID:
+    if isinstance(raw, bytes) and len(raw) == 16:
+        return UUID(bytes=raw)
+    if isinstance(raw, str):
+        return UUID(raw)
+    raise ValueError("book_id must be 16 bytes or a UUID string")
+
+
+def decode_items(body: bytes) -> list[ReserveItem]:
+    """Parse a request body; raises ``ProtocolError`` naming the first bad item."""
+    import msgpack
+
+    try:
+        raw_items = msgpack.unpackb(body, raw=False)
+    except Exception as exc:
+        raise ProtocolError(f"Body is not valid msgpack: {exc}") from exc
+    if not isinstance(raw_items, list) or not 1 <= len(raw_items) <= MAX_ITEMS:
+        raise ProtocolError(f"Body must be an array of 1-{MAX_ITEMS} items")
+    items = []
+    for index, raw in enumerate(raw_items):
+        try:
+            if not isinstance(raw, list) or len(raw) not in (2, 3):
+                raise ValueError("expected [book_id, quantity] or [book_id, quantity, key]")
+            book_id, quantity = _book_id(raw[0]), raw[1]
+            if type(quantity) is not int or not 1 <= quantity <= 99:
+                raise ValueError("quantity must be an integer 1-99")
+            key = raw[2] if len(raw) == 3 else None
+            if key is not None and (not isinstance(key, str) or not 0 < len(key) <= MAX_KEY_LENGTH):
+                raise ValueError(f"idempotency key must be a string of 1-{MAX_KEY_LENGTH} characters")
+        except ValueError as exc:
+            raise ProtocolError(f"Item {index}: {exc}") from exc
+        items.append(ReserveItem(book_id, quantity, key))
+    return items
+
+
+def encode_outcomes(outcomes: list[Outcome]) -> bytes:
+    import msgpack
+
+    return msgpack.packb([
+        [
+            outcome.status_code,
+            outcome.body["remaining_available"] if outcome.body else None,
+            outcome.status == "replayed",
+            outcome.detail,
+        ]
+        for outcome in outcomes
+    ])
@@ -29,6 +29,21 @@ class StockResponse(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class StockChange(StockResponse):
+    version: int = Field(description="Change version of this row (id of the transaction that last wrote it)")
+
+
+class StockChangesResponse(BaseModel):
+    changes: list[StockChange] = Field(description="Rows changed since the request's position, in version order")
+    since: int = Field(description="Pass back as `since` on the next request")
+    after: UUID | None = Field(
+        description="Pass back as `after` on the next request; set only while `complete` is false"
+    )
+    complete: bool = Field(
+        description="True when every change up to the high-water mark `since` has been returned"
+    )
+
+
 class ReserveRequest(BaseModel):
     book_id: UUID = Field(
         description="UUID of the book to reserve stock for",
@@ -73,3 +88,73 @@ class StockAdminResponse(BaseModel):
     reserved: int = Field(description="Current reserved units")
     available: int = Field(description="New available units (quantity - reserved)")
     updated_at: datetime = Field(description="Timestamp of the update")
+
+
+class StockImportError(BaseModel):
+    line: int = Field(description="1-based line number in the uploaded file")
+    reason: str = Field(description="Why the line was rejected")
+
+
+class StockImportResponse(BaseModel):
+    """Admin: summary of a bulk stock import."""
+    mode: str = Field(description="`set` (absolute recount) or `delta` (signed adjustment)")
+    received: int = Field(description="Data lines read from the upload (header and blank lines excluded)")
+    applied: int = Field(description="Distinct books updated")
+    unknown: int = Field(description="Distinct book IDs not present in inventory (skipped)")
+    rejected: int = Field(
+        description="Lines that failed to parse, plus books whose delta would make quantity negative"
+    )
+    errors: list[StockImportError] = Field(description="First 100 parse errors")
+
+
+class StockBatchAdjustItem(BaseModel):
+    book_id: UUID = Field(description="Book UUID")
+    delta: int = Field(
+        description="Units to add (positive) or remove (negative)",
+        examples=[20],
+        ge=-(2**31),
+        le=2**31 - 1,
+    )
+
+
+class StockBatchAdjustRequest(BaseModel):
+    """Admin: apply many signed deltas in one statement."""
+    items: list[StockBatchAdjustItem] = Field(
+        description="Deltas to apply. A book listed more than once has its deltas summed.",
+        min_length=1,
+        max_length=5000,
+    )
+    atomic: bool = Field(
+        default=True,
+        description="`true`: all-or-nothing — nothing is applied if any row is unknown or would go "
+            "negative. `false`: best-effort — valid rows are applied, the rest are reported.",
+    )
+
+
+class StockBatchAdjustResult(BaseModel):
+    book_id: UUID = Field(description="Book UUID")
+    delta: int = Field(description="Net delta requested for this book")
+    status: str = Field(
+        description="`applied`, `not_found`, `negative_quantity`, `quantity_out_of_range` (would exceed "
+            "2147483647), or `skipped` (atomic batch rejected)"
+    )
+    previous_quantity: int | None = Field(description="Quantity before the batch (null if not found)")
+    quantity: int | None = Field(description="Quantity after the batch (null if not found)")
+
+
+class StockBatchAdjustResponse(BaseModel):
+    """Admin: per-row outcomes of a batch adjustment."""
+    atomic: bool = Field(description="Whether the batch ran in all-or-nothing mode")
+    applied: int = Field(description="Number of books updated")
+    results: list[StockBatchAdjustResult] = Field(description="One outcome per distinct book, ordered by book_id")
+
+
+class StockAsOfResponse(BaseModel):
+    """Admin: stock level of one book at a point in time, rebuilt from the movement ledger."""
+    book_id: UUID = Field(description="Book UUID")
+    at: datetime = Field(description="Requested point in time")
+    quantity: int = Field(description="Total quantity at `at`")
+    reserved: int = Field(description="Reserved units at `at`")
+    available: int = Field(description="Available units at `at` (quantity - reserved)")
+    snapshot_taken_at: datetime = Field(description="Snapshot the answer was rebuilt from")
+    movements_applied: int = Field(description="Ledger rows replayed on top of the snapshot")
@@ -0,0 +1,163 @@
+"""OpenTelemetry bootstrap — enabled when OTEL_EXPORTER_OTLP_ENDPOINT is set.
+
+Nothing from ``opentelemetry`` is imported at module import time. ``start()`` runs
+from the lifespan as a background task: the SDK and exporter imports and provider
+setup happen on a worker thread while uvicorn is already answering probes, and the
+request tracing middleware (a pass-through until then) is switched on afterwards.
+Requests served before that point are simply not traced.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from typing import Sequence
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+from app.log_pipeline import BatchingQueueListener
+
+logger = logging.getLogger(__name__)
+
+_tracing_middleware: "LazyTracingMiddleware | None" = None
+_providers: list = []
+# Set once setup has finished; until then the helpers below are no-ops.
+_tracer = None
+_current_span = None
+
+
+def enabled() -> bool:
+    return bool(os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"))
+
+
+def _logs_enabled() -> bool:
+    return os.environ.get("OTEL_LOGS_EXPORTER", "").lower() == "otlp"
+
+
+class LazyTracingMiddleware:
+    """ASGI pass-through that starts delegating to OTel's ASGI middleware once
+    ``start()`` has instrumented it."""
+
+    def __init__(self, app: ASGIApp):
+        global _tracing_middleware
+        self.app = app
+        self._traced: ASGIApp | None = None
+        _tracing_middleware = self
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await (self._traced or self.app)(scope, receive, send)
+
+    def add_middleware(self, middleware_class, **options) -> None:
+        """Called by ``FastAPIInstrumentor.instrument_app`` in place of ``FastAPI.add_middleware``."""
+        self._traced = middleware_class(self.app, **options)
+
+
+def _resource():
+    from opentelemetry.sdk.resources import Resource
+
+    # Shared resource with service name + extra attributes from env
+    attrs = {"service.name": os.environ.get("OTEL_SERVICE_NAME", "inventory-service")}
+    for pair in os.environ.get("OTEL_RESOURCE_ATTRIBUTES", "").split(","):
+        if "=" in pair:
+            k, v = pair.split("=", 1)
+            attrs[k.strip()] = v.strip()
+    return Resource.create(attrs)
+
+
+def _setup(log_listener: BatchingQueueListener | None) -> None:
+    """Heavy part — imports and provider setup. Runs on a worker thread."""
+    global _tracer, _current_span
+    from opentelemetry import trace
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    from opentelemetry.instrumentation.logging import LoggingInstrumentor
+    from opentelemetry.sdk.trace import TracerProvider
+
+    from app import trace_sampling
+
+    resource = _resource()
+
+    # Tracing — adaptive head sampling, failed and slow traces kept regardless
+    provider = TracerProvider(resource=resource, sampler=trace_sampling.sampler())
+    provider.add_span_processor(trace_sampling.span_processor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _providers.append(provider)
+
+    LoggingInstrumentor().instrument(set_logging_format=True)
+
+    # Logging — export Python logs to OTel Collector → Loki, from the log listener thread
+    if _logs_enabled():
+        from opentelemetry._logs import set_logger_provider
+        from opentelemetry.exporter.otlp.proto.http._log_exporter import OTLPLogExporter
+        from opentelemetry.sdk._logs import LoggerProvider, LoggingHandler
+        from opentelemetry.sdk._logs.export import BatchLogRecordProcessor
+
+        log_provider = LoggerProvider(resource=resource)
+        log_provider.add_log_record_processor(BatchLogRecordProcessor(OTLPLogExporter()))
+        set_logger_provider(log_provider)
+        _providers.append(log_provider)
+        if log_listener is not None:
+            log_listener.add_handler(LoggingHandler(level=logging.INFO, logger_provider=log_provider))
+
+    # Imported here so the first instrumented request does not pay for it on the loop.
+    from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor  # noqa: F401
+
+    _tracer = provider.get_tracer(__name__)
+    _current_span = trace.get_current_span
+
+
+async def start(log_listener: BatchingQueueListener | None = None) -> None:
+    """Set up tracing and log export off the event loop, then enable request tracing."""
+    if not enabled():
+        return
+    started = time.perf_counter()
+    await asyncio.to_thread(_setup, log_listener)
+    if _tracing_middleware is not None:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+
+        FastAPIInstrumentor.instrument_app(_tracing_middleware)
+    logger.info("OpenTelemetry ready in %.0fms", (time.perf_counter() - started) * 1000)
+
+
+async def shutdown() -> None:
+    """Flush buffered spans and log records."""
+    for provider in reversed(_providers):
+        await asyncio.to_thread(provider.shutdown)
+    _providers.clear()
+
+
+def trace_exemplar(seconds: float, failed: bool = False) -> dict[str, str] | None:
+    """Exemplar labels (``{"trace_id": ...}``) linking a metric observation to the
+    current trace — only if that trace will reach the collector: head-sampled, or
+    failed / slow enough for ``app.trace_sampling`` to keep it."""
+    if _current_span is None:
+        return None
+    span = _current_span()
+    ctx = span.get_span_context()
+    if not ctx.is_valid:
+        return None
+    kept = span.is_recording() and (failed or seconds * 1000 >= settings.trace_keep_slower_than_ms)
+    if not (ctx.trace_flags.sampled or kept):
+        return None
+    return {"trace_id": format(ctx.trace_id, "032x")}
+
+
+def consumer_span(name: str, headers: Sequence[tuple[str, bytes]] | None):
+    """Span for processing one consumed message, continuing the producer's trace from
+    the W3C headers on the record. Yields ``None`` until telemetry has started."""
+    if _tracer is None:
+        return contextlib.nullcontext()
+    from opentelemetry import propagate
+    from opentelemetry.trace import SpanKind
+
+    carrier = {key: value.decode("latin-1") for key, value in headers or () if value is not None}
+    return _tracer.start_as_current_span(name, context=propagate.extract(carrier), kind=SpanKind.CONSUMER)
+
+
+def mark_failed(span, description: str) -> None:
+    """Set error status on a span from ``consumer_span`` (``None`` is ignored)."""
+    if span is None:
+        return
+    from opentelemetry.trace import Status, StatusCode
+
+    span.set_status(Status(StatusCode.ERROR, description))
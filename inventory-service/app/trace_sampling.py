@@ -0,0 +1,257 @@
+"""Adaptive trace sampling — imported by ``app.telemetry`` once the SDK is loaded.
+
+Head sampling picks a ratio per server span name (``"GET /stock/bulk"``), falling
+back to ``trace_sample_rate``. Traces that lose the coin toss are still *recorded*
+(``RECORD_ONLY``) rather than dropped: their spans are held in memory until the
+local root span ends, and the whole trace is exported anyway if any span failed
+(error status, or an HTTP status in ``trace_keep_status_codes`` — 409 is a failed
+reservation) or ran longer than ``trace_keep_slower_than_ms``. Everything else is
+discarded without touching the exporter queue.
+
+The export queue's depth and limits and every drop are exported as Prometheus metrics.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import Sequence
+
+from opentelemetry.instrumentation.utils import suppress_instrumentation
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import Decision, Sampler, SamplingResult, TraceIdRatioBased
+from opentelemetry.trace import SpanContext, StatusCode, TraceFlags, get_current_span
+from prometheus_client import Counter, Gauge
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+trace_spans_total = Counter(
+    "inventory_trace_spans_total",
+    "Ended spans by sampling outcome (sampled = head-sampled, retained_* = kept after the fact)",
+    ["decision"],
+)
+trace_spans_dropped_total = Counter(
+    "inventory_trace_spans_dropped_total",
+    "Spans that were meant for export but never reached the collector",
+    ["reason"],
+)
+trace_export_queue_spans = Gauge(
+    "inventory_trace_export_queue_spans", "Spans waiting in the export queue"
+)
+trace_export_queue_capacity = Gauge(
+    "inventory_trace_export_queue_capacity", "Maximum spans held by the export queue"
+)
+trace_export_batch_size = Gauge(
+    "inventory_trace_export_batch_size", "Maximum spans sent per export request"
+)
+
+_STATUS_ATTRIBUTES = ("http.status_code", "http.response.status_code")
+
+
+def _bound(rate: float) -> int:
+    return TraceIdRatioBased.get_bound_for_rate(min(max(rate, 0.0), 1.0))
+
+
+class AdaptiveSampler(Sampler):
+    """Parent-based sampler with per-span-name ratios; unsampled spans are RECORD_ONLY."""
+
+    def __init__(self, rate: float, rates_by_name: dict[str, float]):
+        self._default = _bound(rate)
+        self._bounds = {name: _bound(value) for name, value in rates_by_name.items()}
+        self._description = f"AdaptiveSampler{{{rate}, {rates_by_name}}}"
+
+    def should_sample(
+        self, parent_context, trace_id, name, kind=None, attributes=None, links=None, trace_state=None
+    ) -> SamplingResult:
+        parent = get_current_span(parent_context).get_span_context()
+        if parent.is_valid:
+            sampled = parent.trace_flags.sampled
+            trace_state = parent.trace_state
+        else:
+            sampled = trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < self._bounds.get(name, self._default)
+        decision = Decision.RECORD_AND_SAMPLE if sampled else Decision.RECORD_ONLY
+        return SamplingResult(decision, attributes, trace_state)
+
+    def get_description(self) -> str:
+        return self._description
+
+
+def _keep_reason(span: ReadableSpan) -> str | None:
+    if span.status.status_code is StatusCode.ERROR:
+        return "error"
+    attributes = span.attributes or {}
+    if any(attributes.get(key) in settings.trace_keep_status_codes for key in _STATUS_ATTRIBUTES):
+        return "error"
+    if (span.end_time - span.start_time) / 1e6 >= settings.trace_keep_slower_than_ms:
+        return "slow"
+    return None
+
+
+def _as_sampled(span: ReadableSpan) -> ReadableSpan:
+    """Copy of ``span`` with the sampled flag set, as exported spans of a sampled trace."""
+    ctx = span.context
+    return ReadableSpan(
+        name=span.name,
+        context=SpanContext(ctx.trace_id, ctx.span_id, ctx.is_remote, TraceFlags(TraceFlags.SAMPLED), ctx.trace_state),
+        parent=span.parent,
+        resource=span.resource,
+        attributes=span.attributes,
+        events=span.events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope,
+    )
+
+
+class _CountingExporter(SpanExporter):
+    """Counts spans in failed export requests; otherwise delegates."""
+
+    def __init__(self, exporter: SpanExporter):
+        self._exporter = exporter
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        result = self._exporter.export(spans)
+        if result is not SpanExportResult.SUCCESS:
+            trace_spans_dropped_total.labels(reason="export_failed").inc(len(spans))
+        return result
+
+    def shutdown(self) -> None:
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._exporter.force_flush(timeout_millis)
+
+
+class RetainingSpanProcessor(SpanProcessor):
+    """Batching span processor that also exports unsampled traces which failed or ran slow.
+
+    Spans of an unsampled trace are buffered per trace id until its local root span
+    ends. At most ``max_pending_traces`` traces are buffered; the oldest is discarded
+    (and counted) beyond that. Spans to export go through a bounded queue drained by
+    an export thread every ``schedule_delay_millis``, or as soon as a full batch is
+    waiting. Only the public ``SpanProcessor``/``SpanExporter`` API is used, so SDK
+    upgrades that rework ``BatchSpanProcessor`` internals don't affect it.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_pending_traces: int,
+        max_queue_size: int = 2048,
+        max_export_batch_size: int = 512,
+        schedule_delay_millis: float = 5000,
+    ):
+        self._exporter = _CountingExporter(exporter)
+        self._max_pending = max_pending_traces
+        self._pending: OrderedDict[int, tuple[list[ReadableSpan], str | None]] = OrderedDict()
+        self._pending_lock = threading.Lock()
+        self._queue: deque[ReadableSpan] = deque()
+        self._max_queue_size = max_queue_size
+        self._batch_size = max_export_batch_size
+        self._delay = schedule_delay_millis / 1000
+        self._condition = threading.Condition()
+        self._export_lock = threading.Lock()
+        self._done = False
+        trace_export_queue_spans.set_function(lambda: len(self._queue))
+        trace_export_queue_capacity.set(max_queue_size)
+        trace_export_batch_size.set(max_export_batch_size)
+        self._worker = threading.Thread(target=self._run, name="span-export", daemon=True)
+        self._worker.start()
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if span.context.trace_flags.sampled:
+            trace_spans_total.labels(decision="sampled").inc()
+            self._enqueue(span)
+            return
+
+        trace_id = span.context.trace_id
+        local_root = span.parent is None or span.parent.is_remote
+        with self._pending_lock:
+            spans, reason = self._pending.pop(trace_id, ([], None))
+            spans.append(span)
+            reason = reason or _keep_reason(span)
+            if not local_root:
+                self._pending[trace_id] = (spans, reason)
+                if len(self._pending) > self._max_pending:
+                    evicted, _ = self._pending.popitem(last=False)[1]
+                    trace_spans_dropped_total.labels(reason="pending_overflow").inc(len(evicted))
+                return
+
+        if reason is None:
+            trace_spans_total.labels(decision="discarded").inc(len(spans))
+            return
+        trace_spans_total.labels(decision=f"retained_{reason}").inc(len(spans))
+        for pending in spans:
+            self._enqueue(_as_sampled(pending))
+
+    def _enqueue(self, span: ReadableSpan) -> None:
+        with self._condition:
+            if self._done:
+                return
+            if len(self._queue) >= self._max_queue_size:
+                trace_spans_dropped_total.labels(reason="queue_full").inc()
+                return
+            self._queue.append(span)
+            if len(self._queue) >= self._batch_size:
+                self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._done and len(self._queue) < self._batch_size:
+                    self._condition.wait(self._delay)
+                if self._done:
+                    return
+            self._export_queued()
+
+    def _export_queued(self) -> None:
+        """Export everything queued so far, one batch at a time."""
+        with self._export_lock:
+            while True:
+                with self._condition:
+                    batch = [self._queue.popleft() for _ in range(min(self._batch_size, len(self._queue)))]
+                if not batch:
+                    return
+                # The exporter's own HTTP calls must not produce spans.
+                with suppress_instrumentation():
+                    try:
+                        self._exporter.export(batch)
+                    except Exception:
+                        trace_spans_dropped_total.labels(reason="export_failed").inc(len(batch))
+                        logger.exception("Span export failed")
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        self._export_queued()
+        return True
+
+    def shutdown(self) -> None:
+        with self._condition:
+            if self._done:
+                return
+            self._done = True
+            self._condition.notify()
+        self._worker.join()
+        self._export_queued()
+        self._exporter.shutdown()
+
+
+def sampler() -> Sampler | None:
+    """The adaptive sampler, or ``None`` to let ``OTEL_TRACES_SAMPLER`` decide when set."""
+    if os.environ.get("OTEL_TRACES_SAMPLER"):
+        return None
+    return AdaptiveSampler(settings.trace_sample_rate, settings.trace_sample_rates)
+
+
+def span_processor(exporter: SpanExporter) -> RetainingSpanProcessor:
+    return RetainingSpanProcessor(
+        exporter,
+        max_pending_traces=settings.trace_export_queue_size,
+        max_queue_size=settings.trace_export_queue_size,
+        max_export_batch_size=settings.trace_export_batch_size,
+        schedule_delay_millis=settings.trace_export_delay_ms,
+    )
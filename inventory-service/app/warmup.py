@@ -0,0 +1,125 @@
+"""Startup warm-up — gates ``/health/ready`` until the pod can serve at steady-state latency.
+
+Without it the first requests after a rollout pay for opening asyncpg connections,
+compiling and preparing the stock statements and fetching the JWKS from Keycloak,
+which shows up as a p99 spike on every deploy. The steps run concurrently:
+
+  - ``database``: opens ``pool_size`` connections at once and runs the hot statements
+    on each, so SQLAlchemy's compiled cache and every connection's asyncpg
+    prepared-statement cache are populated before traffic arrives.
+  - ``jwks``: waits for the first JWKS fetch (joins the refresher's in-flight fetch).
+  - ``stock_rows`` (``WARMUP_PRELOAD_STOCK_ROWS`` > 0): reads the most recently updated
+    rows through the bulk-lookup query, pulling their heap and index pages into
+    Postgres' shared buffers. There is no in-process stock cache to fill.
+
+A failed step is logged and does not hold readiness back — the readiness probe still
+checks the database itself. Warm-up ends after ``WARMUP_TIMEOUT_SECONDS`` at the latest.
+"""
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from uuid import UUID
+
+from prometheus_client import Gauge
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import AsyncSessionLocal, engine
+from app.middleware.auth import refresh_jwks
+from app.models.inventory import Inventory
+
+logger = logging.getLogger(__name__)
+
+_BULK_CHUNK = 50  # GET /stock/bulk accepts at most 50 ids
+_NO_BOOK = UUID(int=0)
+
+warmup_step_seconds = Gauge(
+    "inventory_warmup_step_seconds",
+    "Duration of each startup warm-up step (result: ok, failed, timed_out)",
+    ["step", "result"],
+)
+warmup_complete = Gauge(
+    "inventory_warmup_complete",
+    "1 once startup warm-up has finished or timed out and readiness may pass",
+)
+
+_complete = False
+
+
+def is_complete() -> bool:
+    return _complete
+
+
+async def _prime_connection(session: AsyncSession) -> None:
+    """Run the statements behind GET /stock/{id}, GET /stock/bulk and POST /stock/reserve."""
+    await session.execute(select(Inventory).where(Inventory.book_id == _NO_BOOK))
+    await session.execute(select(Inventory).where(Inventory.book_id.in_([_NO_BOOK])))
+    await session.execute(select(Inventory).where(Inventory.book_id == _NO_BOOK).with_for_update())
+    await session.rollback()
+
+
+async def _warm_database() -> None:
+    async with AsyncExitStack() as stack:
+        # All sessions are held at once so the pool opens pool_size distinct connections.
+        sessions = [await stack.enter_async_context(AsyncSessionLocal()) for _ in range(engine.pool.size())]
+        # Let every connection finish before the sessions close, even if some fail.
+        results = await asyncio.gather(
+            *(_prime_connection(session) for session in sessions), return_exceptions=True
+        )
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        raise RuntimeError(f"{len(failures)} of {len(sessions)} connections failed: {failures[0]!r}")
+
+
+async def _warm_jwks() -> None:
+    if not await refresh_jwks("warmup"):
+        raise RuntimeError("no signing keys")
+
+
+async def _preload_stock_rows() -> None:
+    async with AsyncSessionLocal() as session:
+        ids = (
+            await session.scalars(
+                select(Inventory.book_id)
+                .order_by(Inventory.updated_at.desc())
+                .limit(settings.warmup_preload_stock_rows)
+            )
+        ).all()
+        for start in range(0, len(ids), _BULK_CHUNK):
+            await session.execute(select(Inventory).where(Inventory.book_id.in_(ids[start:start + _BULK_CHUNK])))
+    logger.info("Warm-up preloaded %d stock rows", len(ids))
+
+
+async def _step(name: str, warm) -> None:
+    started = time.perf_counter()
+    result = "failed"
+    try:
+        await warm()
+        result = "ok"
+    except asyncio.CancelledError:
+        result = "timed_out"
+        raise
+    except Exception as exc:
+        logger.warning("Warm-up step %s failed: %s", name, exc)
+    finally:
+        warmup_step_seconds.labels(step=name, result=result).set(time.perf_counter() - started)
+
+
+async def run() -> None:
+    """Run the warm-up steps, then mark the process ready to receive traffic."""
+    global _complete
+    _complete = False
+    warmup_complete.set(0)
+    steps = [_step("database", _warm_database), _step("jwks", _warm_jwks)]
+    if settings.warmup_preload_stock_rows > 0:
+        steps.append(_step("stock_rows", _preload_stock_rows))
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.gather(*steps), settings.warmup_timeout_seconds)
+        logger.info("Warm-up finished in %.2fs", time.perf_counter() - started)
+    except asyncio.TimeoutError:
+        logger.warning("Warm-up timed out after %.1fs — accepting traffic anyway", settings.warmup_timeout_seconds)
+    _complete = True
+    warmup_complete.set(1)
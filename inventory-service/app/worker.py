@@ -0,0 +1,85 @@
+"""Background worker — Kafka consumers and the periodic jobs, without the HTTP API.
+
+    python -m app.worker
+
+Run it next to API processes started with ``SERVICE_ROLE=api``, which then only serve
+HTTP and can use several uvicorn workers. With the default ``SERVICE_ROLE=all`` the API
+process starts these tasks itself and must stay at a single uvicorn worker.
+
+Prometheus metrics are served on ``WORKER_METRICS_PORT``. SIGTERM / SIGINT stop the
+tasks and exit.
+"""
+import asyncio
+import logging
+import signal
+
+from prometheus_client import start_http_server
+
+from app import idempotency, telemetry
+from app.config import settings
+from app.kafka import consumer
+from app.kafka.dlq_consumer import run_dlq_consumer_supervised
+from app.ledger import run_snapshot_job
+from app.log_pipeline import BatchingQueueListener, configure_logging
+from app.loop_monitor import run_loop_monitor
+
+logger = logging.getLogger(__name__)
+
+
+def start_tasks() -> list[asyncio.Task]:
+    """Start the consumers, the snapshot job and the idempotency-key pruner on the running loop."""
+    logger.info("Starting Kafka consumer (supervised)...")
+    return [
+        asyncio.create_task(consumer.run_consumer_supervised(), name="kafka-consumer"),
+        asyncio.create_task(run_dlq_consumer_supervised(), name="dlq-consumer"),
+        asyncio.create_task(run_snapshot_job(), name="ledger-snapshot"),
+        asyncio.create_task(idempotency.run_pruner(), name="idempotency-pruner"),
+    ]
+
+
+async def stop_tasks(tasks: list[asyncio.Task]) -> None:
+    """Drain the order consumer (see ``consumer.drain``), then cancel the rest."""
+    for task in tasks:
+        if task.get_name() == "kafka-consumer":
+            await consumer.drain(task, settings.consumer_drain_timeout_seconds)
+    for task in tasks:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+async def run(log_listener: BatchingQueueListener | None = None) -> None:
+    """Run until SIGTERM / SIGINT."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    telemetry_task = asyncio.create_task(telemetry.start(log_listener), name="telemetry-setup")
+    loop_monitor_task = asyncio.create_task(run_loop_monitor(), name="loop-monitor")
+    tasks = start_tasks()
+    await stop.wait()
+
+    logger.info("Inventory worker shutting down...")
+    await stop_tasks([*tasks, loop_monitor_task])
+    telemetry_task.cancel()
+    try:
+        await telemetry_task
+    except asyncio.CancelledError:
+        pass
+    except Exception as exc:
+        logger.error("OpenTelemetry setup failed: %s", exc)
+    await telemetry.shutdown()
+    logger.info("Inventory worker stopped.")
+
+
+def main() -> None:
+    log_listener = configure_logging()
+    start_http_server(settings.worker_metrics_port)
+    asyncio.run(run(log_listener))
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,9 @@ os.environ.setdefault("KEYCLOAK_JWKS_URI", "http://localhost:8080/realms/test/pr
 os.environ.setdefault("KEYCLOAK_ISSUER_URI", "http://localhost:8080/realms/test")
 os.environ.setdefault("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 
+from app import idempotency
+from app.database import get_db
+from app.main import app
 from app.models.inventory import Inventory
 
 
@@ -48,3 +51,20 @@ def book_id_2():
 @pytest.fixture
 def sample_inventory():
     return make_inventory(BOOK_ID_1, quantity=50, reserved=5)
+
+
+@pytest.fixture
+def mock_db():
+    """AsyncMock session served for ``get_db``; the idempotency cache starts empty."""
+    session = AsyncMock()
+    app.dependency_overrides[get_db] = lambda: session
+    idempotency._cache.clear()
+    yield session
+    app.dependency_overrides.clear()
+    idempotency._cache.clear()
+
+
+@pytest.fixture
+def client(mock_db):
+    with TestClient(app, raise_server_exceptions=False) as c:
+        yield c
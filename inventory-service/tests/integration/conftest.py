@@ -13,6 +13,7 @@ from uuid import UUID
 
 import pytest
 import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from testcontainers.postgres import PostgresContainer
 
@@ -113,8 +114,38 @@ def app_with_test_db(async_session_factory, sync_db_url):
 @pytest.fixture
 def client(app_with_test_db):
     """Provide an httpx AsyncClient configured for the test app."""
-    from httpx import ASGITransport, AsyncClient
+    transport = ASGITransport(app=app_with_test_db)
+    return AsyncClient(transport=transport, base_url="http://test")
+
+
+@pytest.fixture
+def admin_client(app_with_test_db):
+    """Client with admin auth dependency overridden to bypass JWT validation."""
+    from app.middleware.auth import get_current_user
+
+    async def mock_admin_user():
+        return {
+            "sub": "admin-test-user",
+            "roles": ["admin", "customer"],
+        }
+
+    app_with_test_db.dependency_overrides[get_current_user] = mock_admin_user
+    transport = ASGITransport(app=app_with_test_db)
+    return AsyncClient(transport=transport, base_url="http://test")
+
+
+@pytest.fixture
+def customer_client(app_with_test_db):
+    """Client with customer-only role (no admin access)."""
+    from app.middleware.auth import get_current_user
+
+    async def mock_customer_user():
+        return {
+            "sub": "customer-test-user",
+            "roles": ["customer"],
+        }
 
+    app_with_test_db.dependency_overrides[get_current_user] = mock_customer_user
     transport = ASGITransport(app=app_with_test_db)
     return AsyncClient(transport=transport, base_url="http://test")
 
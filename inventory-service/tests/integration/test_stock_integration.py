@@ -194,37 +194,6 @@ class TestReserveStock:
 class TestAdminEndpoints:
     """Admin stock management endpoints — require admin role."""
 
-    @pytest.fixture
-    def admin_client(self, app_with_test_db):
-        """Client with admin auth dependency overridden to bypass JWT validation."""
-        from app.middleware.auth import get_current_user, require_role
-
-        # Override the auth dependency to return an admin user payload
-        async def mock_admin_user():
-            return {
-                "sub": "admin-test-user",
-                "roles": ["admin", "customer"],
-            }
-
-        app_with_test_db.dependency_overrides[get_current_user] = mock_admin_user
-        transport = ASGITransport(app=app_with_test_db)
-        return AsyncClient(transport=transport, base_url="http://test")
-
-    @pytest.fixture
-    def customer_client(self, app_with_test_db):
-        """Client with customer-only role (no admin access)."""
-        from app.middleware.auth import get_current_user
-
-        async def mock_customer_user():
-            return {
-                "sub": "customer-test-user",
-                "roles": ["customer"],
-            }
-
-        app_with_test_db.dependency_overrides[get_current_user] = mock_customer_user
-        transport = ASGITransport(app=app_with_test_db)
-        return AsyncClient(transport=transport, base_url="http://test")
-
     async def test_list_stock_as_admin(self, admin_client):
         """Admin should be able to list all stock entries."""
         async with admin_client:
@@ -307,6 +276,303 @@ class TestAdminEndpoints:
         assert response.status_code == 403
 
 
+class TestAdminStockListing:
+    """GET /admin/stock — keyset pagination, filters and counts."""
+
+    async def test_cursor_pages_cover_all_rows_in_order(self, admin_client):
+        """Following X-Next-Cursor visits every row once, in book_id order."""
+        seen = []
+        async with admin_client:
+            response = await admin_client.get("/admin/stock?size=3")
+            while True:
+                assert response.status_code == 200
+                seen.extend(item["book_id"] for item in response.json())
+                cursor = response.headers.get("x-next-cursor")
+                if cursor is None:
+                    break
+                response = await admin_client.get(f"/admin/stock?size=3&cursor={cursor}")
+
+        assert seen == sorted(seen)
+        assert len(seen) == len(set(seen))
+        assert {str(b) for b in BOOK_IDS} <= set(seen)
+
+    async def test_malformed_cursor_returns_400(self, admin_client):
+        async with admin_client:
+            response = await admin_client.get("/admin/stock?cursor=not-a-cursor")
+
+        assert response.status_code == 400
+
+    async def test_low_stock_filter(self, admin_client):
+        """low_stock_below only returns books with available < threshold."""
+        book_id = BOOK_IDS[8]  # book #9
+        async with admin_client:
+            await admin_client.put(f"/admin/stock/{book_id}", json={"quantity": 2})
+            response = await admin_client.get("/admin/stock?low_stock_below=3")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert str(book_id) in {item["book_id"] for item in data}
+        assert all(item["available"] < 3 for item in data)
+
+    async def test_exact_count_on_request(self, admin_client):
+        async with admin_client:
+            estimated = await admin_client.get("/admin/stock")
+            exact = await admin_client.get("/admin/stock?exact_count=true")
+
+        assert estimated.headers["x-total-count-exact"] == "false"
+        assert int(estimated.headers["x-total-count"]) >= 0
+        assert exact.headers["x-total-count-exact"] == "true"
+        assert int(exact.headers["x-total-count"]) >= 10
+
+
+class TestStockChanges:
+    """GET /stock/changes — delta sync by row version."""
+
+    async def _drain(self, client, since: int, size: int = 500) -> tuple[list[dict], int]:
+        changes, after = [], None
+        while True:
+            params = {"since": since, "size": size}
+            if after is not None:
+                params["after"] = after
+            response = await client.get("/stock/changes", params=params)
+            assert response.status_code == 200
+            body = response.json()
+            changes.extend(body["changes"])
+            since, after = body["since"], body["after"]
+            if body["complete"]:
+                return changes, since
+
+    async def test_pages_cover_every_row_once(self, client):
+        async with client:
+            changes, _ = await self._drain(client, since=0, size=3)
+
+        ids = [c["book_id"] for c in changes]
+        assert len(ids) == len(set(ids))
+        assert {str(b) for b in BOOK_IDS} <= set(ids)
+        keys = [(c["version"], c["book_id"]) for c in changes]
+        assert keys == sorted(keys)
+
+    async def test_only_rows_changed_since_the_high_water_mark(self, client, admin_client):
+        async with client:
+            _, since = await self._drain(client, since=0)
+        async with admin_client:
+            await admin_client.post(f"/admin/stock/{BOOK_ID_2}/adjust", json={"delta": 1})
+        async with client:
+            changes, next_since = await self._drain(client, since=since)
+
+        assert [c["book_id"] for c in changes] == [str(BOOK_ID_2)]
+        assert changes[0]["version"] >= since
+        assert next_since > changes[0]["version"]
+
+
+class TestAdminStockBatchAdjust:
+    """POST /admin/stock/adjust/batch — one UPDATE for many deltas."""
+
+    async def test_atomic_batch_rejected_when_any_row_fails(self, admin_client):
+        book_id = BOOK_IDS[3]  # book #4
+        async with admin_client:
+            before = (await admin_client.get(f"/stock/{book_id}")).json()["quantity"]
+            response = await admin_client.post("/admin/stock/adjust/batch", json={
+                "items": [
+                    {"book_id": str(book_id), "delta": 5},
+                    {"book_id": str(UNKNOWN_BOOK_ID), "delta": 1},
+                ],
+            })
+            after = (await admin_client.get(f"/stock/{book_id}")).json()["quantity"]
+
+        assert response.status_code == 409
+        statuses = {r["book_id"]: r["status"] for r in response.json()["results"]}
+        assert statuses == {str(book_id): "skipped", str(UNKNOWN_BOOK_ID): "not_found"}
+        assert after == before
+
+    async def test_best_effort_batch_applies_valid_rows(self, admin_client):
+        book_a, book_b = BOOK_IDS[3], BOOK_IDS[6]  # books #4 and #7
+        async with admin_client:
+            before_a = (await admin_client.get(f"/stock/{book_a}")).json()["quantity"]
+            response = await admin_client.post("/admin/stock/adjust/batch", json={
+                "atomic": False,
+                "items": [
+                    {"book_id": str(book_a), "delta": 4},
+                    {"book_id": str(book_a), "delta": -1},
+                    {"book_id": str(book_b), "delta": -100000},
+                ],
+            })
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["applied"] == 1
+        results = {r["book_id"]: r for r in body["results"]}
+        assert results[str(book_a)]["status"] == "applied"
+        assert results[str(book_a)]["quantity"] == before_a + 3
+        assert results[str(book_b)]["status"] == "negative_quantity"
+
+
+class TestAdminStockImport:
+    """POST /admin/stock/import — COPY staging + set-based merge."""
+
+    async def test_csv_set_import(self, admin_client):
+        book_a, book_b = BOOK_IDS[7], BOOK_IDS[9]  # books #8 and #10
+        body = (
+            "book_id,quantity\n"
+            f"{book_a},70\n"
+            f"{book_b},5\n"
+            f"{book_b},80\n"  # duplicate — last line wins
+            f"{UNKNOWN_BOOK_ID},1\n"
+            "not-a-uuid,3\n"
+        )
+        async with admin_client:
+            response = await admin_client.post(
+                "/admin/stock/import?mode=set", content=body, headers={"Content-Type": "text/csv"}
+            )
+            stock_a = (await admin_client.get(f"/stock/{book_a}")).json()
+            stock_b = (await admin_client.get(f"/stock/{book_b}")).json()
+
+        assert response.status_code == 200
+        summary = response.json()
+        assert summary["received"] == 5
+        assert summary["applied"] == 2
+        assert summary["unknown"] == 1
+        assert summary["rejected"] == 1
+        assert summary["errors"][0]["line"] == 6
+        assert stock_a["quantity"] == 70 and stock_a["reserved"] == 0
+        assert stock_b["quantity"] == 80
+
+    async def test_ndjson_delta_import_rejects_negative_result(self, admin_client):
+        book_a, book_b = BOOK_IDS[7], BOOK_IDS[9]
+        async with admin_client:
+            before_a = (await admin_client.get(f"/stock/{book_a}")).json()["quantity"]
+            before_b = (await admin_client.get(f"/stock/{book_b}")).json()["quantity"]
+            body = (
+                f'{{"book_id": "{book_a}", "delta": 3}}\n'
+                f'{{"book_id": "{book_a}", "delta": 2}}\n'
+                f'{{"book_id": "{book_b}", "delta": -100000}}\n'
+            )
+            response = await admin_client.post(
+                "/admin/stock/import?mode=delta", content=body,
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+            after_a = (await admin_client.get(f"/stock/{book_a}")).json()["quantity"]
+            after_b = (await admin_client.get(f"/stock/{book_b}")).json()["quantity"]
+
+        assert response.status_code == 200
+        assert response.json()["applied"] == 1
+        assert response.json()["rejected"] == 1
+        assert after_a == before_a + 5
+        assert after_b == before_b
+
+    async def test_unsupported_content_type_returns_415(self, admin_client):
+        async with admin_client:
+            response = await admin_client.post(
+                "/admin/stock/import", content="{}", headers={"Content-Type": "application/json"}
+            )
+
+        assert response.status_code == 415
+
+
+class TestAdminStockExport:
+    """GET /admin/stock/export — streamed from a server-side cursor."""
+
+    async def test_csv_export_contains_every_row(self, admin_client):
+        async with admin_client:
+            response = await admin_client.get("/admin/stock/export?format=csv")
+            total = int((await admin_client.get("/admin/stock?exact_count=true")).headers["x-total-count"])
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        lines = response.text.strip().splitlines()
+        assert lines[0] == "book_id,quantity,reserved,available,updated_at"
+        assert len(lines) - 1 == total
+        ids = [line.split(",")[0] for line in lines[1:]]
+        assert ids == sorted(ids)
+
+    async def test_ndjson_export(self, admin_client):
+        import json
+
+        async with admin_client:
+            response = await admin_client.get("/admin/stock/export?format=ndjson")
+
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert {str(b) for b in BOOK_IDS} <= {r["book_id"] for r in rows}
+
+
+class TestStockLedger:
+    """Movement ledger written with each mutation; point-in-time reads."""
+
+    async def test_adjust_writes_ledger_row(self, admin_client, db_session):
+        book_id = BOOK_IDS[5]  # book #6
+        async with admin_client:
+            response = await admin_client.post(f"/admin/stock/{book_id}/adjust", json={"delta": 7})
+        assert response.status_code == 200
+
+        row = (await db_session.execute(text(
+            "SELECT kind, quantity_delta, quantity_after FROM stock_movement "
+            "WHERE book_id = :b ORDER BY occurred_at DESC, id DESC LIMIT 1"
+        ), {"b": book_id})).one()
+        assert row.kind == "adjust"
+        assert row.quantity_delta == 7
+        assert row.quantity_after == response.json()["quantity"]
+
+    async def test_as_of_matches_current_stock_after_compaction(self, admin_client):
+        from datetime import datetime, timedelta, timezone
+
+        from app import ledger
+
+        book_id = BOOK_IDS[5]
+        async with admin_client:
+            await admin_client.post(f"/admin/stock/{book_id}/adjust", json={"delta": -2})
+            current = (await admin_client.get(f"/stock/{book_id}")).json()
+            at = (datetime.now(timezone.utc) + timedelta(seconds=1)).isoformat()
+
+            before = await admin_client.get(f"/admin/stock/{book_id}/as-of", params={"at": at})
+            await ledger.compact_once()
+            after = await admin_client.get(f"/admin/stock/{book_id}/as-of", params={"at": at})
+            too_early = await admin_client.get(
+                f"/admin/stock/{book_id}/as-of", params={"at": "2000-01-01T00:00:00+00:00"}
+            )
+
+        for response in (before, after):
+            assert response.status_code == 200
+            assert response.json()["quantity"] == current["quantity"]
+            assert response.json()["reserved"] == current["reserved"]
+        assert after.json()["movements_applied"] == 0
+        assert too_early.status_code == 404
+
+    async def test_movement_committed_after_a_later_snapshot_is_compacted(
+        self, admin_client, async_session_factory
+    ):
+        from app import ledger
+
+        book_id = BOOK_IDS[6]
+        async with async_session_factory() as writer:
+            # Opens the writer's transaction, fixing its now() before the run is cut.
+            started = (await writer.execute(text("SELECT now()"))).scalar_one()
+            assert await ledger.compact_once() is not None
+            async with async_session_factory() as reader:
+                taken_at = (await reader.execute(
+                    text("SELECT max(taken_at) FROM stock_snapshot_run")
+                )).scalar_one()
+            assert taken_at > started
+
+            row = (await writer.execute(text(
+                "UPDATE inventory SET quantity = quantity + 3 WHERE book_id = :b "
+                "RETURNING quantity, reserved"
+            ), {"b": book_id})).one()
+            await ledger.record_movement(
+                writer, book_id, ledger.ADJUST, quantity_delta=3,
+                quantity_after=row.quantity, reserved_after=row.reserved,
+            )
+            await writer.commit()
+
+        assert await ledger.compact_once() is not None
+        async with async_session_factory() as reader:
+            snapshot = (await reader.execute(text(
+                "SELECT quantity, reserved FROM stock_snapshot WHERE book_id = :b "
+                "ORDER BY taken_at DESC LIMIT 1"
+            ), {"b": book_id})).one()
+        assert (snapshot.quantity, snapshot.reserved) == (row.quantity, row.reserved)
+
+
 # ── Health endpoints ────────────────────────────────────────────────────────
 
 
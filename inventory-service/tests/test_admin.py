@@ -0,0 +1,174 @@
+"""Unit tests for admin stock endpoints."""
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError
+
+from app.api.admin import _decode_cursor, _encode_cursor
+from app.database import get_db
+from app.main import app
+from app.middleware.auth import get_current_user
+
+from tests.conftest import BOOK_ID_1, BOOK_ID_2, make_inventory
+
+
+def _result(items: list | None = None, scalar: object | None = None):
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = items or []
+    result.scalar_one.return_value = scalar
+    return result
+
+
+@pytest.fixture
+def admin_client():
+    """Test client with the JWT dependency replaced by an admin payload."""
+    app.dependency_overrides[get_current_user] = lambda: {"sub": "admin", "roles": ["admin"]}
+    with TestClient(app, raise_server_exceptions=False) as c:
+        yield c
+    app.dependency_overrides.clear()
+
+
+class TestCursor:
+    """Tests for the opaque keyset cursor."""
+
+    def test_round_trip(self):
+        assert _decode_cursor(_encode_cursor(BOOK_ID_1)) == BOOK_ID_1
+
+    def test_cursor_is_url_safe(self):
+        cursor = _encode_cursor(BOOK_ID_2)
+        assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+
+    @pytest.mark.parametrize("cursor", ["not-a-cursor", "AAAA", "!!"])
+    def test_malformed_cursor_rejected(self, cursor):
+        with pytest.raises(HTTPException) as exc_info:
+            _decode_cursor(cursor)
+        assert exc_info.value.status_code == 400
+
+
+class TestListStock:
+    """Tests for GET /admin/stock."""
+
+    def test_full_page_sets_next_cursor_and_estimate(self, admin_client):
+        """A full page returns X-Next-Cursor for its last row and a planner estimate."""
+        items = [make_inventory(BOOK_ID_1), make_inventory(BOOK_ID_2)]
+        db = AsyncMock()
+        db.execute = AsyncMock(side_effect=[
+            _result(items=items),
+            _result(scalar=[{"Plan": {"Plan Rows": 1234}}]),
+        ])
+        app.dependency_overrides[get_db] = lambda: db
+
+        response = admin_client.get("/admin/stock?size=2")
+
+        assert response.status_code == 200
+        assert [item["book_id"] for item in response.json()] == [str(BOOK_ID_1), str(BOOK_ID_2)]
+        assert _decode_cursor(response.headers["x-next-cursor"]) == BOOK_ID_2
+        assert response.headers["x-total-count"] == "1234"
+        assert response.headers["x-total-count-exact"] == "false"
+
+    def test_last_page_has_no_cursor_and_exact_count(self, admin_client):
+        """A short page omits X-Next-Cursor; exact_count runs COUNT(*)."""
+        db = AsyncMock()
+        db.execute = AsyncMock(side_effect=[
+            _result(items=[make_inventory(BOOK_ID_1)]),
+            _result(scalar=1),
+        ])
+        app.dependency_overrides[get_db] = lambda: db
+
+        response = admin_client.get(f"/admin/stock?size=2&exact_count=true&cursor={_encode_cursor(BOOK_ID_1)}")
+
+        assert response.status_code == 200
+        assert "x-next-cursor" not in response.headers
+        assert response.headers["x-total-count"] == "1"
+        assert response.headers["x-total-count-exact"] == "true"
+
+
+class TestAdjustStockBatch:
+    """Tests for POST /admin/stock/adjust/batch outcome mapping."""
+
+    @staticmethod
+    def _db(rows):
+        db = AsyncMock()
+        result = MagicMock()
+        result.all.return_value = rows
+        db.execute = AsyncMock(return_value=result)
+        return db
+
+    def test_best_effort_reports_each_row(self, admin_client):
+        rows = [
+            SimpleNamespace(book_id=BOOK_ID_1, delta=5, previous_quantity=10, new_quantity=15, applied=True),
+            SimpleNamespace(book_id=BOOK_ID_2, delta=-20, previous_quantity=10, new_quantity=None, applied=False),
+        ]
+        db = self._db(rows)
+        app.dependency_overrides[get_db] = lambda: db
+
+        response = admin_client.post("/admin/stock/adjust/batch", json={
+            "atomic": False,
+            "items": [{"book_id": str(BOOK_ID_1), "delta": 5}, {"book_id": str(BOOK_ID_2), "delta": -20}],
+        })
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["applied"] == 1
+        assert [r["status"] for r in body["results"]] == ["applied", "negative_quantity"]
+        assert body["results"][0]["quantity"] == 15
+        db.commit.assert_called_once()
+
+    def test_atomic_failure_returns_409(self, admin_client):
+        rows = [
+            SimpleNamespace(book_id=BOOK_ID_1, delta=5, previous_quantity=10, new_quantity=None, applied=False),
+            SimpleNamespace(book_id=BOOK_ID_2, delta=1, previous_quantity=None, new_quantity=None, applied=False),
+        ]
+        app.dependency_overrides[get_db] = lambda: self._db(rows)
+
+        response = admin_client.post("/admin/stock/adjust/batch", json={
+            "items": [{"book_id": str(BOOK_ID_1), "delta": 5}, {"book_id": str(BOOK_ID_2), "delta": 1}],
+        })
+
+        assert response.status_code == 409
+        body = response.json()
+        assert body["applied"] == 0
+        assert [r["status"] for r in body["results"]] == ["skipped", "not_found"]
+
+    def test_overflowing_sum_reported(self, admin_client):
+        rows = [SimpleNamespace(book_id=BOOK_ID_1, delta=2**32, previous_quantity=10, new_quantity=None, applied=False)]
+        db = self._db(rows)
+        app.dependency_overrides[get_db] = lambda: db
+        item = {"book_id": str(BOOK_ID_1), "delta": 2**31 - 1}
+
+        response = admin_client.post("/admin/stock/adjust/batch", json={"atomic": False, "items": [item, item, item]})
+
+        assert response.status_code == 200
+        assert response.json()["results"][0]["status"] == "quantity_out_of_range"
+        sql = str(db.execute.await_args.args[0])
+        assert "sum(delta) AS delta" in sql and "BETWEEN 0 AND 2147483647" in sql
+
+    def test_delta_outside_int4_rejected(self, admin_client):
+        response = admin_client.post("/admin/stock/adjust/batch", json={
+            "items": [{"book_id": str(BOOK_ID_1), "delta": 2**31}],
+        })
+        assert response.status_code == 422
+
+    def test_empty_batch_rejected(self, admin_client):
+        response = admin_client.post("/admin/stock/adjust/batch", json={"items": []})
+        assert response.status_code == 422
+
+
+class TestImport:
+    """Tests for POST /admin/stock/import."""
+
+    def test_merge_timeout_returns_503(self, admin_client):
+        app.dependency_overrides[get_db] = lambda: MagicMock()
+        error = DBAPIError("UPDATE inventory ...", {}, MagicMock(sqlstate="55P03"))
+
+        with patch("app.api.admin.bulk_importer.import_stock", AsyncMock(side_effect=error)):
+            response = admin_client.post(
+                "/admin/stock/import", content=f"{BOOK_ID_1},5\n", headers={"Content-Type": "text/csv"}
+            )
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert "lock timeout" in response.json()["detail"]
@@ -0,0 +1,138 @@
+"""Unit tests for admission control and load shedding."""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.middleware import admission
+from app.middleware.admission import AdmissionController, AdmissionMiddleware, RouteClass
+
+
+def _controller(capacity=1, read_limit=1, read_queue=1, timeout=1.0) -> AdmissionController:
+    return AdmissionController(capacity, [
+        RouteClass("write", capacity, queue_size=10, queue_timeout=timeout),
+        RouteClass("read", read_limit, queue_size=read_queue, queue_timeout=timeout),
+    ])
+
+
+def _shed(route_class: str, reason: str) -> float:
+    return admission.admission_shed_total.labels(route_class=route_class, reason=reason)._value.get()
+
+
+class TestRouteClass:
+    """Tests for request classification."""
+
+    @pytest.mark.parametrize("method, path, root_path, expected", [
+        ("POST", "/stock/reserve", "", "write"),
+        ("POST", "/inven/stock/reserve", "/inven", "write"),
+        ("POST", "/stock/reserve/binary", "", "write"),
+        ("PUT", "/admin/stock/abc", "", "write"),
+        ("GET", "/admin/stock/export", "", None),
+        ("GET", "/stock/bulk", "", "read"),
+        ("GET", "/stock/abc", "", "read"),
+        ("GET", "/health/ready", "", None),
+        ("GET", "/metrics", "", None),
+    ])
+    def test_classification(self, method, path, root_path, expected):
+        scope = {"type": "http", "method": method, "path": path, "root_path": root_path}
+        assert admission._route_class(scope) == expected
+
+
+class TestAdmissionController:
+    """Tests for slot accounting and priority."""
+
+    @pytest.mark.asyncio
+    async def test_queued_write_admitted_before_queued_read(self):
+        controller = _controller(capacity=1, read_queue=5)
+        read, write = controller.classes["read"], controller.classes["write"]
+        assert await controller.acquire(read) is None
+        order = []
+
+        async def admit(route_class):
+            assert await controller.acquire(route_class) is None
+            order.append(route_class.name)
+            controller.release(route_class)
+
+        queued = [asyncio.create_task(admit(read)), asyncio.create_task(admit(write))]
+        await asyncio.sleep(0)
+        controller.release(read)
+        await asyncio.gather(*queued)
+        assert order == ["write", "read"]
+        assert controller.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_reads_leave_room_for_writes(self):
+        controller = _controller(capacity=2, read_limit=1, read_queue=0)
+        read, write = controller.classes["read"], controller.classes["write"]
+        assert await controller.acquire(read) is None
+        assert await controller.acquire(read) == "queue_full"
+        assert await controller.acquire(write) is None
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        controller = _controller(read_queue=1, timeout=0.01)
+        read = controller.classes["read"]
+        assert await controller.acquire(read) is None
+        assert await controller.acquire(read) == "queue_timeout"
+        assert not read.waiters
+
+    @pytest.mark.asyncio
+    async def test_grant_racing_timeout_keeps_slot(self, monkeypatch):
+        controller = _controller(read_queue=1)
+        read = controller.classes["read"]
+        assert await controller.acquire(read) is None
+
+        async def grant_then_time_out(waiter, timeout):
+            # 3.12's wait_for raises once its deadline passes even if the future
+            # already holds a result from a release in the same loop iteration.
+            controller.release(read)
+            assert waiter.done()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(admission.asyncio, "wait_for", grant_then_time_out)
+        assert await controller.acquire(read) is None
+        assert (controller.in_flight, read.in_flight) == (1, 1)
+        controller.release(read)
+        assert (controller.in_flight, read.in_flight) == (0, 0)
+
+    def test_adaptive_limit(self):
+        route_class = RouteClass("read-adaptive", 8, queue_size=1, queue_timeout=1.0, adaptive=True)
+        route_class.limit = 4
+        for _ in range(4):
+            route_class.observe(0.5, target=0.1)
+        assert route_class.limit == 3
+        for _ in range(3):
+            route_class.observe(0.01, target=0.1)
+        assert route_class.limit == 4
+
+
+class TestAdmissionMiddleware:
+    """Shed reads get 503 with Retry-After; other routes pass straight through."""
+
+    @pytest.mark.asyncio
+    async def test_read_shed_with_retry_after(self):
+        release = asyncio.Event()
+        app = FastAPI()
+
+        @app.get("/stock/{book_id}")
+        async def slow(book_id: str):
+            await release.wait()
+            return {"book_id": book_id}
+
+        @app.get("/health")
+        async def health():
+            return {"status": "ok"}
+
+        app.add_middleware(AdmissionMiddleware, controller=_controller(capacity=2, read_queue=0))
+        before = _shed("read", "queue_full")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = asyncio.create_task(client.get("/stock/a"))
+            await asyncio.sleep(0.05)
+            shed = await client.get("/stock/b")
+            assert (await client.get("/health")).status_code == 200
+            release.set()
+            assert (await first).status_code == 200
+        assert shed.status_code == 503
+        assert shed.headers["Retry-After"] == "1"
+        assert _shed("read", "queue_full") - before == 1
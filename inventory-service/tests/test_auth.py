@@ -1,24 +1,74 @@
-"""Unit tests for JWKS cache with TTL and JWT validation."""
+"""Unit tests for the JWKS key map, background refresh and JWT validation."""
+import asyncio
+import time
+
+import httpx
 import pytest
 from unittest.mock import AsyncMock, patch, MagicMock
 
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi import HTTPException
-from jose import JWTError
+from jose import jwk, jwt
+
+from app.config import settings
+from app.middleware import auth
+from app.middleware.auth import (
+    _claims_cache,
+    _on_jwks_fetched,
+    get_current_user,
+    refresh_jwks,
+)
+
+
+def _rsa_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem, public_pem
+
+
+KEY_1 = _rsa_key()
+KEY_2 = _rsa_key()
+
 
-from app.middleware.auth import _get_jwks, _invalidate_jwks_cache, _jwks_cache, _JWKS_KEY, get_current_user
+def _jwk(public_pem: bytes, kid: str, **extra) -> dict:
+    entry = jwk.construct(public_pem, "RS256").to_dict()
+    entry.update(kid=kid, use="sig", **extra)
+    return entry
 
 
-FAKE_JWKS = {"keys": [{"kty": "RSA", "kid": "test-key-1", "n": "abc", "e": "AQAB"}]}
-FAKE_JWKS_ROTATED = {"keys": [{"kty": "RSA", "kid": "test-key-2", "n": "xyz", "e": "AQAB"}]}
+FAKE_JWKS = {"keys": [_jwk(KEY_1[1], "test-key-1")]}
+FAKE_JWKS_ROTATED = {"keys": [_jwk(KEY_2[1], "test-key-2")]}
 FAKE_PAYLOAD = {"sub": "user-123", "roles": ["customer"]}
 
 
+def _token(kid: str = "test-key-1", private_pem: bytes = KEY_1[0], exp_in: int = 600, **claims) -> str:
+    now = int(time.time())
+    body = {
+        **FAKE_PAYLOAD, "iss": settings.keycloak_issuer_uri, "aud": settings.jwt_audience,
+        "iat": now, "exp": now + exp_in, **claims,
+    }
+    return jwt.encode(body, private_pem, algorithm="RS256", headers={"kid": kid})
+
+
 @pytest.fixture(autouse=True)
-def clear_jwks_cache():
-    """Ensure the JWKS cache is empty before each test."""
-    _jwks_cache.clear()
+def reset_auth_state(monkeypatch):
+    """Start each test with no keys loaded and empty caches."""
+    monkeypatch.setattr(auth, "_keys", {})
+    monkeypatch.setattr(auth, "_keys_fetched_at", float("-inf"))
+    monkeypatch.setattr(auth, "_jwks_kids", frozenset())
+    monkeypatch.setattr(auth, "_last_fetch_attempt", float("-inf"))
+    monkeypatch.setattr(auth, "_fetch_attempts", 0)
+    monkeypatch.setattr(auth, "_revalidate_task", None)
+    monkeypatch.setattr(auth, "_fetch_lock", asyncio.Lock())  # not bound to an earlier test's loop
+    _claims_cache.clear()
     yield
-    _jwks_cache.clear()
+    _claims_cache.clear()
 
 
 def _mock_creds(token: str = "fake-jwt-token"):
@@ -27,117 +77,175 @@ def _mock_creds(token: str = "fake-jwt-token"):
     return creds
 
 
-class TestJWKSCache:
-    """Tests for _get_jwks() caching behavior."""
+class TestJWKSRefresh:
+    """Tests for refresh_jwks() and the kid-indexed key map."""
 
     @pytest.mark.asyncio
-    async def test_jwks_fetched_and_cached(self):
-        """JWKS is fetched on first call and cached on second call."""
-        mock_response = AsyncMock()
-        mock_response.json.return_value = FAKE_JWKS
-        mock_response.raise_for_status = MagicMock()
-
+    async def test_fetch_builds_kid_map_with_shared_client(self):
+        """Signing keys are indexed by kid; encryption keys are skipped; one client is reused."""
+        jwks = {"keys": [*FAKE_JWKS["keys"], _jwk(KEY_2[1], "enc-key", alg="RSA-OAEP") | {"use": "enc"}]}
+        mock_response = MagicMock()  # httpx.Response.json() is synchronous
+        mock_response.json.return_value = jwks
         mock_client = AsyncMock()
+        mock_client.is_closed = False
         mock_client.get.return_value = mock_response
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=False)
 
-        with patch("app.middleware.auth.httpx.AsyncClient", return_value=mock_client):
-            # First call: fetches from remote
-            result1 = await _get_jwks()
-            assert result1 == FAKE_JWKS
-            assert mock_client.get.call_count == 1
+        with patch("app.middleware.auth.httpx.AsyncClient", return_value=mock_client) as client_cls:
+            await auth.close_http_client()
+            assert await refresh_jwks("background") is True
+            assert await refresh_jwks("background") is True
 
-            # Second call: returns from cache (no new HTTP call)
-            result2 = await _get_jwks()
-            assert result2 == FAKE_JWKS
-            assert mock_client.get.call_count == 1  # still 1
+        assert set(auth._keys) == {"test-key-1"}
+        assert mock_client.get.call_count == 2
+        assert client_cls.call_count == 1
+        await auth.close_http_client()
 
     @pytest.mark.asyncio
-    async def test_expired_cache_triggers_refetch(self):
-        """When the cache entry is evicted (simulating TTL expiry), a new fetch occurs."""
-        mock_response = AsyncMock()
-        mock_response.json.return_value = FAKE_JWKS
-        mock_response.raise_for_status = MagicMock()
-
-        mock_client = AsyncMock()
-        mock_client.get.return_value = mock_response
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=False)
+    async def test_concurrent_refreshes_are_single_flight(self):
+        """Callers queued behind an in-flight fetch reuse it instead of fetching again."""
+        async def slow_fetch():
+            await asyncio.sleep(0.01)
+            return FAKE_JWKS
+
+        with patch("app.middleware.auth._fetch_jwks", side_effect=slow_fetch) as mock_fetch:
+            results = await asyncio.gather(*(refresh_jwks("unknown_kid") for _ in range(20)))
+
+        assert all(results)
+        assert mock_fetch.call_count == 1
+
+    def test_refresher_lock_follows_the_event_loop(self):
+        """Each lifespan's refresher gets a lock for its own loop, so warm-up can join it."""
+        async def slow_fetch():
+            await asyncio.sleep(0.01)
+            return FAKE_JWKS
+
+        async def lifespan():
+            refresher = asyncio.create_task(auth.run_jwks_refresher())
+            await asyncio.sleep(0)  # refresher holds the lock, fetching
+            try:
+                return await refresh_jwks("warmup")  # waits on the lock
+            finally:
+                refresher.cancel()
+
+        with patch("app.middleware.auth._fetch_jwks", side_effect=slow_fetch):
+            assert asyncio.run(lifespan()) is True
+            assert asyncio.run(lifespan()) is True  # a second loop, as in the next TestClient
 
-        with patch("app.middleware.auth.httpx.AsyncClient", return_value=mock_client):
-            # Populate cache
-            await _get_jwks()
-            assert mock_client.get.call_count == 1
-
-            # Simulate TTL expiry by clearing cache
-            _jwks_cache.clear()
-
-            # Should fetch again
-            await _get_jwks()
-            assert mock_client.get.call_count == 2
+    @pytest.mark.asyncio
+    async def test_failed_fetch_keeps_stale_keys(self):
+        """A Keycloak outage does not drop keys that were already loaded."""
+        _on_jwks_fetched(FAKE_JWKS)
+        with patch("app.middleware.auth._fetch_jwks", side_effect=httpx.ConnectError("down")):
+            assert await refresh_jwks("background") is True
+        assert "test-key-1" in auth._keys
 
 
 class TestGetCurrentUser:
-    """Tests for get_current_user() JWT validation with cache invalidation retry."""
+    """Tests for get_current_user() JWT validation."""
 
     @pytest.mark.asyncio
     async def test_valid_token_returns_payload(self):
-        """A valid JWT returns the decoded payload."""
-        with (
-            patch("app.middleware.auth._get_jwks", new_callable=AsyncMock, return_value=FAKE_JWKS),
-            patch("app.middleware.auth.jwt.decode", return_value=FAKE_PAYLOAD),
-        ):
-            result = await get_current_user(_mock_creds("valid-token"))
-            assert result == FAKE_PAYLOAD
-            assert result["sub"] == "user-123"
+        """A token signed by a known key returns the decoded payload without fetching."""
+        _on_jwks_fetched(FAKE_JWKS)
+        with patch("app.middleware.auth._fetch_jwks", new_callable=AsyncMock) as mock_fetch:
+            result = await get_current_user(_mock_creds(_token()))
+        assert result["sub"] == "user-123"
+        mock_fetch.assert_not_called()
+
+    @pytest.mark.parametrize("token", [
+        _token(exp_in=-60),
+        _token(private_pem=KEY_2[0]),
+        _token(aud="someone-else"),
+        "not-a-jwt",
+    ], ids=["expired", "bad-signature", "wrong-audience", "garbage"])
+    @pytest.mark.asyncio
+    async def test_invalid_token_rejected_without_network(self, token):
+        """Expired, badly signed or malformed tokens get 401 and never trigger a JWKS fetch."""
+        _on_jwks_fetched(FAKE_JWKS)
+        with patch("app.middleware.auth._fetch_jwks", new_callable=AsyncMock) as mock_fetch:
+            with pytest.raises(HTTPException) as exc_info:
+                await get_current_user(_mock_creds(token))
+        assert exc_info.value.status_code == 401
+        assert "Invalid or expired token" in exc_info.value.detail
+        mock_fetch.assert_not_called()
 
     @pytest.mark.asyncio
-    async def test_jwt_error_invalidates_cache_and_retries(self):
-        """First JWTError invalidates cache; retry with fresh JWKS succeeds."""
-        call_count = 0
-
-        def decode_side_effect(*args, **kwargs):
-            nonlocal call_count
-            call_count += 1
-            if call_count == 1:
-                raise JWTError("Signature verification failed")
-            return FAKE_PAYLOAD
-
-        with (
-            patch("app.middleware.auth._get_jwks", new_callable=AsyncMock, return_value=FAKE_JWKS),
-            patch("app.middleware.auth.jwt.decode", side_effect=decode_side_effect),
-            patch("app.middleware.auth._invalidate_jwks_cache") as mock_invalidate,
-        ):
-            result = await get_current_user(_mock_creds("needs-refresh-token"))
-            assert result == FAKE_PAYLOAD
-            mock_invalidate.assert_called_once()
+    async def test_unknown_kid_refetches_once(self):
+        """A token signed with a newly rotated key triggers one refetch and then validates."""
+        _on_jwks_fetched(FAKE_JWKS)
+        with patch("app.middleware.auth._fetch_jwks", new_callable=AsyncMock,
+                   return_value=FAKE_JWKS_ROTATED) as mock_fetch:
+            result = await get_current_user(_mock_creds(_token(kid="test-key-2", private_pem=KEY_2[0])))
+        assert result["sub"] == "user-123"
+        assert mock_fetch.call_count == 1
 
     @pytest.mark.asyncio
-    async def test_second_jwt_error_after_retry_returns_401(self):
-        """If JWT validation fails even after cache refresh, raise 401."""
-        with (
-            patch("app.middleware.auth._get_jwks", new_callable=AsyncMock, return_value=FAKE_JWKS),
-            patch("app.middleware.auth.jwt.decode", side_effect=JWTError("Bad token")),
-            patch("app.middleware.auth._invalidate_jwks_cache"),
-        ):
+    async def test_unknown_kid_refetch_is_rate_limited(self):
+        """Within the min interval, further unknown kids are rejected without a fetch."""
+        _on_jwks_fetched(FAKE_JWKS)
+        with patch("app.middleware.auth._fetch_jwks", new_callable=AsyncMock,
+                   return_value=FAKE_JWKS) as mock_fetch:
+            for i in range(5):
+                with pytest.raises(HTTPException) as exc_info:
+                    await get_current_user(_mock_creds(_token(kid=f"forged-{i}")))
+                assert exc_info.value.status_code == 401
+        assert mock_fetch.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_no_keys_available_returns_503(self):
+        """If the JWKS has never been fetched and Keycloak is down, fail with 503, not 401."""
+        with patch("app.middleware.auth._fetch_jwks", side_effect=httpx.ConnectError("down")):
             with pytest.raises(HTTPException) as exc_info:
-                await get_current_user(_mock_creds("bad-token"))
-            assert exc_info.value.status_code == 401
-            assert "Invalid or expired token" in exc_info.value.detail
+                await get_current_user(_mock_creds(_token()))
+        assert exc_info.value.status_code == 503
 
+    @pytest.mark.asyncio
+    async def test_stale_keys_served_while_revalidating(self, monkeypatch):
+        """Stale keys still validate immediately; a refresh is scheduled in the background."""
+        _on_jwks_fetched(FAKE_JWKS)
+        monkeypatch.setattr(auth, "_keys_fetched_at", time.monotonic() - settings.jwks_refresh_interval_seconds - 1)
+        with patch("app.middleware.auth._fetch_jwks", new_callable=AsyncMock,
+                   return_value=FAKE_JWKS) as mock_fetch:
+            result = await get_current_user(_mock_creds(_token()))
+            assert result["sub"] == "user-123"
+            assert auth._revalidate_task is not None
+            await auth._revalidate_task
+        assert mock_fetch.call_count == 1
 
-class TestInvalidateJWKSCache:
-    """Tests for _invalidate_jwks_cache()."""
 
-    def test_invalidate_removes_cached_entry(self):
-        """_invalidate_jwks_cache removes the JWKS entry from the cache."""
-        _jwks_cache[_JWKS_KEY] = FAKE_JWKS
-        assert _JWKS_KEY in _jwks_cache
+class TestClaimsCache:
+    """Tests for the verified-token claims cache in get_current_user()."""
 
-        _invalidate_jwks_cache()
-        assert _JWKS_KEY not in _jwks_cache
+    @pytest.mark.asyncio
+    async def test_repeated_token_skips_verification(self):
+        """Second call with the same token is served from cache without jwt.decode."""
+        _on_jwks_fetched(FAKE_JWKS)
+        burst, other = _token(), _token(sub="user-456")
+        with patch("app.middleware.auth.jwt.decode", wraps=jwt.decode) as mock_decode:
+            first = await get_current_user(_mock_creds(burst))
+            assert await get_current_user(_mock_creds(burst)) == first
+            assert mock_decode.call_count == 1
+
+            await get_current_user(_mock_creds(other))
+            assert mock_decode.call_count == 2
 
-    def test_invalidate_noop_when_empty(self):
-        """_invalidate_jwks_cache does not raise when cache is already empty."""
-        _invalidate_jwks_cache()  # should not raise
+    @pytest.mark.asyncio
+    async def test_entry_expires_at_token_exp(self):
+        """A token whose exp has passed is not served from cache."""
+        _on_jwks_fetched(FAKE_JWKS)
+        payload = {**FAKE_PAYLOAD, "exp": int(time.time()) - 1}
+        with patch("app.middleware.auth.jwt.decode", return_value=payload) as mock_decode:
+            await get_current_user(_mock_creds(_token()))
+            await get_current_user(_mock_creds(_token()))
+            assert mock_decode.call_count == 2
+
+    def test_key_rotation_clears_claims(self):
+        """A JWKS fetch with a different key set drops all cached claims."""
+        _on_jwks_fetched(FAKE_JWKS)
+        _claims_cache[b"k"] = {**FAKE_PAYLOAD, "exp": int(time.time()) + 600}
+
+        _on_jwks_fetched(FAKE_JWKS)
+        assert b"k" in _claims_cache
+
+        _on_jwks_fetched(FAKE_JWKS_ROTATED)
+        assert b"k" not in _claims_cache
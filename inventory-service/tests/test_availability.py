@@ -0,0 +1,99 @@
+"""Unit tests for the in-memory availability index and GET /stock/availability."""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import availability
+from app.availability import IN_STOCK, LOW_STOCK, OUT_OF_STOCK, AvailabilityIndex
+from app.main import app
+
+from tests.conftest import BOOK_ID_1, BOOK_ID_2, BOOK_ID_3
+
+
+def _loaded(*rows) -> AvailabilityIndex:
+    index = AvailabilityIndex(low_stock=3)
+    index.load(list(rows), version=100)
+    return index
+
+
+class TestAvailabilityIndex:
+    """Statuses pack 2 bits per book; ETags change only with content."""
+
+    def test_packs_two_bits_per_book_in_id_order(self):
+        index = _loaded((BOOK_ID_1, 0), (BOOK_ID_2, 3), (BOOK_ID_3, 4))
+        body, _ = index.statuses()
+        assert body == bytes([OUT_OF_STOCK | LOW_STOCK << 2 | IN_STOCK << 4])
+        assert index.ids()[0] == BOOK_ID_1.bytes + BOOK_ID_2.bytes + BOOK_ID_3.bytes
+
+    def test_etag_changes_only_when_a_status_changes(self):
+        index = _loaded((BOOK_ID_1, 10), (BOOK_ID_2, 10))
+        _, etag = index.statuses()
+        assert index.apply([(BOOK_ID_1, 7)]) == 0  # still in stock
+        assert index.statuses()[1] == etag
+        assert index.apply([(BOOK_ID_1, 2)]) == 1
+        assert index.statuses()[1] != etag
+
+    def test_new_book_inserted_in_order(self):
+        index = _loaded((BOOK_ID_1, 10), (BOOK_ID_3, 0))
+        ids_etag = index.ids()[1]
+        assert index.apply([(BOOK_ID_2, 1)]) == 1
+        assert index.ids()[0] == BOOK_ID_1.bytes + BOOK_ID_2.bytes + BOOK_ID_3.bytes
+        assert index.ids()[1] != ids_etag
+        assert index.statuses()[0] == bytes([IN_STOCK | LOW_STOCK << 2 | OUT_OF_STOCK << 4])
+
+
+class TestRefresh:
+    """The index loads once, then applies the change feed up to its high-water mark."""
+
+    @pytest.mark.asyncio
+    async def test_load_then_follow_change_feed(self, monkeypatch):
+        index = AvailabilityIndex(low_stock=3)
+        monkeypatch.setattr(availability, "index", index)
+        session = AsyncMock()
+        session.__aenter__ = AsyncMock(return_value=session)
+        session.__aexit__ = AsyncMock(return_value=False)
+        session.execute.return_value = MagicMock(all=MagicMock(return_value=[(BOOK_ID_1, 10), (BOOK_ID_2, 0)]))
+        monkeypatch.setattr(availability, "AsyncSessionLocal", lambda: session)
+        high_water = AsyncMock(side_effect=[500, 520])
+        changes = AsyncMock(return_value=[MagicMock(book_id=BOOK_ID_2, available=2, version=510)])
+        monkeypatch.setattr(availability.change_feed, "high_water", high_water)
+        monkeypatch.setattr(availability.change_feed, "changes", changes)
+
+        assert await availability.refresh_once() == 2
+        assert index.version == 500
+        changes.assert_not_awaited()
+
+        assert await availability.refresh_once() == 1
+        assert changes.await_args.args[1:] == (500, None, availability._FEED_PAGE, 520)
+        assert index.version == 520
+        assert index.statuses()[0] == bytes([IN_STOCK | LOW_STOCK << 2])
+
+
+class TestAvailabilityEndpoints:
+    """Binary bodies with ETag revalidation; 503 until the index is loaded."""
+
+    @pytest.fixture
+    def client(self, monkeypatch):
+        monkeypatch.setattr(availability, "run_refresher", AsyncMock())
+        with TestClient(app) as c:
+            yield c
+
+    def test_statuses_and_revalidation(self, client, monkeypatch):
+        monkeypatch.setattr(availability, "index", _loaded((BOOK_ID_1, 10), (BOOK_ID_2, 1)))
+        response = client.get("/stock/availability")
+        assert response.status_code == 200
+        assert response.content == bytes([IN_STOCK | LOW_STOCK << 2])
+        assert response.headers["X-Availability-Count"] == "2"
+        ids = client.get("/stock/availability/ids")
+        assert ids.headers["ETag"] == response.headers["X-Availability-Ids-ETag"]
+
+        again = client.get("/stock/availability", headers={"If-None-Match": response.headers["ETag"]})
+        assert again.status_code == 304
+        assert again.content == b""
+
+    def test_loading_returns_503(self, client, monkeypatch):
+        monkeypatch.setattr(availability, "index", AvailabilityIndex(low_stock=3))
+        response = client.get("/stock/availability")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,47 @@
+"""Unit tests for streaming stock export encoders."""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.bulk.exporter import _csv, _ndjson
+
+from tests.conftest import BOOK_ID_1, BOOK_ID_2, NOW
+
+
+def _row(book_id, quantity=50, reserved=5):
+    return SimpleNamespace(
+        book_id=book_id, quantity=quantity, reserved=reserved,
+        available=quantity - reserved, updated_at=NOW,
+    )
+
+
+async def _chunks():
+    yield [_row(BOOK_ID_1)]
+    yield [_row(BOOK_ID_2, quantity=3, reserved=3)]
+
+
+async def _collect(aiter):
+    return [part async for part in aiter]
+
+
+class TestExportEncoders:
+    """Each fetched chunk becomes one encoded output chunk."""
+
+    @pytest.mark.asyncio
+    async def test_csv_has_header_and_one_chunk_per_fetch(self):
+        parts = await _collect(_csv(_chunks()))
+
+        assert len(parts) == 2
+        lines = b"".join(parts).decode().splitlines()
+        assert lines[0] == "book_id,quantity,reserved,available,updated_at"
+        assert lines[1] == f"{BOOK_ID_1},50,5,45,{NOW.isoformat()}"
+        assert lines[2].startswith(f"{BOOK_ID_2},3,3,0,")
+
+    @pytest.mark.asyncio
+    async def test_ndjson_rows(self):
+        parts = await _collect(_ndjson(_chunks()))
+
+        rows = [json.loads(line) for line in b"".join(parts).decode().splitlines()]
+        assert [r["book_id"] for r in rows] == [str(BOOK_ID_1), str(BOOK_ID_2)]
+        assert rows[1]["available"] == 0
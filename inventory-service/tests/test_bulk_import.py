@@ -0,0 +1,78 @@
+"""Unit tests for bulk stock import parsing."""
+from uuid import UUID
+
+import pytest
+
+from app.bulk.importer import ImportSummary, _staged_records, iter_lines, parse_line
+
+from tests.conftest import BOOK_ID_1, BOOK_ID_2
+
+
+async def _chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+async def _collect(aiter):
+    return [item async for item in aiter]
+
+
+class TestIterLines:
+    """Tests for iter_lines() incremental line splitting."""
+
+    @pytest.mark.asyncio
+    async def test_lines_split_across_chunks(self):
+        lines = await _collect(iter_lines(_chunks(b"a,1\nb,", b"2\r\nc,3")))
+        assert lines == ["a,1", "b,2", "c,3"]
+
+    @pytest.mark.asyncio
+    async def test_trailing_newline_yields_no_empty_tail(self):
+        lines = await _collect(iter_lines(_chunks(b"a,1\n")))
+        assert lines == ["a,1"]
+
+
+class TestParseLine:
+    """Tests for parse_line() in both formats and modes."""
+
+    def test_csv_set(self):
+        assert parse_line(f"{BOOK_ID_1},42", "csv", "set") == (BOOK_ID_1, 42)
+
+    def test_ndjson_delta(self):
+        line = f'{{"book_id": "{BOOK_ID_2}", "delta": -3}}'
+        assert parse_line(line, "ndjson", "delta") == (BOOK_ID_2, -3)
+
+    def test_ndjson_uses_mode_specific_key(self):
+        with pytest.raises(ValueError, match="'quantity'"):
+            parse_line(f'{{"book_id": "{BOOK_ID_1}", "delta": 1}}', "ndjson", "set")
+
+    @pytest.mark.parametrize("line", ["not-a-uuid,5", f"{BOOK_ID_1},five", f"{BOOK_ID_1}", f"{BOOK_ID_1},-1"])
+    def test_csv_set_rejects_bad_lines(self, line):
+        with pytest.raises(ValueError):
+            parse_line(line, "csv", "set")
+
+    def test_negative_allowed_in_delta_mode(self):
+        assert parse_line(f"{BOOK_ID_1},-1", "csv", "delta") == (BOOK_ID_1, -1)
+
+    @pytest.mark.parametrize("mode, value", [("set", 2**31), ("delta", 99999999999), ("delta", -(2**31) - 1)])
+    def test_value_outside_int4_rejected(self, mode, value):
+        with pytest.raises(ValueError, match="out of range"):
+            parse_line(f"{BOOK_ID_1},{value}", "csv", mode)
+
+    def test_float_rejected(self):
+        with pytest.raises(ValueError):
+            parse_line(f'{{"book_id": "{BOOK_ID_1}", "quantity": 1.5}}', "ndjson", "set")
+
+
+class TestStagedRecords:
+    """Tests for the record stream fed into COPY."""
+
+    @pytest.mark.asyncio
+    async def test_header_blank_and_bad_lines(self):
+        summary = ImportSummary(mode="set")
+        lines = _chunks("book_id,quantity", f"{BOOK_ID_1},10", "", "garbage", f"{BOOK_ID_2},20")
+        records = await _collect(_staged_records(lines, "csv", summary))
+
+        assert records == [(2, BOOK_ID_1, 10), (5, BOOK_ID_2, 20)]
+        assert summary.received == 3
+        assert summary.rejected == 1
+        assert summary.errors[0]["line"] == 4
@@ -1,10 +1,13 @@
-"""Unit tests for Kafka consumer supervision with exponential backoff."""
+"""Unit tests for Kafka consumer supervision, backoff and shutdown drain."""
 import asyncio
+from types import SimpleNamespace
 
 import pytest
 from unittest.mock import AsyncMock, patch
 
+from app.kafka import consumer as consumer_module
 from app.kafka.consumer import (
+    drain,
     run_consumer_supervised,
     _BACKOFF_INITIAL,
     _BACKOFF_FACTOR,
@@ -151,3 +154,93 @@ class TestConsumerSupervision:
             # call 4: error -> sleep(1.0) (reset!)
             # call 5: CancelledError -> no sleep
             assert sleep_args == [1.0, 2.0, 1.0]
+
+
+class _FakeConsumer:
+    """Serves queued records from getone(); records commits and stop()."""
+
+    def __init__(self, records):
+        self._records = asyncio.Queue()
+        for record in records:
+            self._records.put_nowait(record)
+        self.commits = 0
+        self.stopped = False
+
+    async def start(self):
+        pass
+
+    async def getone(self):
+        return await self._records.get()
+
+    async def commit(self):
+        self.commits += 1
+
+    async def stop(self):
+        self.stopped = True
+
+
+class _FakeProducer:
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+def _record(order_id: str):
+    return SimpleNamespace(value={"orderId": order_id}, headers=())
+
+
+def _abandoned() -> float:
+    return consumer_module.consumer_drain_abandoned_total._value.get()
+
+
+class TestConsumerDrain:
+    """Tests for drain(): finish the message in hand, commit, leave the group."""
+
+    async def _start(self, records, processing_seconds):
+        fake = _FakeConsumer(records)
+        started = asyncio.Event()
+
+        async def process(*_args):
+            started.set()
+            await asyncio.sleep(processing_seconds)
+            return True
+
+        patches = (
+            patch("app.kafka.consumer.AIOKafkaConsumer", return_value=fake),
+            patch("app.kafka.consumer.AIOKafkaProducer", return_value=_FakeProducer()),
+            patch("app.kafka.consumer._process_message_with_retry", side_effect=process),
+        )
+        for p in patches:
+            p.start()
+        task = asyncio.create_task(run_consumer_supervised())
+        await asyncio.wait_for(started.wait(), 1)
+        return fake, task, patches
+
+    @pytest.mark.asyncio
+    async def test_in_flight_message_finishes_and_commits(self):
+        fake, task, patches = await self._start([_record("o1"), _record("o2")], processing_seconds=0.05)
+        try:
+            before = _abandoned()
+            await drain(task, timeout=1.0)
+            assert task.done() and not task.cancelled()  # returned on its own
+            assert fake.commits == 1  # o1 finished and committed; o2 never started
+            assert fake.stopped
+            assert _abandoned() == before
+        finally:
+            for p in patches:
+                p.stop()
+
+    @pytest.mark.asyncio
+    async def test_deadline_cancels_and_counts_abandoned(self):
+        fake, task, patches = await self._start([_record("o1")], processing_seconds=10)
+        try:
+            before = _abandoned()
+            await drain(task, timeout=0.05)
+            assert task.cancelled()
+            assert fake.commits == 0 and fake.stopped
+            assert _abandoned() - before == 1
+        finally:
+            for p in patches:
+                p.stop()
@@ -0,0 +1,76 @@
+"""Unit tests for writer sessions with lock and statement timeouts."""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from app import database
+from app.database import get_db, writer_db
+
+
+def _db_error(sqlstate: str) -> DBAPIError:
+    return DBAPIError("SELECT ... FOR UPDATE", {}, MagicMock(sqlstate=sqlstate))
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.post("/fail/{sqlstate}")
+    async def fail(sqlstate: str, db=Depends(writer_db("reserve"))):
+        raise _db_error(sqlstate)
+
+    app.dependency_overrides[get_db] = lambda: MagicMock()
+    with TestClient(app, raise_server_exceptions=False) as c:
+        yield c
+
+
+def _timeouts(kind: str) -> float:
+    return database.db_timeouts_total.labels(endpoint="reserve", kind=kind)._value.get()
+
+
+class TestWriterDb:
+    """Expired lock / statement timeouts become a retryable 503."""
+
+    @pytest.mark.parametrize("sqlstate, kind", [("55P03", "lock"), ("57014", "statement")])
+    def test_timeout_returns_503_with_retry_after(self, client, sqlstate, kind):
+        before = _timeouts(kind)
+        response = client.post(f"/fail/{sqlstate}")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert f"{kind} timeout" in response.json()["detail"]
+        assert _timeouts(kind) - before == 1
+
+    def test_other_database_errors_propagate(self, client):
+        assert client.post("/fail/23505").status_code == 500
+
+    @pytest.mark.asyncio
+    async def test_timeouts_set_on_every_transaction(self, monkeypatch):
+        monkeypatch.setitem(database.settings.db_lock_timeout_ms, "reserve", 250)
+        assert event.contains(Session, "after_begin", database._set_timeouts)
+        session = database.AsyncSessionLocal()
+        await writer_db("reserve")(session).__anext__()
+        connection = MagicMock()
+        database._set_timeouts(session.sync_session, None, connection)
+        statement, params = connection.execute.call_args.args
+        assert str(statement) == (
+            "SELECT set_config('lock_timeout', :lock, true), set_config('statement_timeout', :statement, true)"
+        )
+        assert params == {"lock": "250ms", "statement": "3000ms"}
+
+    @pytest.mark.asyncio
+    async def test_set_timeouts_on_a_dedicated_connection(self):
+        conn = AsyncMock()
+        await database.set_timeouts(conn, "import")
+        statement, params = conn.execute.call_args.args
+        assert statement is database._SET_TIMEOUTS_SQL
+        assert params == {"lock": "5000ms", "statement": "30000ms"}
+
+    def test_other_sessions_untouched(self):
+        connection = MagicMock()
+        database._set_timeouts(database.AsyncSessionLocal().sync_session, None, connection)
+        connection.execute.assert_not_called()
@@ -1,15 +1,30 @@
 """Unit tests for health and readiness endpoints."""
+import asyncio
+import time
 from unittest.mock import AsyncMock, patch, MagicMock
 
 import pytest
 from fastapi.testclient import TestClient
 
+from app import health_checks, warmup
 from app.main import app
 
 
+@pytest.fixture(autouse=True)
+def reset_health():
+    health_checks._results.clear()
+    health_checks._checked_at.clear()
+    yield
+    health_checks._results.clear()
+    health_checks._checked_at.clear()
+
+
 @pytest.fixture
-def client():
-    """Synchronous test client for FastAPI app (no lifespan to avoid Kafka)."""
+def client(monkeypatch):
+    """Synchronous test client for FastAPI app, with startup warm-up treated as done and
+    the background evaluator off so each test controls the cached results."""
+    monkeypatch.setattr(warmup, "is_complete", lambda: True)
+    monkeypatch.setattr(health_checks, "run_checker", AsyncMock())
     with TestClient(app, raise_server_exceptions=False) as c:
         yield c
 
@@ -28,27 +43,83 @@ class TestReadinessEndpoint:
     """Tests for GET /health/ready (readiness probe)."""
 
     def test_ready_returns_200_when_db_reachable(self, client):
-        """GET /health/ready returns 200 when the database responds to SELECT 1."""
-        mock_session = AsyncMock()
-        mock_session.execute = AsyncMock()
-        mock_session.__aenter__ = AsyncMock(return_value=mock_session)
-        mock_session.__aexit__ = AsyncMock(return_value=False)
-
-        with patch("app.main.AsyncSessionLocal", return_value=mock_session):
+        """GET /health/ready returns 200 with the cached check results."""
+        health_checks._record("database", "ok", latency_ms=1.2)
+        with patch.object(health_checks, "engine", side_effect=AssertionError("probe must not touch the DB")):
             response = client.get("/health/ready")
-            assert response.status_code == 200
-            assert response.json() == {"status": "ready"}
+        assert response.status_code == 200
+        body = response.json()
+        assert body["status"] == "ready"
+        assert body["checks"]["database"]["status"] == "ok"
+        assert "checked_at" in body["checks"]["database"]
 
     def test_ready_returns_503_when_db_unreachable(self, client):
-        """GET /health/ready returns 503 when the database connection fails."""
-        mock_session = AsyncMock()
-        mock_session.execute = AsyncMock(side_effect=ConnectionRefusedError("Connection refused"))
-        mock_session.__aenter__ = AsyncMock(return_value=mock_session)
-        mock_session.__aexit__ = AsyncMock(return_value=False)
+        """GET /health/ready returns 503 when the last database check failed."""
+        health_checks._record("database", "failing", error="Connection refused")
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        body = response.json()
+        assert body["status"] == "not ready"
+        assert "database unreachable" in body["detail"]
 
-        with patch("app.main.AsyncSessionLocal", return_value=mock_session):
-            response = client.get("/health/ready")
-            assert response.status_code == 503
-            body = response.json()
-            assert body["status"] == "not ready"
-            assert "database unreachable" in body["detail"]
+    def test_ready_returns_503_before_first_check(self, client):
+        """GET /health/ready returns 503 until the evaluator has run once."""
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["detail"] == "health checks pending"
+
+    def test_ready_returns_503_when_results_stale(self, client, monkeypatch):
+        """A stuck evaluator cannot keep the pod in rotation."""
+        health_checks._record("database", "ok")
+        monkeypatch.setitem(health_checks._checked_at, "database", time.monotonic() - 60)
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json()["detail"] == "database check stale"
+
+    def test_ready_returns_503_while_warming_up(self, client, monkeypatch):
+        """GET /health/ready returns 503 until startup warm-up has finished."""
+        monkeypatch.setattr(warmup, "is_complete", lambda: False)
+        response = client.get("/health/ready")
+        assert response.status_code == 503
+        assert response.json() == {"status": "not ready", "detail": "warming up"}
+
+
+class TestHealthEvaluator:
+    """Tests for the background checks in ``app.health_checks``."""
+
+    @pytest.mark.asyncio
+    async def test_database_failure_recorded(self, monkeypatch):
+        engine = MagicMock()
+        engine.connect.return_value.__aenter__ = AsyncMock(side_effect=ConnectionRefusedError("refused"))
+        monkeypatch.setattr(health_checks, "engine", engine)
+        await health_checks.check_once([])
+        ready, body = health_checks.readiness()
+        assert not ready
+        assert body["checks"]["database"]["error"] == "refused"
+        assert "consumers" not in body["checks"]  # SERVICE_ROLE=api runs none
+
+    @pytest.mark.asyncio
+    async def test_stopped_task_fails_readiness(self, monkeypatch):
+        monkeypatch.setattr(health_checks, "_check_database", AsyncMock(side_effect=lambda: health_checks._record("database", "ok")))
+        dead = asyncio.create_task(asyncio.sleep(0), name="kafka-consumer")
+        await dead
+        await health_checks.check_once([dead])
+        ready, body = health_checks.readiness()
+        assert not ready
+        assert body["detail"] == "background task stopped"
+        assert body["checks"]["consumers"]["stopped"] == ["kafka-consumer"]
+
+    @pytest.mark.asyncio
+    async def test_lag_and_disconnected_consumer_only_warn(self, monkeypatch):
+        monkeypatch.setattr(health_checks, "_check_database", AsyncMock(side_effect=lambda: health_checks._record("database", "ok")))
+        monkeypatch.setattr(health_checks.settings, "health_max_consumer_lag", 10)
+        monkeypatch.setattr(health_checks.consumer, "lag", AsyncMock(return_value=500))
+        alive = asyncio.create_task(asyncio.sleep(60), name="kafka-consumer")
+        try:
+            await health_checks.check_once([alive])
+        finally:
+            alive.cancel()
+        ready, body = health_checks.readiness()
+        assert ready
+        assert body["checks"]["consumer_lag"] == {**body["checks"]["consumer_lag"], "status": "warn", "lag": 500}
+        assert body["checks"]["consumers"]["order_consumer_connected"] is False
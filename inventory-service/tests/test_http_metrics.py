@@ -0,0 +1,69 @@
+"""Unit tests for HTTP metrics with trace exemplars and the OpenMetrics endpoint."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from prometheus_fastapi_instrumentator import Instrumentator
+
+from app import http_metrics, telemetry
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.get("/stock/{book_id}")(lambda book_id: {"book_id": book_id})
+    Instrumentator().add(http_metrics.instrumentation).instrument(app)
+    app.get("/metrics")(http_metrics.metrics)
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def sampled_span(monkeypatch):
+    """Pretend telemetry is up and a head-sampled span is current."""
+    trace = pytest.importorskip("opentelemetry.trace")
+    ctx = trace.SpanContext(0xABC, 0x1, is_remote=False, trace_flags=trace.TraceFlags(trace.TraceFlags.SAMPLED))
+    monkeypatch.setattr(telemetry, "_current_span", lambda: trace.NonRecordingSpan(ctx))
+    return format(0xABC, "032x")
+
+
+def _count(method: str, handler: str) -> float:
+    return REGISTRY.get_sample_value(
+        "http_request_duration_seconds_count", {"method": method, "handler": handler}
+    ) or 0.0
+
+
+class TestHttpMetrics:
+    """Tests for the instrumentation callback."""
+
+    def test_route_template_and_method_bounded(self, client):
+        before_route, before_other = _count("GET", "/stock/{book_id}"), _count("other", "none")
+        client.get("/stock/abc")
+        client.get("/stock/def")
+        client.request("PURGE", "/random/path/123")
+        assert _count("GET", "/stock/{book_id}") - before_route == 2
+        assert _count("other", "none") - before_other == 1
+
+    def test_exemplar_only_when_trace_exported(self, monkeypatch):
+        assert telemetry.trace_exemplar(10.0, failed=True) is None  # telemetry not started
+        trace = pytest.importorskip("opentelemetry.trace")
+        unsampled = trace.SpanContext(0xABC, 0x1, is_remote=False, trace_flags=trace.TraceFlags(0))
+        monkeypatch.setattr(telemetry, "_current_span", lambda: trace.NonRecordingSpan(unsampled))
+        assert telemetry.trace_exemplar(10.0, failed=True) is None  # dropped, never recorded
+
+
+class TestMetricsEndpoint:
+    """Tests for /metrics content negotiation."""
+
+    def test_openmetrics_carries_exemplars(self, client, sampled_span):
+        client.get("/stock/abc")
+        resp = client.get("/metrics", headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+        assert resp.headers["content-type"].startswith("application/openmetrics-text")
+        assert f'# {{trace_id="{sampled_span}"}}' in resp.text
+        assert resp.text.rstrip().endswith("# EOF")
+
+    def test_plain_text_without_exemplars(self, client, sampled_span):
+        client.get("/stock/abc")
+        resp = client.get("/metrics")
+        assert resp.headers["content-type"].startswith("text/plain")
+        assert "trace_id" not in resp.text
@@ -0,0 +1,83 @@
+"""Unit tests for Idempotency-Key on POST /stock/reserve."""
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app import idempotency
+
+from tests.conftest import BOOK_ID_1, BOOK_ID_2, make_inventory
+
+STORED = {"book_id": str(BOOK_ID_1), "quantity_reserved": 2, "remaining_available": 40}
+
+
+def _reserve(client, key: str, book_id=BOOK_ID_1, quantity: int = 2):
+    return client.post(
+        "/stock/reserve",
+        json={"book_id": str(book_id), "quantity": quantity},
+        headers={"Idempotency-Key": key},
+    )
+
+
+def _stored_row(book_id=BOOK_ID_1, quantity: int = 2) -> MagicMock:
+    result = MagicMock()
+    result.scalar_one_or_none.return_value = MagicMock(book_id=book_id, quantity=quantity, response=STORED)
+    return result
+
+
+class TestReserveIdempotency:
+    """Retries with the same key never reserve twice."""
+
+    def test_first_request_reserves_and_retry_replays_from_cache(self, client, mock_db):
+        mock_db.scalar.return_value = "order-1:line-1"  # key claimed
+        locked = MagicMock()
+        locked.scalar_one_or_none.return_value = make_inventory(BOOK_ID_1, quantity=50, reserved=5)
+        mock_db.execute.return_value = locked
+
+        first = _reserve(client, "order-1:line-1")
+        assert first.status_code == 200
+        assert "Idempotent-Replayed" not in first.headers
+        mock_db.commit.assert_awaited_once()
+        statements = [str(call.args[0]) for call in mock_db.execute.await_args_list]
+        assert any(sql.startswith("UPDATE reserve_idempotency") for sql in statements)
+
+        mock_db.reset_mock()
+        retry = _reserve(client, "order-1:line-1")
+        assert retry.status_code == 200
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.json() == first.json()
+        mock_db.execute.assert_not_awaited()
+        mock_db.scalar.assert_not_awaited()
+
+    def test_duplicate_replayed_from_table_without_locking_inventory(self, client, mock_db):
+        mock_db.scalar.return_value = None  # key already taken
+        mock_db.execute.return_value = _stored_row()
+        response = _reserve(client, "order-2:line-1")
+        assert response.status_code == 200
+        assert response.json() == STORED
+        assert response.headers["Idempotent-Replayed"] == "true"
+        assert mock_db.execute.await_count == 1  # the key lookup only — no SELECT ... FOR UPDATE
+        mock_db.rollback.assert_awaited_once()
+        mock_db.commit.assert_not_awaited()
+        assert idempotency._cache["order-2:line-1"].response == STORED
+
+    def test_key_reused_for_different_reservation_returns_422(self, client, mock_db):
+        mock_db.scalar.return_value = None
+        mock_db.execute.return_value = _stored_row(book_id=BOOK_ID_2)
+        response = _reserve(client, "order-3:line-1")
+        assert response.status_code == 422
+        assert "different reservation" in response.json()["detail"]
+
+
+class TestPrune:
+    """Expired keys are deleted in batches, one transaction each."""
+
+    @pytest.mark.asyncio
+    async def test_prunes_until_short_batch(self, monkeypatch):
+        monkeypatch.setattr(idempotency.settings, "idempotency_prune_batch_size", 100)
+        session = AsyncMock()
+        session.__aenter__ = AsyncMock(return_value=session)
+        session.__aexit__ = AsyncMock(return_value=False)
+        session.execute.side_effect = [MagicMock(rowcount=n) for n in (100, 100, 7)]
+        monkeypatch.setattr(idempotency, "AsyncSessionLocal", lambda: session)
+        assert await idempotency.prune_once() == 207
+        assert session.commit.await_count == 3
@@ -0,0 +1,67 @@
+"""Unit tests for the stock movement ledger."""
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import get_db
+from app.ledger import RESERVE, _month_start, record_movement
+from app.main import app
+from app.middleware.auth import get_current_user
+
+from tests.conftest import BOOK_ID_1, NOW
+
+
+class TestMonthStart:
+    """Partition bounds roll over year ends."""
+
+    def test_same_month(self):
+        assert _month_start(date(2026, 10, 18)) == date(2026, 10, 1)
+
+    def test_rolls_into_next_year(self):
+        assert _month_start(date(2026, 11, 30), 2) == date(2027, 1, 1)
+        assert _month_start(date(2026, 12, 1), 13) == date(2028, 1, 1)
+
+
+class TestRecordMovement:
+    @pytest.mark.asyncio
+    async def test_inserts_in_callers_session(self):
+        db = AsyncMock()
+        await record_movement(db, BOOK_ID_1, RESERVE, reserved_delta=2, quantity_after=50, reserved_after=7)
+
+        stmt = db.execute.call_args.args[0]
+        params = stmt.compile().params
+        assert stmt.table.name == "stock_movement"
+        assert params["kind"] == "reserve"
+        assert params["reserved_delta"] == 2
+        assert params["quantity_delta"] == 0
+
+
+class TestStockAsOfEndpoint:
+    """GET /admin/stock/{book_id}/as-of"""
+
+    @pytest.fixture
+    def admin_client(self):
+        app.dependency_overrides[get_current_user] = lambda: {"roles": ["admin"]}
+        app.dependency_overrides[get_db] = lambda: AsyncMock()
+        with TestClient(app, raise_server_exceptions=False) as c:
+            yield c
+        app.dependency_overrides.clear()
+
+    def test_rebuilt_from_snapshot_and_ledger(self, admin_client):
+        row = SimpleNamespace(taken_at=NOW, quantity=40, reserved=4, movements=3)
+        with patch("app.api.admin.ledger.stock_as_of", new_callable=AsyncMock, return_value=row):
+            response = admin_client.get(f"/admin/stock/{BOOK_ID_1}/as-of", params={"at": NOW.isoformat()})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body["available"] == 36
+        assert body["movements_applied"] == 3
+
+    def test_before_first_snapshot_returns_404(self, admin_client):
+        with patch("app.api.admin.ledger.stock_as_of", new_callable=AsyncMock, return_value=None):
+            response = admin_client.get(f"/admin/stock/{BOOK_ID_1}/as-of", params={"at": "2020-01-01T00:00:00Z"})
+
+        assert response.status_code == 404
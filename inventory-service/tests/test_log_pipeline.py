@@ -0,0 +1,150 @@
+"""Unit tests for the queued, batched JSON log pipeline."""
+import io
+import json
+import logging
+import queue
+
+import pytest
+from opentelemetry import trace
+
+from app.log_pipeline import (
+    BatchingQueueListener,
+    DroppingQueueHandler,
+    SamplingFilter,
+    json_formatter,
+    log_records_dropped_total,
+)
+
+
+def _dropped(reason: str) -> float:
+    return log_records_dropped_total.labels(reason=reason)._value.get()
+
+
+@pytest.fixture
+def pipeline():
+    """An isolated logger → queue → listener → StringIO pipeline."""
+    log_queue: queue.Queue = queue.Queue(maxsize=100)
+    stream = io.StringIO()
+    side_handler = logging.Handler(level=logging.WARNING)
+    side_handler.handle = lambda record: side_records.append(record)
+    side_records: list[logging.LogRecord] = []
+    listener = BatchingQueueListener(log_queue, stream, json_formatter(), [side_handler], batch_size=8)
+
+    log = logging.getLogger("test.pipeline")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    handler = DroppingQueueHandler(log_queue)
+    log.addHandler(handler)
+    listener.start()
+    yield log, listener, stream, side_records
+    listener.stop()
+    log.removeHandler(handler)
+
+
+class TestBatchingListener:
+    """Tests for BatchingQueueListener."""
+
+    def test_records_written_as_json_lines(self, pipeline):
+        log, listener, stream, _ = pipeline
+        for i in range(20):
+            log.info("Received order.created event: orderId=%s", i)
+        listener.stop()
+
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 20
+        first = json.loads(lines[0])
+        assert first["message"] == "Received order.created event: orderId=0"
+        assert first["level"] == "INFO" and first["logger"] == "test.pipeline"
+
+    def test_exception_rendered_without_column_markers(self, pipeline):
+        log, listener, stream, side_records = pipeline
+        try:
+            {}["missing"]
+        except KeyError:
+            log.exception("Failed")
+        listener.stop()
+        rendered = json.loads(stream.getvalue())["exc_info"]
+        assert rendered.endswith("KeyError: 'missing'")
+        assert "^" not in rendered
+        assert side_records[0].exc_info is not None  # OTel still gets the exception
+
+    def test_traceback_rendered_before_other_caller_handlers(self, pipeline):
+        """Handlers after the queue handler reuse exc_text instead of re-rendering it."""
+        log, listener, _, _ = pipeline
+        seen = []
+        caller_side = logging.Handler()
+        caller_side.emit = lambda record: seen.append(record.exc_text)
+        log.addHandler(caller_side)
+        try:
+            {}["missing"]
+        except KeyError:
+            log.exception("Failed")
+        log.removeHandler(caller_side)
+        listener.stop()
+        assert seen[0].endswith("KeyError: 'missing'") and "^" not in seen[0]
+
+    def test_extra_handlers_fed_from_same_queue(self, pipeline):
+        """The OTel handler sits behind the queue and keeps its own level threshold."""
+        log, listener, _, side_records = pipeline
+        log.info("info line")
+        log.warning("warning line")
+        listener.stop()
+        assert [r.getMessage() for r in side_records] == ["warning line"]
+
+    def test_extra_handlers_see_the_callers_span(self, pipeline):
+        """The OTel handler reads the current span when it emits, on the listener thread."""
+        log, listener, stream, _ = pipeline
+        seen = []
+        side_handler = listener._handlers[0]
+        side_handler.handle = lambda record: seen.append(trace.get_current_span().get_span_context())
+        span_context = trace.SpanContext(
+            trace_id=0x1234, span_id=0x5678, is_remote=False, trace_flags=trace.TraceFlags.SAMPLED
+        )
+        with trace.use_span(trace.NonRecordingSpan(span_context)):
+            log.warning("inside a span")
+        listener.stop()
+        assert seen == [span_context]
+        assert "_context" not in json.loads(stream.getvalue())
+
+
+class TestDroppingQueueHandler:
+    """Tests for overflow behaviour."""
+
+    def test_full_queue_drops_without_blocking(self):
+        log_queue: queue.Queue = queue.Queue(maxsize=2)
+        handler = DroppingQueueHandler(log_queue)
+        before = _dropped("overflow")
+        for i in range(5):
+            handler.handle(logging.LogRecord("x", logging.INFO, __file__, 1, "line %s", (i,), None))
+        assert log_queue.qsize() == 2
+        assert _dropped("overflow") - before == 3
+
+    def test_args_merged_before_enqueue(self):
+        log_queue: queue.Queue = queue.Queue()
+        payload = {"qty": 1}
+        DroppingQueueHandler(log_queue).handle(
+            logging.LogRecord("x", logging.INFO, __file__, 1, "payload=%s", (payload,), None)
+        )
+        payload["qty"] = 2  # mutated after logging — must not change the line
+        assert log_queue.get_nowait().msg == "payload={'qty': 1}"
+
+
+class TestSamplingFilter:
+    """Tests for per-logger sampling."""
+
+    def _record(self, name: str, level: int = logging.INFO) -> logging.LogRecord:
+        return logging.LogRecord(name, level, __file__, 1, "msg", None, None)
+
+    def test_prefix_rate_applies_to_info_only(self):
+        f = SamplingFilter({"app.kafka": 0.0})
+        before = _dropped("sampled")
+        assert not f.filter(self._record("app.kafka.consumer"))
+        assert f.filter(self._record("app.kafka.consumer", logging.WARNING))
+        assert f.filter(self._record("app.api.stock"))
+        assert f.filter(self._record("app.kafkaesque"))
+        assert _dropped("sampled") - before == 1
+
+    def test_longest_prefix_wins(self):
+        f = SamplingFilter({"app": 0.0, "app.kafka.consumer": 1.0})
+        assert f.filter(self._record("app.kafka.consumer"))
+        assert not f.filter(self._record("app.ledger"))
@@ -0,0 +1,83 @@
+"""Unit tests for the event-loop lag sampler and blocking-call watchdog."""
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.loop_monitor import event_loop_lag_seconds, loop_stalls, run_loop_monitor
+from app.main import app
+from app.middleware.auth import get_current_user
+
+
+def _blocking_hot_spot(seconds: float) -> None:
+    time.sleep(seconds)  # stands in for RSA math / big JSON dumps on the loop
+
+
+@pytest.fixture
+def fast_monitor(monkeypatch):
+    monkeypatch.setattr(settings, "loop_lag_sample_interval_seconds", 0.01)
+    monkeypatch.setattr(settings, "loop_stall_threshold_ms", 50)
+    loop_stalls.clear()
+    yield
+    loop_stalls.clear()
+
+
+async def _with_monitor(body):
+    task = asyncio.create_task(run_loop_monitor())
+    await asyncio.sleep(0.05)
+    try:
+        await body()
+        await asyncio.sleep(0.05)
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+class TestLoopMonitor:
+    """Tests for run_loop_monitor()."""
+
+    @pytest.mark.asyncio
+    async def test_blocking_call_stack_captured(self, fast_monitor):
+        """A synchronous call that blocks the loop is caught in the act by the watchdog."""
+        async def block():
+            _blocking_hot_spot(0.3)
+
+        await _with_monitor(block)
+
+        assert loop_stalls.total_count == 1
+        stall = loop_stalls.entries[0]
+        assert stall["blockedMs"] >= 50
+        assert "in _blocking_hot_spot" in stall["stack"][-1]
+
+    @pytest.mark.asyncio
+    async def test_lag_observed_without_stall_below_threshold(self, fast_monitor):
+        """Short hiccups only show up in the lag histogram."""
+        before = event_loop_lag_seconds._sum.get()
+
+        async def hiccup():
+            _blocking_hot_spot(0.02)
+
+        await _with_monitor(hiccup)
+
+        assert event_loop_lag_seconds._sum.get() > before
+        assert loop_stalls.total_count == 0
+
+
+class TestLoopStallsEndpoint:
+    """Tests for GET /admin/stock/diagnostics/loop-stalls."""
+
+    def test_lists_captured_stalls(self):
+        loop_stalls.clear()
+        loop_stalls.add({"at": "2026-10-18T00:00:00+00:00", "blockedMs": 320.0, "stack": ["x.py:1 in f"]})
+        app.dependency_overrides[get_current_user] = lambda: {"sub": "admin", "roles": ["admin"]}
+        try:
+            with TestClient(app) as c:
+                body = c.get("/admin/stock/diagnostics/loop-stalls").json()
+        finally:
+            app.dependency_overrides.clear()
+            loop_stalls.clear()
+        assert body["totalCount"] == 1
+        assert body["stalls"][0]["stack"] == ["x.py:1 in f"]
@@ -0,0 +1,105 @@
+"""Unit tests for the on-demand sampling profiler."""
+import asyncio
+import time
+from collections import Counter
+
+import pytest
+import pytest_asyncio
+from fastapi.testclient import TestClient
+from httpx import ASGITransport, AsyncClient
+
+from app import profiler
+from app.main import app
+from app.middleware.auth import get_current_user
+
+
+def _spin(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def _busy_worker():
+    for _ in range(40):
+        _spin(0.005)
+        await asyncio.sleep(0)
+
+
+class TestProfile:
+    """Tests for profiler.profile() and its renderers."""
+
+    @pytest.mark.asyncio
+    async def test_samples_attributed_to_running_task(self):
+        worker = asyncio.create_task(_busy_worker(), name="busy-worker")
+        samples = await profiler.profile(0.15, 0.002)
+        await worker
+
+        assert samples
+        hot = [stack for stack in samples if stack[0][0] == "task busy-worker"]
+        assert hot and any(frame[0] == "_spin" for frame in hot[0])
+        collapsed = profiler.to_collapsed(samples)
+        assert "task busy-worker;" in collapsed and "_spin (tests/test_profiler.py:" in collapsed
+
+    @pytest.mark.asyncio
+    async def test_one_run_at_a_time(self):
+        first = asyncio.create_task(profiler.profile(0.1, 0.01))
+        await asyncio.sleep(0)
+        with pytest.raises(profiler.ProfilerBusy):
+            await profiler.profile(0.1, 0.01)
+        await first
+        await profiler.profile(0.01, 0.005)  # slot released
+
+    def test_speedscope_shares_frames(self):
+        a, b, c = ("task t", "", 0), ("f", "m.py", 1), ("g", "m.py", 5)
+        doc = profiler.to_speedscope(Counter({(a, b): 3, (a, b, c): 1}), 0.01, "p")
+        assert [f["name"] for f in doc["shared"]["frames"]] == ["task t", "f", "g"]
+        prof = doc["profiles"][0]
+        assert prof["type"] == "sampled"
+        assert prof["samples"] == [[0, 1], [0, 1, 2]]
+        assert prof["weights"] == [30.0, 10.0]
+
+
+class TestProfileEndpoint:
+    """Tests for GET /admin/stock/diagnostics/profile."""
+
+    @pytest_asyncio.fixture
+    async def admin_http(self):
+        """ASGI client on the test's own loop (the main thread), as under uvicorn."""
+        app.dependency_overrides[get_current_user] = lambda: {"sub": "admin", "roles": ["admin"]}
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+            yield c
+        app.dependency_overrides.clear()
+
+    @pytest.mark.asyncio
+    async def test_returns_collapsed_and_speedscope(self, admin_http):
+        worker = asyncio.create_task(_busy_worker(), name="busy-worker")
+        response = await admin_http.get(
+            "/admin/stock/diagnostics/profile", params={"seconds": 0.15, "interval_ms": 2}
+        )
+        await worker
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert int(response.headers["X-Profile-Samples"]) > 0
+        assert "task busy-worker;" in response.text
+
+        speedscope = await admin_http.get(
+            "/admin/stock/diagnostics/profile", params={"seconds": 0.1, "format": "speedscope"}
+        )
+        assert speedscope.json()["profiles"][0]["type"] == "sampled"
+
+    def test_loop_off_main_thread_returns_501(self):
+        """TestClient runs the app on a portal thread, where SIGPROF cannot be handled."""
+        app.dependency_overrides[get_current_user] = lambda: {"sub": "admin", "roles": ["admin"]}
+        try:
+            with TestClient(app) as c:
+                assert c.get("/admin/stock/diagnostics/profile", params={"seconds": 0.1}).status_code == 501
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_requires_admin(self):
+        app.dependency_overrides[get_current_user] = lambda: {"sub": "u", "roles": ["customer"]}
+        try:
+            with TestClient(app) as c:
+                assert c.get("/admin/stock/diagnostics/profile").status_code == 403
+        finally:
+            app.dependency_overrides.clear()
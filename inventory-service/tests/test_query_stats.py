@@ -0,0 +1,147 @@
+"""Unit tests for per-request DB accounting, Server-Timing and slow-request capture."""
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.config import settings
+from app.main import app
+from app.middleware import query_stats
+from app.middleware.auth import get_current_user
+from app.middleware.query_stats import (
+    QueryStatsMiddleware,
+    TimedQueuePool,
+    _after_cursor_execute,
+    _before_cursor_execute,
+    _param_shape,
+    slow_requests,
+)
+
+
+def _locking_statement_count(route: str) -> float:
+    return REGISTRY.get_sample_value("inventory_request_locking_statement_seconds_count", {"route": route}) or 0.0
+
+
+def _fake_statement(sql: str, parameters, executemany: bool = False) -> None:
+    """Drive the engine hooks as SQLAlchemy would for one cursor execution."""
+    context = SimpleNamespace()
+    _before_cursor_execute(None, None, sql, parameters, context, executemany)
+    _after_cursor_execute(None, None, sql, parameters, context, executemany)
+
+
+@pytest.fixture
+def probe_client():
+    """A bare app behind QueryStatsMiddleware whose endpoint issues two fake statements."""
+    probe = FastAPI()
+    probe.add_middleware(QueryStatsMiddleware)
+
+    @probe.get("/probe/{book_id}")
+    async def _probe(book_id: str):
+        _fake_statement("SELECT * FROM inventory WHERE book_id = $1", (book_id,))
+        _fake_statement("UPDATE inventory SET reserved = $1", [(1,), (2,)], executemany=True)
+        return {"ok": True}
+
+    slow_requests.clear()
+    with TestClient(probe) as c:
+        yield c
+    slow_requests.clear()
+
+
+class TestServerTiming:
+    """Tests for the Server-Timing header."""
+
+    def test_counts_statements_issued_by_the_request(self, probe_client):
+        response = probe_client.get("/probe/abc")
+        timing = response.headers["Server-Timing"]
+        assert 'desc="2 queries"' in timing
+        assert "pool;dur=" in timing and "total;dur=" in timing
+
+    def test_statements_outside_a_request_are_ignored(self, probe_client):
+        """Kafka consumers and background jobs run without request stats."""
+        _fake_statement("SELECT 1", ())
+        assert 'desc="2 queries"' in probe_client.get("/probe/abc").headers["Server-Timing"]
+
+    def test_service_responses_carry_header(self):
+        with TestClient(app) as c:
+            assert "db;dur=" in c.get("/health").headers["Server-Timing"]
+
+
+class TestSlowRequestCapture:
+    """Tests for the slow-request ring buffer."""
+
+    def test_slow_request_captured_with_route_template(self, probe_client, monkeypatch):
+        monkeypatch.setattr(settings, "slow_request_threshold_ms", 0)
+        probe_client.get("/probe/secret-book-id")
+
+        assert slow_requests.total_count == 1
+        entry = slow_requests.entries[0]
+        assert entry["route"] == "/probe/{book_id}"
+        assert entry["statements"] == 2
+        assert entry["queries"][0]["params"] == ["str"]
+        assert entry["queries"][1]["params"] == {"rows": 2, "row": ["int"]}
+        assert "secret-book-id" not in str(entry["queries"])
+
+    def test_fast_request_not_captured(self, probe_client, monkeypatch):
+        monkeypatch.setattr(settings, "slow_request_threshold_ms", 60_000)
+        probe_client.get("/probe/abc")
+        assert slow_requests.total_count == 0
+
+    def test_param_shape_never_includes_values(self):
+        assert _param_shape({"book_id": "x", "ids": [1, 2, 3]}, False) == {"book_id": "str", "ids": "list[3]"}
+        assert _param_shape([], True) == {"rows": 0, "row": None}
+
+    def test_admin_endpoint_lists_entries(self, monkeypatch):
+        slow_requests.clear()
+        monkeypatch.setattr(settings, "slow_request_threshold_ms", 0)
+        app.dependency_overrides[get_current_user] = lambda: {"sub": "admin", "roles": ["admin"]}
+        try:
+            with TestClient(app) as c:
+                c.get("/health")
+                body = c.get("/admin/stock/diagnostics/slow-requests").json()
+        finally:
+            app.dependency_overrides.clear()
+            slow_requests.clear()
+        assert body["thresholdMs"] == 0
+        assert body["totalCount"] >= 1
+        assert body["requests"][0]["route"] == "/health"
+
+
+class TestPoolWait:
+    """Tests for TimedQueuePool checkout accounting."""
+
+    def test_checkout_time_charged_to_current_request(self):
+        pool = TimedQueuePool(creator=MagicMock, pool_size=1, max_overflow=0)
+        stats = query_stats.RequestStats()
+        token = query_stats._current.set(stats)
+        try:
+            pool.connect().close()
+        finally:
+            query_stats._current.reset(token)
+        assert stats.pool_wait_seconds > 0
+        assert stats.statements == 0
+
+
+class TestLockWait:
+    """Tests for the per-route lock-wait histogram."""
+
+    def test_observed_for_requests_with_locking_statements(self, probe_client):
+        before = _locking_statement_count("/probe/{book_id}")
+        probe_client.get("/probe/abc")
+        assert _locking_statement_count("/probe/{book_id}") - before == 1
+
+    def test_failed_locking_statement_counted(self):
+        stats = query_stats.RequestStats()
+        token = query_stats._current.set(stats)
+        try:
+            context = SimpleNamespace()
+            sql = "SELECT * FROM inventory WHERE book_id = $1 FOR UPDATE"
+            _before_cursor_execute(None, None, sql, (1,), context, False)
+            query_stats._handle_error(SimpleNamespace(execution_context=context, statement=sql))
+            _fake_statement("SELECT 1", ())
+        finally:
+            query_stats._current.reset(token)
+        assert stats.locking_statements == 1
+        assert stats.statements == 1
@@ -0,0 +1,78 @@
+"""Unit tests for the msgpack reserve route (POST /stock/reserve/binary)."""
+from unittest.mock import MagicMock
+
+import pytest
+
+from app import reserve_protocol
+from app.reservations import Outcome, insufficient, not_found
+
+from tests.conftest import BOOK_ID_1, BOOK_ID_2, make_inventory
+
+
+class TestReserveProtocol:
+    """msgpack request decoding and per-item result encoding."""
+
+    def test_round_trip(self):
+        msgpack = pytest.importorskip("msgpack")
+        body = msgpack.packb([[BOOK_ID_1.bytes, 2, "order-1:line-1"], [str(BOOK_ID_2), 1]])
+        assert reserve_protocol.decode_items(body) == [
+            reserve_protocol.ReserveItem(BOOK_ID_1, 2, "order-1:line-1"),
+            reserve_protocol.ReserveItem(BOOK_ID_2, 1),
+        ]
+        encoded = reserve_protocol.encode_outcomes([
+            Outcome("replayed", {"remaining_available": 7}),
+            insufficient(1, 2),
+            not_found(),
+        ])
+        assert msgpack.unpackb(encoded) == [
+            [200, 7, True, None],
+            [409, None, False, "Insufficient stock: available=1 requested=2"],
+            [404, None, False, "Book not found in inventory"],
+        ]
+
+    @pytest.mark.parametrize("items, message", [
+        ([], "array of 1-50 items"),
+        ([[b"short", 1]], "Item 0: book_id"),
+        ([["00000000-0000-0000-0000-000000000001", 100]], "Item 0: quantity"),
+        ([["00000000-0000-0000-0000-000000000001", 1, 7]], "Item 0: idempotency key"),
+    ])
+    def test_rejects_malformed_items(self, items, message):
+        msgpack = pytest.importorskip("msgpack")
+        with pytest.raises(reserve_protocol.ProtocolError, match=message):
+            reserve_protocol.decode_items(msgpack.packb(items))
+
+
+class TestReserveBinaryRoute:
+    """Each item goes through the same reservation as POST /stock/reserve."""
+
+    def test_items_reserved_in_order_with_own_status(self, client, mock_db):
+        msgpack = pytest.importorskip("msgpack")
+        locked = MagicMock()
+        locked.scalar_one_or_none.side_effect = [make_inventory(BOOK_ID_1, quantity=10, reserved=0), None]
+        mock_db.execute.return_value = locked
+        response = client.post(
+            "/stock/reserve/binary",
+            content=msgpack.packb([[BOOK_ID_1.bytes, 3], [BOOK_ID_2.bytes, 1]]),
+            headers={"Content-Type": "application/msgpack"},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/msgpack"
+        assert msgpack.unpackb(response.content) == [
+            [200, 10, False, None],  # make_inventory's available is fixed at creation
+            [404, None, False, "Book not found in inventory"],
+        ]
+        mock_db.commit.assert_awaited_once()
+        mock_db.rollback.assert_awaited_once()
+
+    def test_unsupported_content_type_returns_415(self, client, monkeypatch):
+        monkeypatch.setattr(reserve_protocol, "msgpack_available", lambda: True)
+        response = client.post("/stock/reserve/binary", json=[[str(BOOK_ID_1), 1]])
+        assert response.status_code == 415
+
+    def test_without_msgpack_returns_501(self, client, monkeypatch):
+        monkeypatch.setattr(reserve_protocol, "msgpack_available", lambda: False)
+        response = client.post(
+            "/stock/reserve/binary", content=b"\x91", headers={"Content-Type": "application/msgpack"}
+        )
+        assert response.status_code == 501
+        assert "msgpack" in response.json()["detail"]
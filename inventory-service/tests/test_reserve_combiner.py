@@ -0,0 +1,113 @@
+"""Unit tests for flat combining of concurrent reservations."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app import idempotency, reserve_combiner
+from app.models.inventory import Inventory
+
+from tests.conftest import BOOK_ID_1
+
+
+def _session(inv: Inventory | None) -> AsyncMock:
+    session = AsyncMock()
+    locked = MagicMock()
+    locked.scalar_one_or_none.return_value = inv
+    session.execute.return_value = locked
+    return session
+
+
+@pytest.fixture(autouse=True)
+def combining(monkeypatch):
+    monkeypatch.setattr(reserve_combiner.settings, "reserve_combine_window_ms", 1.0)
+    monkeypatch.setattr(reserve_combiner.settings, "reserve_combine_max_batch", 64)
+    idempotency._cache.clear()
+    yield
+    reserve_combiner._books.clear()
+    idempotency._cache.clear()
+
+
+class TestReserveCombiner:
+    """Concurrent reservations of one book share a transaction, granted in arrival order."""
+
+    @pytest.mark.asyncio
+    async def test_grants_in_arrival_order_until_stock_runs_out(self):
+        inv = Inventory(book_id=BOOK_ID_1, quantity=20, reserved=8)
+        sessions = [_session(inv) for _ in range(4)]
+        outcomes = await asyncio.gather(*(
+            reserve_combiner.reserve(session, BOOK_ID_1, quantity)
+            for session, quantity in zip(sessions, (5, 10, 3, 5))
+        ))
+        assert [o.status for o in outcomes] == ["reserved", "insufficient", "reserved", "insufficient"]
+        assert outcomes[0].body["remaining_available"] == 7
+        assert outcomes[1].detail == "Insufficient stock: available=7 requested=10"
+        assert outcomes[2].body["remaining_available"] == 4
+        assert inv.reserved == 16
+        sessions[0].commit.assert_awaited_once()
+        for idle in sessions[1:]:
+            idle.execute.assert_not_awaited()
+            idle.commit.assert_not_awaited()
+        ledger_rows = sessions[0].execute.await_args_list[-1].args[1]
+        assert [row["reserved_after"] for row in ledger_rows] == [13, 16]
+        assert not reserve_combiner._books
+
+    @pytest.mark.asyncio
+    async def test_callers_arriving_mid_batch_combine_the_next_one(self):
+        inv = Inventory(book_id=BOOK_ID_1, quantity=100, reserved=0)
+        first, second, third = (_session(inv) for _ in range(3))
+        release = asyncio.Event()
+
+        async def slow_commit():
+            await release.wait()
+
+        first.commit.side_effect = slow_commit
+        leading = asyncio.create_task(reserve_combiner.reserve(first, BOOK_ID_1, 1))
+        await asyncio.sleep(0.01)  # first batch is now waiting on its commit
+        queued = [
+            asyncio.create_task(reserve_combiner.reserve(second, BOOK_ID_1, 2)),
+            asyncio.create_task(reserve_combiner.reserve(third, BOOK_ID_1, 3)),
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        outcomes = await asyncio.gather(leading, *queued)
+        assert [o.body["remaining_available"] for o in outcomes] == [99, 97, 94]
+        first.commit.assert_awaited_once()
+        second.commit.assert_awaited_once()  # the oldest waiter combined the next batch
+        third.commit.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_combiner_failure_fails_its_batch(self):
+        inv = Inventory(book_id=BOOK_ID_1, quantity=10, reserved=0)
+        leader, other = _session(inv), _session(inv)
+        leader.commit.side_effect = ConnectionError("connection lost")
+        results = await asyncio.gather(
+            reserve_combiner.reserve(leader, BOOK_ID_1, 1),
+            reserve_combiner.reserve(other, BOOK_ID_1, 1),
+            return_exceptions=True,
+        )
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert not reserve_combiner._books
+
+    @pytest.mark.asyncio
+    async def test_idempotency_keys_within_and_across_batches(self):
+        inv = Inventory(book_id=BOOK_ID_1, quantity=10, reserved=0)
+        session = _session(inv)
+        claimed = MagicMock()
+        claimed.all.return_value = ["line-1", "line-3"]  # line-2 was already used
+        stored = MagicMock()
+        stored.all.return_value = [MagicMock(key="line-2", book_id=BOOK_ID_1, quantity=9, response={"old": True})]
+        session.scalars.side_effect = [claimed, stored]
+        outcomes = await asyncio.gather(
+            reserve_combiner.reserve(session, BOOK_ID_1, 4, "line-1"),
+            reserve_combiner.reserve(AsyncMock(), BOOK_ID_1, 4, "line-1"),
+            reserve_combiner.reserve(AsyncMock(), BOOK_ID_1, 9, "line-2"),
+            reserve_combiner.reserve(AsyncMock(), BOOK_ID_1, 20, "line-3"),
+        )
+        assert [o.status for o in outcomes] == ["reserved", "replayed", "replayed", "insufficient"]
+        assert outcomes[1].body == outcomes[0].body
+        assert outcomes[2].body == {"old": True}
+        assert inv.reserved == 4
+        statements = [str(call.args[0]) for call in session.execute.await_args_list]
+        assert any(sql.startswith("DELETE FROM reserve_idempotency") for sql in statements)  # line-3 released
+        assert idempotency._cache["line-1"].response == outcomes[0].body
@@ -0,0 +1,52 @@
+"""Unit tests for GET /stock/changes (delta sync by row version)."""
+from unittest.mock import MagicMock
+
+import pytest
+
+from tests.conftest import BOOK_ID_1, BOOK_ID_2, make_inventory
+
+
+def _versioned(book_id, version):
+    inv = make_inventory(book_id)
+    inv.version = version
+    return inv
+
+
+@pytest.fixture(autouse=True)
+def high_water(mock_db):
+    mock_db.scalar.return_value = 900
+
+
+def _rows(mock_db, *rows):
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = list(rows)
+    mock_db.execute.return_value = result
+
+
+class TestStockChanges:
+    """Pages stop at the high-water mark and continue from (version, book_id)."""
+
+    def test_last_page_returns_high_water_mark(self, client, mock_db):
+        _rows(mock_db, _versioned(BOOK_ID_1, 700))
+        response = client.get("/stock/changes?since=650")
+        assert response.status_code == 200
+        body = response.json()
+        assert [c["version"] for c in body["changes"]] == [700]
+        assert (body["since"], body["after"], body["complete"]) == (900, None, True)
+        sql = str(mock_db.execute.await_args.args[0])
+        assert "inventory.version >=" in sql and "inventory.version <" in sql
+
+    def test_full_page_continues_after_last_row(self, client, mock_db):
+        _rows(mock_db, _versioned(BOOK_ID_1, 700), _versioned(BOOK_ID_2, 700))
+        body = client.get("/stock/changes?since=650&size=2").json()
+        assert body["since"] == 700
+        assert body["after"] == str(BOOK_ID_2)
+        assert body["complete"] is False
+
+        _rows(mock_db)
+        body = client.get(f"/stock/changes?since=700&after={BOOK_ID_2}&size=2").json()
+        assert body["complete"] is True
+        assert "(inventory.version, inventory.book_id) >" in str(mock_db.execute.await_args.args[0])
+
+    def test_size_is_bounded(self, client):
+        assert client.get("/stock/changes?size=1001").status_code == 422
@@ -0,0 +1,91 @@
+"""Unit tests for the lazy OpenTelemetry bootstrap."""
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import telemetry
+
+SERVICE_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _run(script: str, **env) -> subprocess.CompletedProcess:
+    """Run ``script`` in a fresh interpreter — tracer providers are process-global."""
+    return subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(script)],
+        cwd=SERVICE_ROOT,
+        env={**os.environ, "PYTHONPATH": str(SERVICE_ROOT), **env},
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+
+class TestLazyTracingMiddleware:
+    """Tests for the pass-through tracing shim."""
+
+    def test_passes_through_until_instrumented(self):
+        calls = []
+
+        def tracing(app, **options):
+            async def traced(scope, receive, send):
+                calls.append(options["tag"])
+                await app(scope, receive, send)
+            return traced
+
+        inner = FastAPI()
+        inner.get("/ping")(lambda: {"ok": True})
+        shim = telemetry.LazyTracingMiddleware(inner)
+
+        with TestClient(shim) as c:
+            assert c.get("/ping").json() == {"ok": True}
+            assert calls == []
+            shim.add_middleware(tracing, tag="otel")
+            assert c.get("/ping").json() == {"ok": True}
+        assert calls == ["otel"]
+
+
+class TestTelemetryBootstrap:
+    """Import-time and startup behaviour of app.main with telemetry on and off."""
+
+    @pytest.mark.parametrize("endpoint", ["", "http://127.0.0.1:9"], ids=["disabled", "enabled"])
+    def test_import_does_not_load_opentelemetry(self, endpoint):
+        result = _run(
+            """
+            import sys
+            import app.main
+            print(sorted(m for m in sys.modules if m.startswith("opentelemetry")))
+            """,
+            OTEL_EXPORTER_OTLP_ENDPOINT=endpoint,
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip().splitlines()[-1] == "[]"
+
+    def test_tracing_enabled_after_startup(self):
+        pytest.importorskip("opentelemetry.instrumentation.fastapi")
+        result = _run(
+            """
+            import sys
+            import time
+            from fastapi.testclient import TestClient
+            import app.main
+            from app import telemetry
+            with TestClient(app.main.app) as c:
+                assert c.get("/health").status_code == 200   # served before setup completes
+                deadline = time.monotonic() + 30
+                while telemetry._tracing_middleware._traced is None and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                assert c.get("/health").status_code == 200
+                # stderr: stdout is shared with the log listener thread
+                print("traced:", type(telemetry._tracing_middleware._traced).__name__, file=sys.stderr)
+            """,
+            OTEL_EXPORTER_OTLP_ENDPOINT="http://127.0.0.1:9",
+            OTEL_TRACES_SAMPLER="always_off",
+        )
+        assert result.returncode == 0, result.stderr
+        assert "traced: OpenTelemetryMiddleware" in result.stderr
@@ -0,0 +1,112 @@
+"""Unit tests for adaptive trace sampling and tail retention."""
+import pytest
+
+pytest.importorskip("opentelemetry.sdk")
+
+from opentelemetry.sdk.trace import TracerProvider  # noqa: E402
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter  # noqa: E402
+from opentelemetry.trace import Status, StatusCode, set_span_in_context  # noqa: E402
+from prometheus_client import REGISTRY  # noqa: E402
+
+from app import trace_sampling  # noqa: E402
+from app.trace_sampling import AdaptiveSampler, RetainingSpanProcessor  # noqa: E402
+
+
+def _count(metric, **labels) -> float:
+    return metric.labels(**labels)._value.get()
+
+
+@pytest.fixture
+def tracing():
+    """A tracer that samples nothing up front, exporting into memory."""
+    exporter = InMemorySpanExporter()
+    processor = RetainingSpanProcessor(exporter, max_pending_traces=2, schedule_delay_millis=10)
+    provider = TracerProvider(sampler=AdaptiveSampler(0.0, {"GET /stock/reserve-ish": 1.0}))
+    provider.add_span_processor(processor)
+    tracer = provider.get_tracer(__name__)
+
+    def exported() -> list[str]:
+        processor.force_flush()
+        return sorted(span.name for span in exporter.get_finished_spans())
+
+    yield tracer, exported
+    provider.shutdown()
+
+
+class TestAdaptiveSampler:
+    """Tests for head sampling."""
+
+    def test_rate_by_span_name(self):
+        sampler = AdaptiveSampler(0.0, {"GET /stock/bulk": 1.0})
+        assert sampler.should_sample(None, 1, "GET /stock/bulk").decision.is_sampled()
+        unsampled = sampler.should_sample(None, 1, "GET /stock/{book_id}")
+        assert not unsampled.decision.is_sampled() and unsampled.decision.is_recording()
+
+    def test_children_follow_parent(self, tracing):
+        tracer, exported = tracing
+        with tracer.start_as_current_span("GET /stock/reserve-ish"):
+            with tracer.start_as_current_span("http send") as child:
+                assert child.get_span_context().trace_flags.sampled
+        assert exported() == ["GET /stock/reserve-ish", "http send"]
+
+
+class TestRetainingSpanProcessor:
+    """Tests for keeping unsampled traces that failed or ran slow."""
+
+    def test_fast_successful_trace_discarded(self, tracing):
+        tracer, exported = tracing
+        before = _count(trace_sampling.trace_spans_total, decision="discarded")
+        with tracer.start_as_current_span("GET /stock/bulk") as span:
+            span.set_attribute("http.status_code", 200)
+            with tracer.start_as_current_span("http send"):
+                pass
+        assert exported() == []
+        assert _count(trace_sampling.trace_spans_total, decision="discarded") - before == 2
+
+    def test_error_in_child_keeps_whole_trace(self, tracing):
+        tracer, exported = tracing
+        with tracer.start_as_current_span("GET /stock/bulk"):
+            with tracer.start_as_current_span("db") as child:
+                child.set_status(Status(StatusCode.ERROR))
+        assert exported() == ["GET /stock/bulk", "db"]
+
+    def test_reserve_conflict_kept(self, tracing):
+        tracer, exported = tracing
+        with tracer.start_as_current_span("POST /stock/reserve") as span:
+            span.set_attribute("http.status_code", 409)
+        assert exported() == ["POST /stock/reserve"]
+
+    def test_slow_trace_kept(self, tracing, monkeypatch):
+        monkeypatch.setattr(trace_sampling.settings, "trace_keep_slower_than_ms", 0)
+        tracer, exported = tracing
+        before = _count(trace_sampling.trace_spans_total, decision="retained_slow")
+        with tracer.start_as_current_span("GET /stock/bulk"):
+            pass
+        assert exported() == ["GET /stock/bulk"]
+        assert _count(trace_sampling.trace_spans_total, decision="retained_slow") - before == 1
+
+    def test_pending_buffer_bounded(self, tracing):
+        tracer, _ = tracing
+        before = _count(trace_sampling.trace_spans_dropped_total, reason="pending_overflow")
+        roots = [tracer.start_span(f"root {i}") for i in range(3)]
+        for root in roots:
+            with tracer.start_as_current_span("child", context=set_span_in_context(root)):
+                pass
+        assert _count(trace_sampling.trace_spans_dropped_total, reason="pending_overflow") - before == 1
+        for root in roots:
+            root.end()
+
+    def test_queue_full_counted(self):
+        processor = RetainingSpanProcessor(
+            InMemorySpanExporter(), max_pending_traces=1, max_queue_size=2, max_export_batch_size=10,
+            schedule_delay_millis=60_000,
+        )
+        provider = TracerProvider(sampler=AdaptiveSampler(1.0, {}))
+        provider.add_span_processor(processor)
+        before = _count(trace_sampling.trace_spans_dropped_total, reason="queue_full")
+        for _ in range(5):
+            provider.get_tracer(__name__).start_span("x").end()
+        assert _count(trace_sampling.trace_spans_dropped_total, reason="queue_full") - before == 3
+        assert REGISTRY.get_sample_value("inventory_trace_export_queue_spans") == 2
+        provider.shutdown()
+
@@ -0,0 +1,95 @@
+"""Unit tests for the startup warm-up that gates readiness."""
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app import warmup
+
+
+def _session_factory(opened: list):
+    def factory():
+        session = AsyncMock()
+        session.__aenter__ = AsyncMock(return_value=session)
+        session.__aexit__ = AsyncMock(return_value=False)
+        opened.append(session)
+        return session
+    return factory
+
+
+class TestWarmup:
+    """Tests for ``warmup.run``."""
+
+    @pytest.mark.asyncio
+    async def test_primes_every_pool_connection(self, monkeypatch):
+        opened = []
+        monkeypatch.setattr(warmup, "AsyncSessionLocal", _session_factory(opened))
+        monkeypatch.setattr(warmup, "engine", MagicMock(**{"pool.size.return_value": 3}))
+        monkeypatch.setattr(warmup, "refresh_jwks", AsyncMock(return_value=True))
+        await warmup.run()
+        assert warmup.is_complete()
+        assert len(opened) == 3
+        for session in opened:
+            assert session.execute.await_count == 3
+            session.rollback.assert_awaited_once()
+            session.__aexit__.assert_awaited_once()
+        warmup.refresh_jwks.assert_awaited_once_with("warmup")
+
+    @pytest.mark.asyncio
+    async def test_failed_connection_waits_for_the_others(self, monkeypatch):
+        opened = []
+        monkeypatch.setattr(warmup, "AsyncSessionLocal", _session_factory(opened))
+        monkeypatch.setattr(warmup, "engine", MagicMock(**{"pool.size.return_value": 2}))
+        primed = []
+
+        async def prime(session):
+            if session is opened[0]:
+                raise ConnectionResetError()
+            await asyncio.sleep(0.01)
+            primed.append(session.__aexit__.await_count)
+
+        monkeypatch.setattr(warmup, "_prime_connection", prime)
+        with pytest.raises(RuntimeError, match="1 of 2 connections failed"):
+            await warmup._warm_database()
+        assert primed == [0]  # finished before its session was closed
+        assert all(session.__aexit__.await_count == 1 for session in opened)
+
+    @pytest.mark.asyncio
+    async def test_failed_step_does_not_block_readiness(self, monkeypatch):
+        monkeypatch.setattr(warmup, "_warm_database", AsyncMock(side_effect=ConnectionRefusedError()))
+        monkeypatch.setattr(warmup, "refresh_jwks", AsyncMock(return_value=False))
+        await warmup.run()
+        assert warmup.is_complete()
+        assert REGISTRY.get_sample_value(
+            "inventory_warmup_step_seconds", {"step": "database", "result": "failed"}
+        ) is not None
+
+    @pytest.mark.asyncio
+    async def test_timeout_marks_complete(self, monkeypatch):
+        async def hang():
+            await asyncio.sleep(60)
+
+        monkeypatch.setattr(warmup.settings, "warmup_timeout_seconds", 0.05)
+        monkeypatch.setattr(warmup, "_warm_database", hang)
+        monkeypatch.setattr(warmup, "refresh_jwks", AsyncMock(return_value=True))
+        await warmup.run()
+        assert warmup.is_complete()
+        assert warmup.warmup_complete._value.get() == 1
+
+    @pytest.mark.asyncio
+    async def test_preloads_hottest_rows_in_bulk_chunks(self, monkeypatch):
+        opened = []
+        factory = _session_factory(opened)
+
+        def session_with_ids():
+            session = factory()
+            session.scalars = AsyncMock(return_value=MagicMock(**{"all.return_value": list(range(120))}))
+            return session
+
+        monkeypatch.setattr(warmup.settings, "warmup_preload_stock_rows", 120)
+        monkeypatch.setattr(warmup, "AsyncSessionLocal", session_with_ids)
+        monkeypatch.setattr(warmup, "_warm_database", AsyncMock())
+        monkeypatch.setattr(warmup, "refresh_jwks", AsyncMock(return_value=True))
+        await warmup.run()
+        assert opened[0].execute.await_count == 3  # 50 + 50 + 20
@@ -0,0 +1,84 @@
+"""Unit tests for the API / worker role split."""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.config import settings
+from app.kafka.dlq_consumer import message_id
+
+SERVICE_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _task_names() -> set[str]:
+    return {task.get_name() for task in main._worker_tasks}
+
+
+class TestServiceRole:
+    """Which background tasks the API process starts."""
+
+    def test_all_role_runs_consumers(self, monkeypatch):
+        monkeypatch.setattr(settings, "service_role", "all")
+        with TestClient(main.app):
+            assert _task_names() == {"kafka-consumer", "dlq-consumer", "ledger-snapshot", "idempotency-pruner"}
+        assert main._worker_tasks == []
+
+    def test_api_role_runs_no_consumers(self, monkeypatch):
+        monkeypatch.setattr(settings, "service_role", "api")
+        with TestClient(main.app) as c:
+            assert c.get("/health").status_code == 200
+            assert main._worker_tasks == []
+
+
+class TestWorkerProcess:
+    """``python -m app.worker`` runs the consumers and stops cleanly on SIGTERM."""
+
+    def test_serves_metrics_and_stops_on_sigterm(self):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "app.worker"],
+            cwd=SERVICE_ROOT,
+            env={**os.environ, "PYTHONPATH": str(SERVICE_ROOT), "WORKER_METRICS_PORT": str(port),
+                 "OTEL_EXPORTER_OTLP_ENDPOINT": ""},
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        try:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    body = httpx.get(f"http://127.0.0.1:{port}/metrics").text
+                    break
+                except httpx.TransportError:
+                    assert proc.poll() is None and time.monotonic() < deadline
+                    time.sleep(0.1)
+            assert "inventory_consumer_processing_seconds" in body
+            proc.send_signal(signal.SIGTERM)
+            out, _ = proc.communicate(timeout=30)
+        finally:
+            proc.kill()
+        assert proc.returncode == 0, out
+        assert "Inventory worker stopped." in out
+
+
+class TestDlqMessageId:
+    """DLQ ids are stable positions in the topic."""
+
+    @pytest.mark.parametrize("partition, offset", [(0, 0), (0, 41), (2, 7)])
+    def test_round_trip(self, partition, offset):
+        msg_id = message_id(partition, offset)
+        assert (msg_id >> 48, msg_id & ((1 << 48) - 1)) == (partition, offset)
+        if partition == 0:
+            assert msg_id == offset
+